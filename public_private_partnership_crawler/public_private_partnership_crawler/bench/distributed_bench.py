@@ -0,0 +1,132 @@
+"""分布式模式的扩展效率：1个进程 vs N个进程共享Redis队列抓取同一批模拟数据
+
+每个工作进程单独运行 CrawlerProcess（并发数固定），各自使用独立的临时工作目录和SQLite。
+吞吐按 items / (最后一个item的时间 - 最早开始爬取的时间) 计算，不含进程启动导入和空闲等待关闭的时间；
+扩展效率 = N进程吞吐 / (N × 单进程吞吐)。未指定 --redis-url 时在独立进程中启动 fakeredis 的TCP服务。
+
+在包目录下执行:
+    python bench/distributed_bench.py --workers 4 --pages 5 --latency 0.05 --concurrency 4
+    python bench/distributed_bench.py --workers 4 --redis-url redis://127.0.0.1:6379/15
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PKG_DIR, os.path.dirname(PKG_DIR), os.path.join(PKG_DIR, 'bench')]
+
+from mock_tzxm import FLARESOLVERR_PATH, MockTzxm
+
+
+def worker(workdir, flaresolverr_url, spider_kwargs, redis_url, key_prefix, concurrency, results):
+    from crawl_bench import bench_settings, run_crawl
+
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    settings = bench_settings(
+        flaresolverr_url, workdir, concurrency,
+        DISTRIBUTED_ENABLED=True,
+        SCHEDULER='public_private_partnership_crawler.distributed.RedisScheduler',
+        DUPEFILTER_CLASS='public_private_partnership_crawler.distributed.RedisDupeFilter',
+        REDIS_URL=redis_url,
+        REDIS_KEY_PREFIX=key_prefix,
+        REDIS_HEARTBEAT_INTERVAL=1.0,
+        REDIS_LEASE_TTL=10,
+    )
+    started = time.time()
+    elapsed, stats = run_crawl(settings, spider_kwargs)
+    results.put({
+        'started': started,
+        'items': stats.get('item_scraped_count', 0),
+        'requests': stats.get('downloader/request_count', 0),
+        'last_item_time': stats.get('bench/last_item_time'),
+    })
+
+
+def run_round(workers, mock, redis_url, concurrency, root):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    key_prefix = f'ppp-bench-{workers}-{int(time.time())}:{{}}'
+    processes = [
+        context.Process(target=worker, args=(
+            os.path.join(root, f'{workers}-{i}'), f'{mock.root}{FLARESOLVERR_PATH}', mock.spider_kwargs(),
+            redis_url, key_prefix, concurrency, results))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    items = sum(report['items'] for report in reports)
+    start = min(report['started'] for report in reports)
+    finished = max(report['last_item_time'] or start for report in reports)
+    return {
+        'workers': workers,
+        'items': items,
+        'requests': sum(report['requests'] for report in reports),
+        'items_per_worker': [report['items'] for report in reports],
+        'makespan': finished - start,
+        'items_per_second': items / max(finished - start, 1e-9),
+    }
+
+
+def serve_fake_redis(port):
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    # 逐条写出pipeline的响应时，Nagle算法与客户端的延迟ACK叠加会使每个pipeline多等约40ms
+    server.RequestHandlerClass = type('Handler', (server.RequestHandlerClass,), {'disable_nagle_algorithm': True})
+    server.serve_forever()
+
+
+def start_fake_redis():
+    """在独立进程中运行 fakeredis 的TCP服务，避免与模拟接口争用GIL"""
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = multiprocessing.get_context('spawn').Process(target=serve_fake_redis, args=(port,), daemon=True)
+    process.start()
+    for _ in range(100):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f'redis://127.0.0.1:{port}/0'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--pages', type=int, default=5, help='列表页数，每页100个项目')
+    parser.add_argument('--latency', type=float, default=0.05, help='模拟接口每个响应的附加延迟（秒）')
+    parser.add_argument('--concurrency', type=int, default=4, help='每个进程的并发请求数')
+    parser.add_argument('--redis-url', default=None)
+    args = parser.parse_args()
+
+    mock = MockTzxm(pages=args.pages, latency=args.latency).start()
+    redis_url = args.redis_url or start_fake_redis()
+    root = tempfile.mkdtemp(prefix='ppp_dist_bench_')
+
+    print(f'CPU: {os.cpu_count()}，工作进程数超过CPU数时吞吐受CPU限制，无法线性扩展')
+    baseline = run_round(1, mock, redis_url, args.concurrency, root)
+    scaled = run_round(args.workers, mock, redis_url, args.concurrency, root)
+    mock.stop()
+
+    for result in (baseline, scaled):
+        print(f"{result['workers']} worker(s): {result['items']} items in {result['makespan']:.2f}s, "
+              f"{result['items_per_second']:.1f} items/s, per worker {result['items_per_worker']}")
+    efficiency = scaled['items_per_second'] / (args.workers * baseline['items_per_second'])
+    print(f"speedup x{scaled['items_per_second'] / baseline['items_per_second']:.2f}, "
+          f"scaling efficiency {efficiency:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""本地模拟的 tzxm.gov.cn 接口及FlareSolverr，用于离线基准测试
+
+实现 getPublicInfoList1、getPublicProjectDetailById/{id}、downloadById 和 FlareSolverr 的 /v1。
+项目数据由 tmp/franchise_spider/json/*.json 中的历史导出反推为接口格式，循环复制到所需数量，
+每个响应可附加固定延迟。设置 capacity 时模拟服务端限流：同时处理的接口请求超过该数量时，
+列表接口返回 ``code: SYS.429``，详情和下载接口返回HTTP 429。
+
+单独运行（在包目录下）:
+    python bench/mock_tzxm.py --port 8765 --pages 20 --latency 0.05
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LIST_PATH = '/aweb/api/v1/pi/getPublicInfoList1'
+DETAIL_PATH = '/aweb/api/v1/common/getPublicProjectDetailById/'
+DOWNLOAD_PATH = '/aweb/api/v1/file/downloadById'
+FLARESOLVERR_PATH = '/v1'
+ADCODE = re.compile(r'\d{6}')
+
+STAGE_CODES = {
+    '特许经营方案编制阶段': '01',
+    '特许经营方案论证阶段': '02',
+    '特许经营者选择阶段': '03',
+    '特许经营协议签订阶段': '04',
+    '特许经营项目建设或运营阶段': '05',
+    '特许经营项目移交阶段': '06',
+}
+
+
+def load_records():
+    """读取历史导出中的项目记录；爬虫运行时写出的 .jsonl 混有附件行，不作为测试数据"""
+    records = []
+    for path in sorted(glob.glob(os.path.join(PKG_DIR, 'tmp', 'franchise_spider', 'json', '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            records.extend(record for record in json.load(f) if record.get('project_id') and record.get('project_name'))
+    if not records:
+        raise RuntimeError('tmp/franchise_spider/json/ 中没有可用的测试数据')
+    return records
+
+
+def _file_id(project_id, kind):
+    return hashlib.md5(f'{project_id}:{kind}'.encode()).hexdigest()
+
+
+def build_fixtures(records, total):
+    """把导出的item反推为列表接口行和详情接口数据，生成total个项目（按operateTime倒序）"""
+    projects = []
+    base_time = datetime(2025, 6, 13, 12, 0, 0)
+    for i in range(total):
+        record = records[i % len(records)]
+        project_id = hashlib.md5(f"{record['project_id']}:{i}".encode()).hexdigest()
+        location = record.get('construction_location') or ''
+        list_row = {
+            'id': project_id,
+            'projectCode': record.get('project_code') or '',
+            'projectName': record.get('project_name') or '',
+            'projectLevel': record.get('project_level') or '',
+            'theIndustry': record.get('industry_code') or '',
+            'theIndustryName': record.get('industry_name') or '',
+            'projectType': record.get('project_type') or '',
+            'projectTypeName': record.get('project_type_name') or '',
+            'execMode': record.get('exec_mode') or '',
+            'execModeName': record.get('exec_mode_name') or '',
+            'planTotalMoney': record.get('total_investment') or 0,
+            'projectAddressList': [code for code in location.split(',') if ADCODE.fullmatch(code)],
+            'scaleContent': record.get('scale_content') or '',
+            'stageType': STAGE_CODES.get(record.get('project_stage'), record.get('project_stage') or '01'),
+            'apprOrgno': record.get('area_code') or '',
+            'projectAddressName': record.get('area_name') or '',
+            'isEnable': '1',
+            'createTime': record.get('create_time') or '',
+            'operateTime': (base_time - timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S'),
+            'govAuthEbFile': _file_id(project_id, 'gov_auth'),
+            'franPlanFile': _file_id(project_id, 'franchise_plan'),
+        }
+        winners = [name for name in (record.get('winner_names') or '').split(',') if name]
+        detail = {
+            'PaEbPppProjectVo': {'expPriCap': record.get('total_investment') or 0, 'expectedProjectCapital': 0},
+            'PaEbArgumentInfoVo': {
+                'franDeadline': record.get('franchise_period') or 0,
+                'isGovInvSupport': str(record.get('has_gov_subsidy') or '0'),
+                'invSupportType': 'A00001',
+                'preGovInvRatio': record.get('gov_invest_ratio') or 0,
+                'govInvReferee': record.get('gov_representative') or '',
+                'govInvRefereeBonus': record.get('gov_share_ratio') or 0,
+                'isOperSubsidy': str(record.get('has_operation_subsidy') or '0'),
+                'operSubsidySource': record.get('subsidy_source') or '',
+                'privateEntPlan': '民营企业持股比例不低于30%',
+            },
+            'InvbidsVo': [{'bidType': 'A00001', 'pubBidDate': record.get('bidding_time') or ''}]
+            if record.get('bidding_method') else [],
+            'WinbidsVo': [{'winbidEntname': name, 'enttype': 'A00001'} for name in winners],
+            'PaDfPlanapprInfoVo': {'apprOrgName': record.get('area_name') or '', 'apprDate': '2024-01-01',
+                                   'apprFile': _file_id(project_id, 'approval')},
+        }
+        projects.append((list_row, detail))
+    return projects
+
+
+class MockTzxm:
+    """模拟服务，在后台线程中运行"""
+
+    def __init__(self, pages=10, page_size=100, latency=0.0, file_size=64 * 1024, host='127.0.0.1', port=0,
+                 capacity=None):
+        self.page_size = page_size
+        self.latency = latency
+        self.capacity = capacity
+        self.inflight = 0
+        self.file_body = os.urandom(file_size)
+        self.projects = build_fixtures(load_records(), pages * page_size)
+        self.details = {row['id']: detail for row, detail in self.projects}
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def root(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def spider_kwargs(self):
+        """覆盖爬虫接口地址的 -a 参数"""
+        return {
+            'base_url': f'{self.root}/aweb-ui/',
+            'list_api': f'{self.root}{LIST_PATH}',
+            'detail_api': f'{self.root}{DETAIL_PATH}{{}}',
+            'download_api': f'{self.root}{DOWNLOAD_PATH}',
+            'allowed_domains': [urlparse(self.root).hostname],
+        }
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='MockTzxm', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def enter(self):
+        """开始处理一个接口请求，超过容量时返回False（请求应被限流）"""
+        with self.lock:
+            self.inflight += 1
+            if self.capacity is not None and self.inflight > self.capacity:
+                self.requests['throttled'] = self.requests.get('throttled', 0) + 1
+                return False
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.inflight -= 1
+
+    def list_page(self, body):
+        page_num = int(body.get('pageNum', 1))
+        page_size = int(body.get('pageSize', self.page_size))
+        start = (page_num - 1) * page_size
+        rows = [row for row, _ in self.projects[start:start + page_size]]
+        pages = (len(self.projects) + page_size - 1) // page_size
+        return {'code': 'SYS.200', 'data': {'list': rows, 'pageNum': page_num, 'pageSize': page_size,
+                                            'pages': pages, 'total': len(self.projects)}}
+
+    def flaresolverr(self, body):
+        cmd = body.get('cmd')
+        if cmd in ('sessions.create', 'sessions.destroy'):
+            return {'status': 'ok', 'session': body.get('session', 'mock')}
+        expires = time.time() + 3600
+        return {'status': 'ok', 'solution': {
+            'url': body.get('url'), 'status': 200, 'response': '<html></html>',
+            'userAgent': 'Mozilla/5.0 (MockTzxm)',
+            'cookies': [{'name': 'cf_clearance', 'value': 'mock', 'expires': expires}],
+        }}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type='application/json;charset=UTF-8', headers=None):
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b'{}')
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._body()
+                if path == FLARESOLVERR_PATH:
+                    mock.count('flaresolverr')
+                    return self._send(200, mock.flaresolverr(body))
+                try:
+                    allowed = mock.enter()
+                    if mock.latency:
+                        time.sleep(mock.latency)
+                    if path == LIST_PATH:
+                        mock.count('list')
+                        if not allowed:
+                            return self._send(200, {'code': 'SYS.429', 'msg': '访问过于频繁'})
+                        return self._send(200, mock.list_page(body))
+                    self._send(404, {'code': 'SYS.404'})
+                finally:
+                    mock.leave()
+
+            def do_GET(self):
+                try:
+                    allowed = mock.enter()
+                    if mock.latency:
+                        time.sleep(mock.latency)
+                    self._get(urlparse(self.path), allowed)
+                finally:
+                    mock.leave()
+
+            def _get(self, url, allowed):
+                if not allowed and (url.path.startswith(DETAIL_PATH) or url.path == DOWNLOAD_PATH):
+                    return self._send(429, {'code': 'SYS.429'})
+                if url.path.startswith(DETAIL_PATH):
+                    mock.count('detail')
+                    detail = mock.details.get(url.path[len(DETAIL_PATH):])
+                    if detail is None:
+                        return self._send(200, {'code': 'SYS.404', 'data': None})
+                    return self._send(200, {'code': 'SYS.200', 'data': detail})
+                if url.path == DOWNLOAD_PATH:
+                    mock.count('download')
+                    file_id = parse_qs(url.query).get('id', [''])[0]
+                    body = mock.file_body
+                    status, headers = 200, {'Content-Disposition': f'attachment; filename="{file_id}.pdf"'}
+                    match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+                    if match:
+                        offset = int(match.group(1))
+                        if offset >= len(body):
+                            return self._send(416, b'', 'application/pdf')
+                        headers['Content-Range'] = f'bytes {offset}-{len(body) - 1}/{len(body)}'
+                        status, body = 206, body[offset:]
+                    return self._send(status, body, 'application/pdf', headers)
+                mock.count('other')
+                self._send(200, b'<html></html>', 'text/html')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个接口响应的附加延迟（秒）')
+    parser.add_argument('--capacity', type=int, default=None, help='同时处理的接口请求上限，超过时限流')
+    args = parser.parse_args()
+
+    mock = MockTzxm(pages=args.pages, latency=args.latency, host=args.host, port=args.port, capacity=args.capacity)
+    print(f'Mock tzxm on {mock.root}, {len(mock.projects)} projects')
+    print(json.dumps(mock.spider_kwargs(), ensure_ascii=False, indent=2))
+    print(f'FLARESOLVERR_URL={mock.root}{FLARESOLVERR_PATH}')
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == '__main__':
+    main()
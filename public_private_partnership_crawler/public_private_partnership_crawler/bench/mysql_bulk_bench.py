@@ -0,0 +1,101 @@
+"""MySQLPipeline 逐条写入与批量upsert的吞吐对比
+
+在包目录下执行（需要可用的MySQL，连接参数同 settings.DATABASE；--url 可指定其他数据库，如 sqlite:///）:
+    python bench/mysql_bulk_bench.py --rows 5000 --batch 500
+
+测试数据由 tmp/franchise_spider/json/ 中的历史导出复制生成，与爬虫一样先经过 DataValidationPipeline，
+project_id 带 bench 前缀，结束后删除。
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PKG_DIR, os.path.dirname(PKG_DIR)]
+
+from public_private_partnership_crawler import settings
+from public_private_partnership_crawler.items import FranchiseProjectItem
+from public_private_partnership_crawler.pipelines import DataValidationPipeline, MySQLPipeline
+from model import FranchiseProject
+
+
+class BenchSpider:
+    name = 'bench'
+    logger = logging.getLogger('bench')
+
+
+def load_fixture():
+    records = []
+    for path in sorted(glob.glob(os.path.join(PKG_DIR, 'tmp', 'franchise_spider', 'json', '*.json'))):
+        with open(path, encoding='utf-8') as f:
+            records.extend(json.load(f))
+    return records
+
+
+def make_items(records, rows, prefix, spider):
+    """生成 rows 个项目item，经过数据验证管道转换为入库时的类型"""
+    fields = FranchiseProjectItem.fields
+    validation = DataValidationPipeline()
+    items = []
+    for i in range(rows):
+        record = records[i % len(records)]
+        item = FranchiseProjectItem({k: v for k, v in record.items() if k in fields and v is not None})
+        item['project_id'] = f'{prefix}{i:08d}'
+        for key in ('has_gov_subsidy', 'has_operation_subsidy'):
+            item[key] = item.get(key) == '1'
+        for key in ('crawl_time', 'create_time', 'update_time', 'bidding_time'):
+            item.pop(key, None)
+        items.append(validation.process_item(item, spider))
+    return items
+
+
+def run(pipeline, items, spider):
+    pipeline.open_spider(spider)
+    start = time.perf_counter()
+    for item in items:
+        pipeline.process_item(item, spider)
+    if pipeline.bulk_enabled:
+        pipeline._flush(spider)
+    elapsed = time.perf_counter() - start
+    return elapsed
+
+
+def cleanup(pipeline, prefix):
+    with pipeline.engine.begin() as conn:
+        conn.execute(FranchiseProject.__table__.delete().where(FranchiseProject.project_id.like(f'{prefix}%')))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--url', default=None, help='数据库URL，默认使用 settings.DATABASE')
+    args = parser.parse_args()
+
+    # 验证管道对每条不可转换的字段都会告警，只保留错误日志
+    logging.basicConfig(level=logging.ERROR)
+    spider = BenchSpider()
+    records = load_fixture()
+    if not records:
+        sys.exit('tmp/franchise_spider/json/ 中没有可用的测试数据')
+
+    prefix = 'bench'
+    for label, bulk in (('per-item', False), ('bulk', True)):
+        db_settings = {'url': args.url} if args.url else settings.DATABASE
+        pipeline = MySQLPipeline(db_settings, bulk_enabled=bulk, bulk_size=args.batch, bulk_interval=0)
+        try:
+            # 两轮：第一轮全部INSERT，第二轮全部UPDATE
+            inserted = run(pipeline, make_items(records, args.rows, prefix, spider), spider)
+            updated = run(pipeline, make_items(records, args.rows, prefix, spider), spider)
+        finally:
+            cleanup(pipeline, prefix)
+            pipeline.engine.dispose()
+        print(f'{label:>8}: insert {args.rows / inserted:10.1f} rows/s | update {args.rows / updated:10.1f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""详情解析耗时：改造前逐字段手写的 build_items vs 编译后的 FieldMapper
+
+解析数据由 bench/mock_tzxm.py 从 tmp/franchise_spider/json/ 反推生成，计时包含JSON解码。
+
+在包目录下执行:
+    python bench/parse_bench.py --items 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PKG_DIR, os.path.dirname(PKG_DIR), os.path.join(PKG_DIR, 'bench')]
+
+from mock_tzxm import build_fixtures, load_records
+from public_private_partnership_crawler.field_mapping import loads, orjson
+from public_private_partnership_crawler.items import FranchiseProjectItem
+from public_private_partnership_crawler.spiders.ppp_spider import FranchiseSpider
+
+
+class LegacySpider(FranchiseSpider):
+    """改造前的 build_items、get_code_name（每次调用重建代码表）与 strptime 日期解析
+
+    地区字段两边都用当前的 parse_area_info（行政区划索引），只比较字段提取本身。
+    """
+
+    def legacy_build_item(self, detail_data, list_data):
+        # 创建Item对象
+        item = FranchiseProjectItem()
+
+        # 基本信息（来自列表页）
+        item['project_id'] = list_data.get('id', '')
+        item['project_code'] = list_data.get('projectCode', '')
+        item['project_name'] = list_data.get('projectName', '')
+
+        # 地区信息解析 - 支持多级地区
+        area_info = self.parse_area_info(list_data)
+        item.update(area_info)
+
+        # 项目分类信息
+        item['project_level'] = list_data.get('projectLevel', '')
+        item['project_level_name'] = self.legacy_get_code_name('PROJECT_LEVEL', list_data.get('projectLevel', ''))
+        item['industry_code'] = list_data.get('theIndustry', '')
+        item['industry_name'] = list_data.get('theIndustryName', '')
+        item['project_type'] = list_data.get('projectType', '')
+        item['project_type_name'] = list_data.get('projectTypeName', '')
+
+        # 实施模式
+        item['exec_mode'] = list_data.get('execMode', '')
+        item['exec_mode_name'] = list_data.get('execModeName', '')
+
+        # 投资信息 - 转换为数值类型
+        item['total_investment'] = self.safe_decimal(list_data.get('planTotalMoney', 0))
+        item['scale_content'] = list_data.get('scaleContent', '')
+
+        # 处理详情页数据
+        ppp_project_vo = detail_data.get('PaEbPppProjectVo', {})
+        if ppp_project_vo:
+            item['expected_private_capital'] = self.safe_decimal(ppp_project_vo.get('expPriCap', 0))
+            item['expected_project_capital'] = self.safe_decimal(
+                ppp_project_vo.get('expectedProjectCapital', 0))
+
+        # 特许经营参数信息
+        argument_info = detail_data.get('PaEbArgumentInfoVo', {})
+        if argument_info:
+            item['franchise_period'] = self.safe_int(argument_info.get('franDeadline', 0))
+            item['pre_start_date'] = self.legacy_parse_date(argument_info.get('preStartDate', ''))
+            item['pre_end_date'] = self.legacy_parse_date(argument_info.get('preComplDate', ''))
+
+            # 政府补贴信息 - 转换为布尔值和数值
+            item['has_gov_subsidy'] = argument_info.get('isGovInvSupport', '0') == '1'
+            item['gov_invest_type'] = self.legacy_get_code_name('GOV_INV_TYPE',
+                                                         argument_info.get('invSupportType', ''))
+            item['gov_invest_ratio'] = self.safe_decimal(argument_info.get('preGovInvRatio', 0))
+            item['gov_representative'] = argument_info.get('govInvReferee', '')
+            item['gov_share_ratio'] = self.safe_decimal(argument_info.get('govInvRefereeBonus', 0))
+            item['gov_invest_capital'] = self.safe_decimal(argument_info.get('preGovInvCap', 0))
+
+            # 运营补贴信息
+            item['has_operation_subsidy'] = argument_info.get('isOperSubsidy', '0') == '1'
+            item['subsidy_source'] = argument_info.get('operSubsidySource', '')
+            item['subsidy_limit'] = self.safe_decimal(argument_info.get('operSubsidyLimit', 0))
+            item['subsidy_mode'] = argument_info.get('operSubsidyMode', '')
+
+            # 民营企业参与
+            item['private_enterprise_plan'] = argument_info.get('privateEntPlan', '')
+            item['private_share_ratio'] = self.extract_private_ratio(argument_info.get('privateEntPlan', ''))
+
+        # 招投标信息
+        invbids = detail_data.get('InvbidsVo', [])
+        if invbids:
+            first_bid = invbids[0]
+            item['bidding_method'] = self.legacy_get_code_name('BID_TYPE', first_bid.get('bidType', ''))
+            item['bidding_time'] = self.legacy_parse_date(first_bid.get('pubBidDate', ''))
+
+        # 中标信息
+        winbids = detail_data.get('WinbidsVo', [])
+        if winbids:
+            winner_names = []
+            winner_types = []
+            for win in winbids:
+                winner_names.append(win.get('winbidEntname', ''))
+                winner_types.append(self.legacy_get_code_name('ENTTYPE', win.get('enttype', '')))
+            item['winner_nature'] = ','.join(winner_types)
+            item['winner_names'] = ','.join(winner_names)
+
+        # 项目阶段
+        item['project_stage'] = list_data.get('stageType', '')
+        item['project_stage_name'] = self.get_stage_name(list_data.get('stageType', ''))
+
+        # 审批信息
+        plan_appr_info = detail_data.get('PaDfPlanapprInfoVo', {})
+        if plan_appr_info:
+            item['approval_org_name'] = plan_appr_info.get('apprOrgName', '')
+            item['approval_date'] = self.legacy_parse_date(plan_appr_info.get('apprDate', ''))
+
+        # 实施机构信息
+        item['implement_org_name'] = list_data.get('enforBodyName', '')
+        item['implement_contact'] = list_data.get('enforBodyLinp', '')
+        item['implement_phone'] = list_data.get('enBodyTel', '')
+
+        # 咨询机构信息
+        item['consult_org_name'] = list_data.get('consOrgName', '')
+        item['consult_contact'] = list_data.get('consOrgPri', '')
+        item['consult_phone'] = list_data.get('consOrgPriTel', '')
+
+        # 法律机构信息
+        item['law_firm_name'] = list_data.get('lawFirmName', '')
+        item['law_firm_contact'] = list_data.get('lawFirmPri', '')
+        item['law_firm_phone'] = list_data.get('lawFirmPriTel', '')
+
+        # 授权政府
+        item['mandate_gov'] = list_data.get('mandateGov', '')
+
+        # 状态信息
+        item['is_published'] = list_data.get('isEnable', '1') == '1'
+        item['verification_code'] = list_data.get('verificationCode', '')
+
+        # 时间戳
+        item['create_time'] = self.legacy_parse_datetime(list_data.get('createTime', ''))
+        item['update_time'] = self.legacy_parse_datetime(list_data.get('operateTime', ''))
+        item['crawl_time'] = datetime.now()
+        return item
+
+    def legacy_parse_date(self, date_str):
+        """解析日期字符串"""
+        if not date_str:
+            return None
+        try:
+            # 尝试多种日期格式
+            for fmt in ['%Y-%m-%d', '%Y-%m', '%Y-%m-%d %H:%M:%S']:
+                try:
+                    return datetime.strptime(date_str, fmt).date()
+                except ValueError:
+                    continue
+            return None
+        except Exception:
+            return None
+
+    def legacy_parse_datetime(self, datetime_str):
+        """解析日期时间字符串"""
+        if not datetime_str:
+            return None
+        try:
+            return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
+        except Exception:
+            return None
+
+    def legacy_get_code_name(self, code_type, code_value):
+        """根据code_type和code_value获取对应的名称"""
+        if not code_value:
+            return ''
+
+        code_mapping = {
+            "PROJECT_LEVEL": {
+                "A00001": "国家级",
+                "A00002": "省级",
+                "A00003": "市级",
+                "A00004": "县级",
+                "A00099": "其他"
+            },
+            "GOV_INV_TYPE": {
+                "A00001": "无",
+                "A00002": "直接投资",
+                "A00003": "资本金注入",
+                "A00004": "投资补助",
+                "A00005": "贷款贴息"
+            },
+            "PROJECT_TYPE": {
+                "A00001": "新建项目",
+                "A00002": "改扩建项目",
+                "A00003": "不涉及新建、改扩建的存量项目"
+            },
+            "ENTTYPE": {
+                "A00001": "民营企业",
+                "A00002": "外商投资企业",
+                "A00003": "中央企业",
+                "A00004": "项目所在地省级国有企业",
+                "A00005": "项目所在地市级国有企业",
+                "A00006": "项目所在地县级国有企业",
+                "A00007": "非项目所在地其他国有企业",
+                "A00099": "其他"
+            },
+            "EXEC_MODE": {
+                "A00001": "BOT",
+                "A00002": "TOT",
+                "A00003": "ROT",
+                "A00004": "BOOT",
+                "A00005": "DBFOT",
+                "A00006": "BOO",
+                "A00099": "其他"
+            },
+            "BID_TYPE": {
+                "A00001": "公开招标",
+                "A00099": "其他公开竞争方式"
+            }
+        }
+
+        mapping = code_mapping.get(code_type, {})
+        return mapping.get(code_value, code_value)
+
+
+
+def make_payloads(count):
+    payloads = []
+    for list_row, detail in build_fixtures(load_records(), count):
+        body = json.dumps({'code': 'SYS.200', 'data': detail}, ensure_ascii=False).encode('utf-8')
+        payloads.append((list_row, body))
+    return payloads
+
+
+def run(payloads, decode, build):
+    start = time.perf_counter()
+    for list_row, body in payloads:
+        build(decode(body)['data'], list_row)
+    return (time.perf_counter() - start) / len(payloads) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.items)
+    spider = LegacySpider()
+    mapped = lambda detail, row: next(spider.build_items(detail, row))
+
+    # 两种实现的结果必须一致
+    for list_row, body in payloads[:100]:
+        detail = json.loads(body)['data']
+        legacy, current = dict(spider.legacy_build_item(detail, list_row)), dict(mapped(detail, list_row))
+        legacy.pop('crawl_time'), current.pop('crawl_time')
+        assert legacy == current, (legacy, current)
+
+    results = [
+        ('legacy json + hand-written', run(payloads, lambda body: json.loads(body.decode('utf-8')), spider.legacy_build_item)),
+        ('json + field mapper', run(payloads, json.loads, mapped)),
+    ]
+    skip = lambda detail, row: None
+    results.append(('json decode only', run(payloads, json.loads, skip)))
+    if orjson is not None:
+        results.append(('orjson + field mapper', run(payloads, loads, mapped)))
+        results.append(('orjson decode only', run(payloads, loads, skip)))
+    else:
+        print('orjson 未安装，跳过')
+    for name, micros in results:
+        print(f'{name:28s}: {micros:8.1f} us/detail')
+
+
+if __name__ == '__main__':
+    main()
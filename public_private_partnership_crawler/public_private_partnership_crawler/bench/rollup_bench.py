@@ -0,0 +1,114 @@
+"""汇总表（franchise_project_rollups）的查询延迟和维护开销
+
+- 查询：导入 --rows 个项目后，对比项目表上的全表 GROUP BY 与汇总表上的 summarize，取中位数延迟
+- 维护：DatabasePipeline 批量写入 --items 个项目（先插入、再全部换阶段更新），对比开启和关闭汇总表的吞吐
+
+在包目录下执行:
+    python bench/rollup_bench.py --rows 200000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PKG_DIR, os.path.dirname(PKG_DIR), os.path.join(PKG_DIR, 'bench')]
+
+from sqlalchemy import func, select
+
+from index_bench import load, make_rows
+from mock_tzxm import load_records
+from model import Base, FranchiseProject, create_schema
+from public_private_partnership_crawler.pipelines import DatabasePipeline
+from public_private_partnership_crawler.rollup import rebuild, summarize
+from public_private_partnership_crawler.storage import SQLiteBackend
+from storage_bench import BenchSpider, make_items
+
+# (名称, 分组维度, 条件)
+DASHBOARD_QUERIES = (
+    ('by province', ('province_code',), {}),
+    ('by industry, stage 03', ('industry_code',), {'project_stage': '03'}),
+    ('by province+stage', ('province_code', 'project_stage'), {}),
+    ('by exec_mode+stage', ('exec_mode', 'project_stage'), {}),
+)
+
+
+def group_by(conn, by, filters):
+    """不使用汇总表的等价查询"""
+    p = FranchiseProject
+    query = select(*[getattr(p, name) for name in by], func.count(), func.sum(p.total_investment),
+                   func.sum(p.expected_private_capital))
+    query = query.where(*[getattr(p, name) == value for name, value in filters.items()])
+    return conn.execute(query.group_by(*[getattr(p, name) for name in by])).fetchall()
+
+
+def median_ms(func_, repeat):
+    func_()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func_()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def bench_queries(url, rows, repeat):
+    backend = SQLiteBackend(url)
+    engine = backend.create_engine()
+    Base.metadata.drop_all(engine)
+    create_schema(engine, 'curated')
+    load(engine, rows)
+    with engine.begin() as conn:
+        groups = rebuild(conn)
+    print(f'{len(rows)} projects, {groups} rollup groups')
+    print(f"{'query (median ms)':<26}{'GROUP BY':>12}{'rollup':>12}")
+    with engine.connect() as conn:
+        for name, by, filters in DASHBOARD_QUERIES:
+            full = median_ms(lambda: group_by(conn, by, filters), repeat)
+            rolled = median_ms(lambda: summarize(conn, by, **filters), repeat)
+            print(f'{name:<26}{full:12.3f}{rolled:12.3f}')
+    engine.dispose()
+
+
+def bench_maintenance(workdir, records, count):
+    spider = BenchSpider()
+    inserted = make_items(records, count)
+    moved = make_items(records, count, ' (2)')
+    for i, item in enumerate(moved):
+        item['project_stage'] = ('01', '02', '03', '04')[i % 4]
+    print(f"\n{'pipeline bulk (rows/s)':<26}{'insert':>12}{'update':>12}")
+    for label, enabled in (('rollups off', False), ('rollups on', True)):
+        url = f"sqlite:///{os.path.join(workdir, f'maintenance-{enabled}.sqlite3')}"
+        pipeline = DatabasePipeline({'url': url}, bulk_enabled=True, bulk_interval=0, rollups=enabled,
+                                    backend=SQLiteBackend(url))
+        pipeline.open_spider(spider)
+        results = []
+        for items in (inserted, moved):
+            start = time.perf_counter()
+            for item in items:
+                pipeline.process_item(item, spider)
+            pipeline._flush(spider)
+            results.append(count / (time.perf_counter() - start))
+        pipeline.engine.dispose()
+        print(f'{label:<26}' + ''.join(f'{value:12.1f}' for value in results))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=5000, help='维护开销测试的项目数')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    records = load_records()
+    workdir = tempfile.mkdtemp(prefix='ppp_rollup_bench_')
+    bench_queries(f"sqlite:///{os.path.join(workdir, 'queries.sqlite3')}", make_rows(records, args.rows), args.repeat)
+    bench_maintenance(workdir, records, args.items)
+
+
+if __name__ == '__main__':
+    main()
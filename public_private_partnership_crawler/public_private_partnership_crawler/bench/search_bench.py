@@ -0,0 +1,79 @@
+"""全文索引（search.py）的建立吞吐和查询延迟
+
+由 crawl_bench 使用的历史导出生成 --rows 个项目建立索引，再对常用词、少见词、多词和带筛选条件的
+查询取中位数和P95延迟。历史导出只有几百个不同的项目，复制后常用词的命中数远高于真实数据，是偏保守的测试。
+
+在包目录下执行:
+    python bench/search_bench.py --rows 300000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PKG_DIR, os.path.dirname(PKG_DIR), os.path.join(PKG_DIR, 'bench')]
+
+from index_bench import make_rows
+from mock_tzxm import load_records
+from public_private_partnership_crawler.search import SearchIndex, document, match_expression
+
+BATCH_SIZE = 1000
+
+
+def queries(rows):
+    """(查询, 筛选条件)，地区取自数据中实际出现的值"""
+    sample = random.Random(0).choice(rows)
+    name = sample['project_name']
+    return [
+        ('污水处理', {}),
+        ('污水处理', {'region': sample['province_code']}),
+        ('停车场', {}),
+        ('高速公路 改扩建', {}),
+        ('项目', {}),
+        ('项目', {'region': sample['county_code'] or sample['city_code'] or sample['province_code'],
+                'project_stage': sample['project_stage']}),
+        ('水', {}),
+        (name[:6], {}),
+        (name[:6], {'industry_code': sample.get('industry_code')}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=20, help='每个查询的重复次数')
+    parser.add_argument('--path', default=None, help='索引文件，默认使用临时目录')
+    args = parser.parse_args()
+
+    rows = make_rows(load_records(), args.rows)
+    path = args.path or os.path.join(tempfile.mkdtemp(prefix='ppp_search_bench_'), 'search.sqlite3')
+    with SearchIndex(path).open() as index:
+        start = time.perf_counter()
+        for i in range(0, len(rows), BATCH_SIZE):
+            index.add(document(row) for row in rows[i:i + BATCH_SIZE])
+        elapsed = time.perf_counter() - start
+        print(f'indexed {len(index)} projects in {elapsed:.1f}s ({len(rows) / elapsed:.0f} docs/s), '
+              f'{os.path.getsize(path) / 1024 / 1024:.0f} MB')
+
+        print(f"{'query':<40}{'matches':>10}{'median ms':>12}{'p95 ms':>10}")
+        for query, filters in queries(rows):
+            matches = index.conn.execute('SELECT count(*) FROM project_text WHERE project_text MATCH ?',
+                                         (match_expression(query),)).fetchone()[0]
+            index.search(query, **filters)
+            samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                index.search(query, **filters)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            label = query + (' ' + ','.join(f'{k}={v}' for k, v in filters.items()) if filters else '')
+            print(f'{label:<40}{matches:>10}{statistics.median(samples):12.2f}'
+                  f'{samples[int(len(samples) * 0.95) - 1]:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
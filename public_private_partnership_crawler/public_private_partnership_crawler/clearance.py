@@ -0,0 +1,86 @@
+"""FlareSolverr清除cookie的磁盘缓存
+
+cookies、对应的User-Agent及过期时间保存在本地JSON文件中，后续运行和并行的爬虫进程在过期前直接复用。
+刷新通过锁文件协调：同一时间只有一个进程调用FlareSolverr，其他进程等待后读取新写入的缓存。
+"""
+import json
+import os
+import time
+
+
+class ClearanceCache:
+    """跨运行、跨进程共享的清除cookie缓存"""
+
+    def __init__(self, path, default_ttl=1800, lock_timeout=120):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.default_ttl = default_ttl
+        self.lock_timeout = lock_timeout
+        self.locked = False
+
+    def load(self):
+        """读取未过期的缓存，不存在或已过期时返回None"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not entry.get('cookies') or entry.get('expires', 0) <= time.time():
+            return None
+        return entry
+
+    def save(self, cookies, user_agent=None, expires=None):
+        """写入缓存；未给出过期时间时使用默认有效期"""
+        entry = {
+            'cookies': cookies,
+            'user_agent': user_agent,
+            'expires': expires or time.time() + self.default_ttl,
+            'saved_at': time.time(),
+        }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        return entry
+
+    def invalidate(self, cookies):
+        """使缓存失效；只有缓存中仍是这组cookies时才删除，避免覆盖其他进程刚刷新的结果"""
+        entry = self.load()
+        if entry and entry['cookies'] == cookies:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def try_lock(self):
+        """尝试获取刷新锁，成功返回True；持锁超过lock_timeout视为持有者已退出"""
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) > self.lock_timeout:
+                    os.remove(self.lock_path)
+            except OSError:
+                pass
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        self.locked = True
+        return True
+
+    def unlock(self):
+        if not self.locked:
+            return
+        self.locked = False
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+
+def cookies_expiry(cookies):
+    """FlareSolverr返回的cookie列表中最早的过期时间（秒级时间戳），全为会话cookie时返回None"""
+    expiries = [cookie['expires'] for cookie in cookies if cookie.get('expires', -1) > 0]
+    return min(expiries) if expiries else None
@@ -0,0 +1,104 @@
+"""按接口自适应并发（AIMD）
+
+每个接口（list_api、detail_api、download_api）各有一个 AIMDController：
+- 加性增：每个正常响应使并发增加 ``1/当前并发``，即每一轮（约等于当前并发数个响应）+1
+- 乘性减：HTTP 429/5xx、超时、接口返回 ``SYS.429``/``SYS.5xx``，或延迟超过基线的 ``latency_factor`` 倍时
+  并发乘以 ``decrease``；同一轮内先后到达的多个拥塞信号只减一次
+- 基线延迟取观测到的最小延迟并缓慢上浮，网络整体变慢后不会一直误判为拥塞
+
+控制器只负责计算并发上限，由使用方（AdaptiveConcurrencyMiddleware、AttachmentDownloadPipeline）应用。
+同一个爬虫的控制器通过 get_controller 共享。
+"""
+import time
+import weakref
+
+# 接口 -> 默认参数，可被 settings.ADAPTIVE_CONCURRENCY 覆盖
+DEFAULT_LIMITS = {
+    'list_api': {'start': 4, 'min': 1, 'max': 16},
+    'detail_api': {'start': 4, 'min': 1, 'max': 32},
+    'download_api': {'start': 2, 'min': 1, 'max': 8},
+}
+
+_controllers = weakref.WeakKeyDictionary()
+
+
+class AIMDController:
+    """单个接口的并发控制器，只在reactor线程中调用"""
+
+    # 基线延迟向观测值靠拢的速度
+    BASELINE_DRIFT = 0.01
+    # 低于此值的延迟不视为拥塞，避免本地或极快响应的抖动触发减并发
+    LATENCY_FLOOR = 0.1
+
+    def __init__(self, name, start=4, minimum=1, maximum=32, decrease=0.5, latency_factor=3.0, cooldown=1.0):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.concurrency = float(min(max(start, self.minimum), self.maximum))
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.base_latency = None
+        self.last_latency = None
+        self.last_decrease = float('-inf')
+        self.successes = 0
+        self.congestions = 0
+        self.decreases = 0
+
+    @property
+    def limit(self):
+        return int(self.concurrency)
+
+    def on_success(self, latency=None, now=None):
+        """正常响应；延迟明显高于基线时按拥塞处理。返回并发上限是否变化"""
+        if latency is not None:
+            self.last_latency = latency
+            if self.base_latency is None or latency < self.base_latency:
+                self.base_latency = latency
+            else:
+                self.base_latency += (latency - self.base_latency) * self.BASELINE_DRIFT
+            if latency > max(self.base_latency * self.latency_factor, self.LATENCY_FLOOR):
+                return self.on_congestion(now)
+        self.successes += 1
+        before = self.limit
+        self.concurrency = min(self.maximum, self.concurrency + 1.0 / self.concurrency)
+        return self.limit != before
+
+    def on_congestion(self, now=None):
+        """拥塞信号。返回并发上限是否变化"""
+        now = time.monotonic() if now is None else now
+        self.congestions += 1
+        # 降低并发前已发出的请求也会带回拥塞信号，一轮（约一个延迟）内只减一次
+        window = max(self.cooldown, self.last_latency or 0)
+        if now - self.last_decrease < window:
+            return False
+        self.last_decrease = now
+        before = self.limit
+        self.concurrency = max(float(self.minimum), self.concurrency * self.decrease)
+        self.decreases += 1
+        return self.limit != before
+
+
+def get_controller(crawler, endpoint):
+    """返回爬虫某个接口共享的控制器，首次调用时按设置创建"""
+    controllers = _controllers.setdefault(crawler, {})
+    controller = controllers.get(endpoint)
+    if controller is None:
+        settings = crawler.settings
+        limits = dict(DEFAULT_LIMITS.get(endpoint, {}))
+        limits.update(settings.getdict('ADAPTIVE_CONCURRENCY').get(endpoint, {}))
+        controller = controllers[endpoint] = AIMDController(
+            endpoint,
+            start=limits.get('start', 4),
+            minimum=limits.get('min', 1),
+            maximum=limits.get('max', 32),
+            decrease=settings.getfloat('ADAPTIVE_CONCURRENCY_DECREASE', 0.5),
+            latency_factor=settings.getfloat('ADAPTIVE_CONCURRENCY_LATENCY_FACTOR', 3.0),
+            cooldown=settings.getfloat('ADAPTIVE_CONCURRENCY_COOLDOWN', 1.0),
+        )
+    return controller
+
+
+def controllers(crawler):
+    """爬虫已创建的全部控制器：接口 -> 控制器"""
+    return dict(_controllers.get(crawler, {}))
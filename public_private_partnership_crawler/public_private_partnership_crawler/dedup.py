@@ -0,0 +1,141 @@
+"""去重存储后端
+
+DuplicatesPipeline 用 ``key in store`` 判断一个键是否已经入库，数据库提交后用 ``add_many(keys)`` 登记，
+后端可替换：
+
+- MemoryDedupStore：Python集合，只在单次运行内有效
+- BloomDedupStore：内存映射文件上的布隆过滤器，跨运行持久化，内存占用固定
+"""
+import contextlib
+import hashlib
+import math
+import mmap
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:  # Windows 上不加文件锁，同一过滤器文件不能被多个进程同时写入
+    fcntl = None
+
+
+class MemoryDedupStore:
+    """基于内存集合的去重存储"""
+
+    def __init__(self):
+        self.seen = set()
+
+    def add(self, key):
+        """添加键，返回该键此前是否不存在"""
+        if key in self.seen:
+            return False
+        self.seen.add(key)
+        return True
+
+    def add_many(self, keys):
+        """批量添加，返回新增的键数"""
+        before = len(self.seen)
+        self.seen.update(keys)
+        return len(self.seen) - before
+
+    def __contains__(self, key):
+        return key in self.seen
+
+    def __len__(self):
+        return len(self.seen)
+
+    def close(self):
+        pass
+
+
+class BloomDedupStore:
+    """基于内存映射文件的布隆过滤器
+
+    位数组 m = -n·ln(p)/(ln2)² 位，n为容量、p为误判率，例如200万个id、误判率0.1%约3.4MB。
+    文件已存在时沿用文件头中的参数，保证跨运行的位置计算一致。
+    误判意味着极少量新id会被当作重复丢弃，超过容量后误判率会上升。
+
+    文件以共享方式映射，多个进程（并行或分布式抓取）可以共用同一文件：建文件和写入在文件锁（flock）内进行，
+    已添加数量保存在映射的文件头中；查询不加锁，位只会由0变1，并发写入只会让查询暂时看不到刚添加的键。
+    """
+
+    MAGIC = b'PPPBLOOM'
+    HEADER = struct.Struct('<8sQQQ')  # magic, 位数, 哈希函数个数, 已添加数量
+
+    def __init__(self, path, capacity=2000000, error_rate=0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be between 0 and 1: {error_rate}")
+        self.path = path
+        self.capacity = capacity
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+b')
+        with self._locked():
+            # 多个进程同时启动时只有第一个拿到锁的进程初始化文件
+            if os.fstat(self.file.fileno()).st_size == 0:
+                num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+                num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+                self.file.write(self.HEADER.pack(self.MAGIC, num_bits, num_hashes, 0))
+                self.file.truncate(self.HEADER.size + (num_bits + 7) // 8)
+                self.file.flush()
+            self.file.seek(0)
+            magic, self.num_bits, self.num_hashes, _ = self.HEADER.unpack(self.file.read(self.HEADER.size))
+        if magic != self.MAGIC:
+            self.file.close()
+            raise ValueError(f"Not a bloom filter file: {path}")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def _positions(self, key):
+        """双重哈希生成k个位位置"""
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _set_bits(self, key):
+        added = False
+        offset = self.HEADER.size
+        for pos in self._positions(key):
+            index = offset + (pos >> 3)
+            bit = 1 << (pos & 7)
+            byte = self.mm[index]
+            if not byte & bit:
+                self.mm[index] = byte | bit
+                added = True
+        return added
+
+    def add(self, key):
+        """添加键，返回该键此前是否不存在"""
+        return self.add_many([key]) == 1
+
+    def add_many(self, keys):
+        """批量添加，整批只加一次锁，返回新增的键数"""
+        with self._locked():
+            added = sum(self._set_bits(key) for key in keys)
+            if added:
+                header = self.HEADER.unpack(self.mm[:self.HEADER.size])
+                self.mm[:self.HEADER.size] = self.HEADER.pack(*header[:3], header[3] + added)
+        return added
+
+    def __contains__(self, key):
+        offset = self.HEADER.size
+        return all(self.mm[offset + (pos >> 3)] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self):
+        return self.HEADER.unpack(self.mm[:self.HEADER.size])[3]
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+        self.file.close()
@@ -0,0 +1,110 @@
+"""详情接口响应的本地缓存
+
+以 (project_id, operateTime) 为键保存详情接口返回的 data 部分。列表页中项目的 operateTime
+与缓存一致时直接复用缓存，不再请求详情接口。缓存按最近使用时间淘汰（LRU）：超过有效期未被使用的条目
+和超出条数上限时最久未使用的条目被删除。
+
+多个爬虫进程（并行或分布式抓取）可以共用同一缓存文件：每次写入单独提交，WAL模式下提交很快，
+不会长时间占用写锁；命中时的使用时间先记在内存中，攒够一批后在一个短事务中写回。
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import time
+
+
+class DetailCache:
+    """基于SQLite的详情缓存"""
+
+    def __init__(self, path, max_age_days=30, max_entries=500000, touch_every=100, timeout=30):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_entries = max_entries
+        self.touch_every = touch_every
+        # 命中但尚未写回使用时间的 project_id -> 时间
+        self.touched = {}
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # isolation_level=None：每条语句自动提交，不在两次写入之间持有写事务
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS detail_cache ('
+            'project_id TEXT PRIMARY KEY, operate_time TEXT NOT NULL, payload TEXT NOT NULL, cached_at REAL NOT NULL, '
+            'last_used REAL NOT NULL DEFAULT 0)'
+        )
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(detail_cache)')}
+        if 'last_used' not in columns:
+            # 旧版本的缓存文件没有使用时间，以写入时间为初值
+            with self.transaction():
+                self.conn.execute('ALTER TABLE detail_cache ADD COLUMN last_used REAL NOT NULL DEFAULT 0')
+                self.conn.execute('UPDATE detail_cache SET last_used = cached_at')
+        self.conn.execute('DROP INDEX IF EXISTS ix_detail_cache_cached_at')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS ix_detail_cache_last_used ON detail_cache (last_used)')
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """自动提交模式下显式开启事务，把多条语句合并为一次提交"""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def get(self, project_id, operate_time):
+        """返回缓存的详情数据；不存在、operateTime不一致或已过期时返回None"""
+        now = time.time()
+        row = self.conn.execute(
+            'SELECT payload FROM detail_cache WHERE project_id = ? AND operate_time = ? AND last_used >= ?',
+            (project_id, operate_time, now - self.max_age)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched[project_id] = now
+        if len(self.touched) >= self.touch_every:
+            self.flush_touched()
+        return json.loads(row[0])
+
+    def put(self, project_id, operate_time, detail_data):
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO detail_cache (project_id, operate_time, payload, cached_at, last_used) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (project_id, operate_time, json.dumps(detail_data, ensure_ascii=False), now, now)
+        )
+
+    def flush_touched(self):
+        """把命中条目的使用时间写回缓存"""
+        touched, self.touched = self.touched, {}
+        if touched:
+            with self.transaction():
+                self.conn.executemany('UPDATE detail_cache SET last_used = ? WHERE project_id = ?',
+                                      [(used, project_id) for project_id, used in touched.items()])
+
+    def evict(self):
+        """删除超过有效期未使用的条目，并在超出条数上限时删除最久未使用的条目，返回删除数量"""
+        self.flush_touched()
+        with self.transaction():
+            deleted = self.conn.execute(
+                'DELETE FROM detail_cache WHERE last_used < ?', (time.time() - self.max_age,)
+            ).rowcount
+            count = self.conn.execute('SELECT COUNT(*) FROM detail_cache').fetchone()[0]
+            if count > self.max_entries:
+                deleted += self.conn.execute(
+                    'DELETE FROM detail_cache WHERE project_id IN '
+                    '(SELECT project_id FROM detail_cache ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,)
+                ).rowcount
+        return deleted
+
+    def close(self):
+        self.flush_touched()
+        self.conn.close()
@@ -0,0 +1,382 @@
+"""分布式模式：多个爬虫进程/节点共享Redis中的请求队列和请求指纹集合
+
+- RedisDupeFilter：请求指纹存入共享集合（SADD），任何进程调度过的请求其他进程不再重复调度
+- RedisScheduler：请求序列化后按优先级存入共享列表，各进程并行消费。取出请求时原子地移动到本进程的
+  处理中列表（LMOVE），引擎处理完请求（回调产生的item已经过全部管道、新请求已入队）后才确认删除；
+  进程定时刷新心跳，心跳过期进程的处理中请求由其他进程重新入队，因此进程中途退出不会丢失请求
+- Redis往返按批合并：新请求先在本地缓冲，攒够 ``REDIS_PUSH_BATCH`` 个或下一次轮询时用两个pipeline
+  完成去重和入队；取请求时一次预取 ``REDIS_PREFETCH`` 个；确认删除随下一次预取、入队或轮询一起发送
+- 最先启动的进程通过 ``SET NX`` 成为协调者，由它生成起始请求（列表页）；其他进程只消费队列。
+  启动时队列中仍有未完成的请求则视为断点续爬，不再重新生成起始请求
+
+增量检查点由各进程按自己解析到的列表页分别记录，分布式增量抓取应使用 ``INCREMENTAL_WATERMARK_SOURCE=db``。
+
+连接地址 ``REDIS_URL`` 为 ``fakeredis://<名称>`` 时使用进程内的假Redis（同名共享，需安装 fakeredis），
+可以在一个进程中运行多个爬虫测试分布式逻辑。
+"""
+import collections
+import logging
+import os
+import pickle
+import socket
+import uuid
+
+from scrapy import signals
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.misc import build_from_crawler, load_object
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+logger = logging.getLogger(__name__)
+
+_fake_servers = {}
+
+
+def connect(url):
+    """按URL连接Redis"""
+    if url.startswith('fakeredis://'):
+        if fakeredis is None:
+            raise NotConfigured('REDIS_URL 使用 fakeredis:// 需要安装 fakeredis')
+        server = _fake_servers.setdefault(url, fakeredis.FakeServer())
+        return fakeredis.FakeRedis(server=server)
+    if redis is None:
+        raise NotConfigured('分布式模式需要安装 redis')
+    return redis.Redis.from_url(url)
+
+
+def key_prefix(crawler):
+    return crawler.settings.get('REDIS_KEY_PREFIX', 'ppp:{}').format(crawler.spider.name)
+
+
+class RedisDupeFilter(BaseDupeFilter):
+    """基于Redis集合的请求去重"""
+
+    def __init__(self, server, key, fingerprinter, stats=None, debug=False):
+        self.server = server
+        self.key = key
+        self.fingerprinter = fingerprinter
+        self.stats = stats
+        self.debug = debug
+        self.logdupes = True
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            connect(settings.get('REDIS_URL')),
+            f'{key_prefix(crawler)}:dupefilter',
+            crawler.request_fingerprinter,
+            stats=crawler.stats,
+            debug=settings.getbool('DUPEFILTER_DEBUG'),
+        )
+
+    def request_fingerprint(self, request):
+        return self.fingerprinter.fingerprint(request).hex()
+
+    def request_seen(self, request):
+        return self.server.sadd(self.key, self.request_fingerprint(request)) == 0
+
+    def clear(self):
+        self.server.delete(self.key)
+
+    def log(self, request, spider):
+        if self.debug:
+            logger.debug(f"过滤重复请求: {request}")
+        elif self.logdupes:
+            logger.debug(f"过滤重复请求: {request}（之后不再显示，设置 DUPEFILTER_DEBUG 显示全部）")
+            self.logdupes = False
+        if self.stats is not None:
+            self.stats.inc_value('dupefilter/filtered')
+
+
+class RedisScheduler:
+    """共享Redis队列的调度器"""
+
+    def __init__(self, crawler, server, dupefilter, prefix, heartbeat_interval=10.0, lease_ttl=60,
+                 idle_poll_interval=0.5, prefetch=8, push_batch=100):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.server = server
+        self.dupefilter = dupefilter
+        self.prefix = prefix
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_ttl = lease_ttl
+        self.idle_poll_interval = idle_poll_interval
+        self.prefetch = max(1, prefetch)
+        self.push_batch = max(1, push_batch)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.priorities_key = f'{prefix}:priorities'
+        self.workers_key = f'{prefix}:workers'
+        self.coordinator_key = f'{prefix}:coordinator'
+        self.processing_key = self._processing_key(self.worker_id)
+        self.coordinator = False
+        self.spider = None
+        self.heartbeat = None
+        self.poller = None
+        self.starved = False
+        # 批量去重需要RedisDupeFilter，其他去重器逐个检查
+        self.batch_dedupe = isinstance(dupefilter, RedisDupeFilter)
+        self.outbox = []  # 待入队的 [请求, 指纹(已去重时为None), 序列化请求, 优先级]
+        self.prefetched = collections.deque()  # 已移到处理中列表、尚未交给引擎的序列化请求
+        self.inflight = {}  # 引擎处理中的请求 -> 序列化请求（处理完后确认删除）
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        dupefilter = build_from_crawler(load_object(settings['DUPEFILTER_CLASS']), crawler)
+        scheduler = cls(
+            crawler,
+            connect(settings.get('REDIS_URL')),
+            dupefilter,
+            key_prefix(crawler),
+            heartbeat_interval=settings.getfloat('REDIS_HEARTBEAT_INTERVAL', 10.0),
+            lease_ttl=settings.getint('REDIS_LEASE_TTL', 60),
+            idle_poll_interval=settings.getfloat('REDIS_IDLE_POLL_INTERVAL', 0.5),
+            prefetch=settings.getint('REDIS_PREFETCH', 8),
+            push_batch=settings.getint('REDIS_PUSH_BATCH', 100),
+        )
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        return scheduler
+
+    def _queue_key(self, priority):
+        return f'{self.prefix}:requests:{priority}'
+
+    def _processing_key(self, worker_id):
+        return f'{self.prefix}:processing:{worker_id}'
+
+    def _heartbeat_key(self, worker_id):
+        return f'{self.prefix}:heartbeat:{worker_id}'
+
+    def _engine_slot(self):
+        engine = self.crawler.engine
+        return getattr(engine, 'slot', None) or getattr(engine, '_slot', None)
+
+    def open(self, spider):
+        self.spider = spider
+        self.server.sadd(self.workers_key, self.worker_id)
+        self.server.set(self._heartbeat_key(self.worker_id), 1, ex=self.lease_ttl)
+        self.coordinator = bool(self.server.set(self.coordinator_key, self.worker_id, nx=True, ex=self.lease_ttl))
+
+        resuming = False
+        if self.coordinator:
+            self.reap()
+            resuming = bool(self.queued() or self.cluster_busy())
+            if not resuming:
+                # 新一轮爬取：清空上一轮留下的指纹
+                self.dupefilter.clear()
+        # 只有协调者在新一轮爬取开始时生成起始请求
+        spider.should_seed = self.coordinator and not resuming
+        role = '协调者' if self.coordinator else '工作进程'
+        logger.info(f"分布式模式: {self.worker_id} 作为{role}启动，{'断点续爬' if resuming else '队列 ' + self.prefix}")
+
+        self.heartbeat = task.LoopingCall(self._heartbeat)
+        self.heartbeat.start(self.heartbeat_interval, now=False)
+        self.poller = task.LoopingCall(self._poll)
+        self.poller.start(self.idle_poll_interval, now=False)
+        return self.dupefilter.open()
+
+    def close(self, reason):
+        for loop in (self.heartbeat, self.poller):
+            if loop is not None and loop.running:
+                loop.stop()
+        # 缓冲中的新请求必须先写入共享队列
+        self.flush()
+        if reason == 'finished':
+            # 正常结束时处理中列表只剩下已处理完但未确认的请求，直接丢弃
+            self.server.delete(self.processing_key)
+        else:
+            self.requeue(self.worker_id)
+        self.server.srem(self.workers_key, self.worker_id)
+        self.server.delete(self._heartbeat_key(self.worker_id))
+        if self.coordinator and self.server.get(self.coordinator_key) == self.worker_id.encode():
+            self.server.delete(self.coordinator_key)
+        return self.dupefilter.close(reason)
+
+    def has_pending_requests(self):
+        return bool(self.prefetched or self.outbox) or self.queued() > 0
+
+    def __len__(self):
+        return len(self.prefetched) + len(self.outbox) + self.queued()
+
+    def queued(self):
+        priorities = self.server.zrange(self.priorities_key, 0, -1)
+        if not priorities:
+            return 0
+        pipe = self.server.pipeline(transaction=False)
+        for priority in priorities:
+            pipe.llen(self._queue_key(int(priority)))
+        return sum(pipe.execute())
+
+    def enqueue_request(self, request):
+        """请求先进入本地缓冲，由 flush 批量去重和入队
+
+        使用RedisDupeFilter时跨进程的重复要到flush时才能确定，被过滤的请求只记录日志和统计，
+        这里总是返回True（不触发 request_dropped）。
+        """
+        fingerprint = None
+        if not request.dont_filter:
+            if self.batch_dedupe:
+                fingerprint = self.dupefilter.request_fingerprint(request)
+            elif self.dupefilter.request_seen(request):
+                self.dupefilter.log(request, self.spider)
+                return False
+        member = pickle.dumps(request.to_dict(spider=self.spider), protocol=4)
+        self.outbox.append([request, fingerprint, member, request.priority])
+        if len(self.outbox) >= self.push_batch:
+            self.flush()
+        return True
+
+    def _finished(self):
+        """引擎已处理完（回调输出已全部处理）的请求"""
+        slot = self._engine_slot()
+        inprogress = getattr(slot, 'inprogress', None)
+        if inprogress is None:
+            return []
+        return [request for request in self.inflight if request not in inprogress]
+
+    def flush(self):
+        """发送缓冲的新请求（一个pipeline去重、一个pipeline入队）和已处理完请求的确认删除"""
+        outbox, self.outbox = self.outbox, []
+        finished = self._finished()
+        pending = [entry for entry in outbox if entry[1] is not None]
+        try:
+            if finished or pending:
+                pipe = self.server.pipeline(transaction=False)
+                for request in finished:
+                    pipe.lrem(self.processing_key, 1, self.inflight[request])
+                for entry in pending:
+                    pipe.sadd(self.dupefilter.key, entry[1])
+                results = pipe.execute()
+                for request in finished:
+                    del self.inflight[request]
+                for entry, added in zip(pending, results[len(finished):]):
+                    # 指纹已写入，入队失败重试时不再去重
+                    entry[1] = None
+                    if not added:
+                        self.dupefilter.log(entry[0], self.spider)
+                        entry[0] = None
+                outbox = [entry for entry in outbox if entry[0] is not None]
+            if outbox:
+                self._push_many([(member, priority) for _, _, member, priority in outbox])
+                self.stats.inc_value('scheduler/enqueued/redis', len(outbox))
+        except Exception:
+            # 未写入的请求留在缓冲中，下次重试
+            self.outbox[:0] = outbox
+            raise
+
+    def _push(self, member, priority):
+        self._push_many([(member, priority)])
+
+    def _push_many(self, entries):
+        by_priority = {}
+        for member, priority in entries:
+            by_priority.setdefault(priority, []).append(member)
+        pipe = self.server.pipeline(transaction=False)
+        for priority, members in by_priority.items():
+            pipe.zadd(self.priorities_key, {priority: -priority})
+            pipe.lpush(self._queue_key(priority), *members)
+        pipe.execute()
+
+    def next_request(self):
+        if not self.prefetched:
+            self.flush()
+            self._fetch()
+        if not self.prefetched:
+            self.starved = True
+            return None
+        member = self.prefetched.popleft()
+        request = request_from_dict(pickle.loads(member), spider=self.spider)
+        self.inflight[request] = member
+        self.stats.inc_value('scheduler/dequeued/redis')
+        return request
+
+    def _fetch(self):
+        """从优先级最高的非空队列预取一批请求，原子地移到本进程的处理中列表，进程退出后可由其他进程恢复"""
+        for priority in self.server.zrange(self.priorities_key, 0, -1):
+            pipe = self.server.pipeline(transaction=False)
+            for _ in range(self.prefetch):
+                pipe.lmove(self._queue_key(int(priority)), self.processing_key, 'RIGHT', 'LEFT')
+            members = [member for member in pipe.execute() if member is not None]
+            if members:
+                self.prefetched.extend(members)
+                return
+
+    def _poll(self):
+        """定时发送缓冲的新请求和确认删除；本地取空后，共享队列中一有新请求就唤醒引擎，
+        否则引擎空闲时要等到下一次心跳（5秒）才会再取"""
+        try:
+            self.flush()
+            if not self.starved or not self.queued():
+                return
+        except Exception as e:
+            logger.error(f"访问共享队列失败: {e}")
+            return
+        self.starved = False
+        slot = self._engine_slot()
+        if slot is not None:
+            slot.nextcall.schedule()
+
+    def requeue(self, worker_id):
+        """把某个进程处理中的请求放回共享队列"""
+        processing_key = self._processing_key(worker_id)
+        count = 0
+        while True:
+            member = self.server.rpop(processing_key)
+            if member is None:
+                break
+            self._push(member, pickle.loads(member).get('priority', 0))
+            count += 1
+        if count:
+            logger.warning(f"重新入队 {worker_id} 处理中的 {count} 个请求")
+            self.stats.inc_value('scheduler/requeued/redis', count)
+        return count
+
+    def reap(self):
+        """心跳过期的进程视为已退出，回收其处理中的请求"""
+        for worker_id in self.server.smembers(self.workers_key):
+            worker_id = worker_id.decode()
+            if worker_id == self.worker_id or self.server.exists(self._heartbeat_key(worker_id)):
+                continue
+            self.requeue(worker_id)
+            self.server.srem(self.workers_key, worker_id)
+
+    def cluster_busy(self):
+        """其他存活进程是否还有处理中的请求（它们可能继续产生新请求）"""
+        for worker_id in self.server.smembers(self.workers_key):
+            worker_id = worker_id.decode()
+            if worker_id != self.worker_id and self.server.llen(self._processing_key(worker_id)):
+                return True
+        return False
+
+    def _heartbeat(self):
+        try:
+            self.server.set(self._heartbeat_key(self.worker_id), 1, ex=self.lease_ttl)
+            if self.coordinator:
+                self.server.set(self.coordinator_key, self.worker_id, xx=True, ex=self.lease_ttl)
+            elif self.server.set(self.coordinator_key, self.worker_id, nx=True, ex=self.lease_ttl):
+                # 原协调者已退出，接替其角色（不再生成起始请求）
+                self.coordinator = True
+                logger.info(f"分布式模式: {self.worker_id} 接替为协调者")
+            self.reap()
+        except Exception as e:
+            logger.error(f"分布式心跳失败: {e}")
+
+    def spider_idle(self, spider):
+        """本进程空闲时，只要集群中仍有待处理的请求就不关闭"""
+        self.flush()
+        if self.queued() or self.cluster_busy():
+            raise DontCloseSpider
+        if not self.coordinator and self.server.exists(self.coordinator_key):
+            # 协调者仍在运行（可能尚未生成起始请求），继续等待
+            raise DontCloseSpider
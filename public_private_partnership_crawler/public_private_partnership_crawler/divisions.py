@@ -0,0 +1,197 @@
+"""行政区划索引：代码 -> 名称/层级，名称 -> 代码（字典树）
+
+数据文件 data/adcodes.tsv 由 cpca 包自带的 adcodes.csv 生成（每行 ``6位代码\\t名称``，
+去掉“市辖区”“县”等占位条目），首次使用时加载，之后在进程内共享：
+
+    python -m public_private_partnership_crawler.divisions path/to/cpca/resources/adcodes.csv
+
+代码层级按6位行政区划代码的结构推导：前2位省、前4位市、6位区县。直辖市的区、省直辖县级行政区
+没有地级行政区，推导出的市代码（如 110100、429000）不在索引中，这类地区的市为空。
+"""
+import csv
+import os
+import re
+import sys
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'adcodes.tsv')
+
+# 不代表具体地区的占位名称
+PLACEHOLDER_NAMES = frozenset(('市辖区', '县', '省直辖县级行政区划', '自治区直辖县级行政区划'))
+
+# 名称简写时去掉的后缀
+SUFFIX_RE = re.compile(r'(特别行政区|维吾尔自治区|壮族自治区|回族自治区|自治区|自治州|自治县|地区|省|市|区|县|盟|旗)$')
+SPECIAL_ABBR = {
+    '内蒙古自治区': '内蒙古',
+    '广西壮族自治区': '广西',
+    '西藏自治区': '西藏',
+    '新疆维吾尔自治区': '新疆',
+    '宁夏回族自治区': '宁夏',
+}
+
+
+def ancestors(code):
+    """返回 (省代码, 市代码, 区县代码)，不存在的层级为None"""
+    province = code[:2] + '0000'
+    city = code[:4] + '00' if code[2:4] != '00' else None
+    county = code if code[4:] != '00' else None
+    return province, city, county
+
+
+class NameTrie:
+    """名称 -> 代码列表的字典树，支持在文本中按最长匹配查找"""
+
+    END = ''
+
+    def __init__(self):
+        self.root = {}
+
+    def add(self, name, code):
+        node = self.root
+        for char in name:
+            node = node.setdefault(char, {})
+        codes = node.setdefault(self.END, [])
+        if code not in codes:
+            codes.append(code)
+
+    def get(self, name):
+        node = self.root
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get(self.END, [])
+
+    def scan(self, text):
+        """从左到右按最长匹配切出文本中的地名，返回 [(名称, 候选代码列表)]"""
+        matches = []
+        i = 0
+        while i < len(text):
+            node, end, codes = self.root, None, None
+            for j in range(i, len(text)):
+                node = node.get(text[j])
+                if node is None:
+                    break
+                if self.END in node:
+                    end, codes = j + 1, node[self.END]
+            if end is None:
+                i += 1
+                continue
+            matches.append((text[i:end], codes))
+            i = end
+        return matches
+
+
+class DivisionIndex:
+    """行政区划索引"""
+
+    def __init__(self, names):
+        self.names = names
+        self.cache = {}
+        self.trie = NameTrie()
+        for code, name in names.items():
+            self.trie.add(name, code)
+            abbr = SPECIAL_ABBR.get(name) or SUFFIX_RE.sub('', name)
+            if len(abbr) >= 2:
+                self.trie.add(abbr, code)
+
+    @classmethod
+    def load(cls, path=DATA_PATH):
+        names = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                code, name = line.rstrip('\n').split('\t')
+                names[code] = name
+        return cls(names)
+
+    def name(self, code):
+        return self.names.get(code, '') if code else ''
+
+    def lookup(self, code):
+        """返回 (层级代码, 层级名称)，均为 (省, 市, 区县) 三元组，按代码缓存；没有地级行政区时市为None"""
+        entry = self.cache.get(code)
+        if entry is None:
+            levels = ancestors(code)
+            if levels[1] and levels[1] != code and levels[1] not in self.names:
+                levels = (levels[0], None, levels[2])
+            entry = self.cache[code] = (levels, tuple(self.names.get(level, '') if level else '' for level in levels))
+        return entry
+
+    def resolve_many(self, codes, fallback_names=None):
+        """把一个项目的全部地址代码一次性解析为叶子地区的完整路径
+
+        代码列表里同时包含上级和下级时（如 省,市,区县）只保留最下级；索引中缺失的代码
+        使用 fallback_names 中同位置的名称（接口的 projectAddressName 按逗号拆分，每项形如 ``市 区县``）。
+
+        :return: [(层级代码, 层级名称)]，按原顺序去重
+        """
+        codes = [code for code in codes if code]
+        entries = [self.lookup(code) for code in codes]
+        parents = set()
+        for levels, _ in entries:
+            depth = 3 if levels[2] else (2 if levels[1] else 1)
+            parents.update(levels[:depth - 1])
+
+        result = []
+        seen = set()
+        for i, (levels, path) in enumerate(entries):
+            code = codes[i]
+            if code in parents or code in seen:
+                continue
+            seen.add(code)
+            if '' in path and fallback_names and len(fallback_names) == len(codes):
+                # 索引中缺失的新设地区，用接口给出的名称从最下级开始补齐
+                path = list(path)
+                present = [level for level in range(3) if levels[level]]
+                for level, segment in zip(reversed(present), reversed(fallback_names[i].split())):
+                    if not path[level]:
+                        path[level] = segment
+                path = tuple(path)
+            result.append((levels, path))
+        return result
+
+    def match(self, text):
+        """在文本中识别地名，返回可能的代码列表；重名地区优先取与前面已识别地区同属的"""
+        codes = []
+        for _, candidates in self.trie.scan(text):
+            chosen = candidates[0]
+            for candidate in candidates:
+                if any(parent in ancestors(candidate) for parent in codes):
+                    chosen = candidate
+                    break
+            codes.append(chosen)
+        return codes
+
+
+_index = None
+
+
+def get_index():
+    """进程内共享的索引，首次调用时加载"""
+    global _index
+    if _index is None:
+        _index = DivisionIndex.load()
+    return _index
+
+
+def build_data_file(csv_path, out_path=DATA_PATH):
+    """从 cpca 的 adcodes.csv（12位代码）生成 data/adcodes.tsv"""
+    rows = {}
+    with open(csv_path, encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            code, name = row['adcode'][:6], row['name'].strip()
+            if name and name not in PLACEHOLDER_NAMES:
+                rows[code] = name
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('# 由 cpca (MIT License) resources/adcodes.csv 生成\n')
+        for code in sorted(rows):
+            f.write(f'{code}\t{rows[code]}\n')
+    return len(rows)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('用法: python -m public_private_partnership_crawler.divisions path/to/adcodes.csv')
+    print(f'写入 {build_data_file(sys.argv[1])} 条到 {DATA_PATH}')
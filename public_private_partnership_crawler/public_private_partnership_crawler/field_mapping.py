@@ -0,0 +1,83 @@
+"""声明式的接口字段 -> item字段映射
+
+映射规则为 (item字段, 数据来源, 源字段, 转换器[, 缺失默认值]) 元组，由 FieldMapper 在构造时一次性编译：
+按数据来源分组，转换器名解析为绑定方法，处理每个详情时只遍历预先编译好的字段表。
+
+数据来源：
+- ``list``：列表接口行，总是存在
+- ``Section``：详情数据中的对象，为空时其下字段不写入item
+- ``Section[0]``：详情数据中数组的第一项
+- ``Section[*]``：详情数据中数组的每一项，转换后以逗号拼接
+
+JSON解码优先使用 orjson（可选依赖），未安装时回退到标准库 json。
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """解码JSON响应体（bytes或str）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FieldMapper:
+    """编译后的字段提取器"""
+
+    def __init__(self, spec, converters):
+        """
+        :param spec: 映射规则元组序列
+        :param converters: 转换器名 -> 可调用对象；``code:TYPE`` 形式的转换器通过 converters['code'](TYPE) 生成
+        """
+        groups = {}
+        for rule in spec:
+            field, source, key, converter = rule[:4]
+            default = rule[4] if len(rule) > 4 else ''
+            if converter is None:
+                func = None
+            elif converter.startswith('code:'):
+                func = converters['code'](converter[5:])
+            else:
+                func = converters[converter]
+            groups.setdefault(source, []).append((field, key, default, func))
+
+        self.list_fields = tuple(groups.pop('list', ()))
+        self.sections = []  # (详情节点, 取值方式, 字段表)
+        for source, fields in groups.items():
+            if source.endswith('[0]'):
+                self.sections.append((source[:-3], 'first', tuple(fields)))
+            elif source.endswith('[*]'):
+                self.sections.append((source[:-3], 'join', tuple(fields)))
+            else:
+                self.sections.append((source, 'object', tuple(fields)))
+
+    @staticmethod
+    def _fill(values, row, fields):
+        for field, key, default, func in fields:
+            value = row.get(key, default)
+            values[field] = func(value) if func is not None else value
+
+    def extract(self, list_data, detail_data):
+        """返回 item字段 -> 值 的字典"""
+        values = {}
+        self._fill(values, list_data, self.list_fields)
+        for section, mode, fields in self.sections:
+            node = detail_data.get(section)
+            if not node:
+                continue
+            if mode == 'object':
+                self._fill(values, node, fields)
+            elif mode == 'first':
+                self._fill(values, node[0], fields)
+            else:
+                for field, key, default, func in fields:
+                    if func is not None:
+                        values[field] = ','.join(func(row.get(key, default)) for row in node)
+                    else:
+                        values[field] = ','.join(row.get(key, default) for row in node)
+        return values
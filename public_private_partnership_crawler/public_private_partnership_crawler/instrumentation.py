@@ -0,0 +1,206 @@
+"""ITEM_PIPELINES 各阶段耗时统计
+
+timed_pipelines() 把 ITEM_PIPELINES 的每一项换成 timed(原管道)：照常构造原管道后为其 process_item 计时，
+无需修改任何管道，也不依赖 ItemPipelineManager 的内部实现。返回Deferred或协程的管道计到完成为止。
+爬虫结束时按累计耗时输出排名，并把各阶段的p50/p95/p99写入crawler stats。
+
+设置 ``PIPELINE_PROFILE_PATH`` 后，爬取过程中按 ``PIPELINE_PROFILE_INTERVAL`` 采样所有线程的调用栈，
+结束时写出 folded stacks 格式文件，可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+"""
+import inspect
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from scrapy import signals
+from scrapy.utils.misc import build_from_crawler, load_object
+from twisted.internet.defer import Deferred
+
+logger = logging.getLogger(__name__)
+
+# crawler -> PipelineTiming
+_timings = {}
+
+
+class StageTimer:
+    """单个管道阶段的耗时统计，分位数基于固定大小的蓄水池采样"""
+
+    def __init__(self, name, reservoir_size=10000):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.reservoir_size = reservoir_size
+        self.samples = []
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self.samples) < self.reservoir_size:
+            self.samples.append(seconds)
+        else:
+            index = random.randrange(self.count)
+            if index < self.reservoir_size:
+                self.samples[index] = seconds
+
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class StackSampler(threading.Thread):
+    """定时采样所有线程调用栈，累计为 folded stacks"""
+
+    def __init__(self, interval=0.01):
+        super().__init__(name='StackSampler', daemon=True)
+        self.interval = interval
+        self.stacks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+
+
+class PipelineTiming:
+    """一个爬虫各管道阶段的计时；爬虫打开时开始采样调用栈，关闭（各管道 close_spider 完成）后输出报告"""
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stage_timers = {}
+        self.profile_path = crawler.settings.get('PIPELINE_PROFILE_PATH')
+        self.sampler = None
+        if self.profile_path:
+            self.sampler = StackSampler(crawler.settings.getfloat('PIPELINE_PROFILE_INTERVAL', 0.01))
+
+    def wrap(self, stage, method):
+        """返回计时的 process_item"""
+        timer = self.stage_timers.setdefault(stage, StageTimer(stage))
+
+        async def awaited(result, start):
+            try:
+                return await result
+            finally:
+                timer.record(time.perf_counter() - start)
+
+        def process_item(item, spider):
+            start = time.perf_counter()
+            try:
+                result = method(item, spider)
+            except BaseException:
+                timer.record(time.perf_counter() - start)
+                raise
+            if isinstance(result, Deferred):
+                def finished(value):
+                    timer.record(time.perf_counter() - start)
+                    return value
+                return result.addBoth(finished)
+            if inspect.isawaitable(result):
+                return awaited(result, start)
+            timer.record(time.perf_counter() - start)
+            return result
+
+        return process_item
+
+    def spider_opened(self, spider):
+        if self.sampler is not None:
+            self.sampler.start()
+
+    def spider_closed(self, spider):
+        _timings.pop(self.crawler, None)
+        self.report()
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.write(self.profile_path)
+            logger.info(f"管道采样火焰图数据已写入: {self.profile_path}")
+
+    def report(self):
+        """按累计耗时降序输出各阶段统计"""
+        timers = sorted(self.stage_timers.values(), key=lambda t: t.total, reverse=True)
+        grand_total = sum(t.total for t in timers) or 1.0
+        lines = ['管道耗时排名:']
+        for rank, timer in enumerate(timers, 1):
+            p50, p95, p99 = (timer.percentile(p) for p in (50, 95, 99))
+            lines.append(
+                f'{rank}. {timer.name}: 累计 {timer.total:.3f}s ({timer.total / grand_total:.1%}), '
+                f'{timer.count} 次, p50 {p50 * 1000:.2f}ms, p95 {p95 * 1000:.2f}ms, '
+                f'p99 {p99 * 1000:.2f}ms, max {timer.max * 1000:.2f}ms'
+            )
+            stats = self.crawler.stats
+            prefix = f'pipeline_timing/{timer.name}'
+            stats.set_value(f'{prefix}/count', timer.count)
+            stats.set_value(f'{prefix}/total_seconds', round(timer.total, 6))
+            stats.set_value(f'{prefix}/p50_ms', round(p50 * 1000, 3))
+            stats.set_value(f'{prefix}/p95_ms', round(p95 * 1000, 3))
+            stats.set_value(f'{prefix}/p99_ms', round(p99 * 1000, 3))
+        logger.info('\n'.join(lines))
+
+
+def get_timing(crawler):
+    """返回爬虫共享的 PipelineTiming，首次调用时创建并连接信号"""
+    timing = _timings.get(crawler)
+    if timing is None:
+        timing = _timings[crawler] = PipelineTiming(crawler)
+        crawler.signals.connect(timing.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(timing.spider_closed, signal=signals.spider_closed)
+    return timing
+
+
+class TimedPipeline:
+    """ITEM_PIPELINES 中代替原管道的项，由 timed() 生成：构造原管道并为其 process_item 计时
+
+    返回的是原管道对象本身，只替换了实例上的 process_item；ItemPipelineManager 在全部管道构造完成后
+    才读取各管道的 process_item，取到的是计时版本。
+    """
+
+    pipeline = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipe = build_from_crawler(load_object(cls.pipeline), crawler)
+        if hasattr(pipe, 'process_item'):
+            pipe.process_item = get_timing(crawler).wrap(type(pipe).__name__, pipe.process_item)
+        return pipe
+
+
+def timed(pipeline):
+    """为管道（类路径或类）生成 TimedPipeline 子类"""
+    path = pipeline if isinstance(pipeline, str) else f'{pipeline.__module__}.{pipeline.__qualname__}'
+    return type(f"timed({path.rsplit('.', 1)[-1]})", (TimedPipeline,), {'pipeline': pipeline, '__module__': __name__})
+
+
+def timed_pipelines(pipelines):
+    """ITEM_PIPELINES 设置 -> 每个管道都换成 timed() 的同序设置，已换过的保持不变"""
+    return {
+        key if isinstance(key, type) and issubclass(key, TimedPipeline) else timed(key): order
+        for key, order in pipelines.items()
+    }
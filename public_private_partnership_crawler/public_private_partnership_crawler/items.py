@@ -111,6 +111,7 @@ class FranchiseAttachmentItem(scrapy.Item):
     # 附件基本信息
     attachment_id = scrapy.Field()  # 附件ID（系统中的文件ID）
     project_id = scrapy.Field()  # 关联的项目ID（外键）
+    province_code = scrapy.Field()  # 所属项目的省份代码（用于导出分区，不入库）
 
     # 文件信息
     file_type = scrapy.Field()  # 文件类型（gov_auth/franchise_plan/bidding_file等）
@@ -118,6 +119,7 @@ class FranchiseAttachmentItem(scrapy.Item):
     original_filename = scrapy.Field()  # 原始文件名
     content_type = scrapy.Field()  # 文件MIME类型
     file_size = scrapy.Field()  # 文件大小（字节）
+    file_hash = scrapy.Field()  # 文件内容SHA-256（本地存储文件名）
 
     # 文件下载链接
     download_url = scrapy.Field()  # 文件下载链接
@@ -0,0 +1,147 @@
+"""Prometheus文本格式的爬虫指标
+
+只实现用到的 counter、gauge、histogram 三种类型，所有更新都在reactor线程中进行，无需加锁。
+"""
+import math
+
+from twisted.web.resource import Resource
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+
+    def sorted_values(self):
+        return sorted(self.values.items(), key=lambda pair: [str(label) for label in pair[0]])
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.sorted_values():
+            lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self.values.get(labels, 0)
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def replace(self, values):
+        """整体替换所有标签的取值（用于分布类指标）"""
+        self.values = {(label,): value for label, value in values.items()}
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in self.sorted_values():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                label_str = _format_labels(self.label_names, labels, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{label_str} {cumulative}')
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f'{self.name}_sum{label_str} {_format_value(total)}')
+            lines.append(f'{self.name}_count{label_str} {count}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, label_names=()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        return self.register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name, documentation, label_names=(), **kwargs):
+        return self.register(Histogram(name, documentation, label_names, **kwargs))
+
+    def add_collector(self, collector):
+        """注册在每次输出前调用的回调，用于刷新按需计算的指标"""
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsResource(Resource):
+    """以Prometheus文本格式输出指标的HTTP资源"""
+
+    isLeaf = True
+
+    def __init__(self, registry):
+        super().__init__()
+        self.registry = registry
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.registry.render().encode('utf-8')
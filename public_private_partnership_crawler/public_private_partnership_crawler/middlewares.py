@@ -4,11 +4,27 @@
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
 from scrapy import signals
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.downloadermiddlewares.retry import get_retry_request
+from scrapy.utils.defer import maybe_deferred_to_future
+from scrapy.utils.misc import load_object
+from twisted.internet import task, threads
+from twisted.internet.error import ConnectionRefusedError, TCPTimedOutError, TimeoutError
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
+import asyncio
+import json
+import os
+import re
 import requests
 import scrapy
+import time
+from public_private_partnership_crawler.clearance import ClearanceCache, cookies_expiry
+from public_private_partnership_crawler.concurrency import controllers, get_controller
+from public_private_partnership_crawler.resilience import CircuitBreaker, backoff_delay, get_breaker, get_budget
+
+API_CODE_RE = re.compile(rb'"code"\s*:\s*"([^"]*)"')
 
 
 class PublicPrivatePartnershipCrawlerSpiderMiddleware:
@@ -106,50 +122,496 @@ class PublicPrivatePartnershipCrawlerDownloaderMiddleware:
 
 
 class FlareSolverrMiddleware:
-    def __init__(self, flaresolverr_url):
+    """FlareSolverr下载中间件
+
+    带 ``use_flaresolverr`` 标记的请求交给FlareSolverr渲染。对FlareSolverr的调用走Scrapy自身的下载器，
+    不阻塞reactor；整个爬虫复用同一个FlareSolverr浏览器会话，避免每次请求冷启动浏览器，
+    同时求解的请求数受 ``FLARESOLVERR_MAX_CONCURRENCY`` 限制。
+    """
+
+    def __init__(self, crawler, flaresolverr_url, max_concurrency=1, max_timeout=60000,
+                 cache_path=None, cache_ttl=1800):
+        self.crawler = crawler
         self.flaresolverr_url = flaresolverr_url
+        self.max_timeout = max_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session_lock = asyncio.Lock()
+        self.session_id = None
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.cache = None
+        self.refresh_lock = asyncio.Lock()
 
     @classmethod
     def from_crawler(cls, crawler):
-        flaresolverr_url = crawler.settings.get('FLARESOLVERR_URL', 'http://localhost:8191/v1')
-        return cls(flaresolverr_url)
+        settings = crawler.settings
+        middleware = cls(
+            crawler,
+            settings.get('FLARESOLVERR_URL', 'http://localhost:8191/v1'),
+            max_concurrency=settings.getint('FLARESOLVERR_MAX_CONCURRENCY', 1),
+            max_timeout=settings.getint('FLARESOLVERR_MAX_TIMEOUT', 60000),
+            cache_path=settings.get('CLEARANCE_CACHE_PATH'),
+            cache_ttl=settings.getint('CLEARANCE_DEFAULT_TTL', 1800),
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
 
-    def process_request(self, request, spider):
+    async def process_request(self, request, spider):
         # 检查请求的meta中是否包含use_flaresolverr标记
         if not request.meta.get('use_flaresolverr', False):
             return None
+        if request.meta.get('clearance_cache') and self.cache_path:
+            return await self._solve_cached(request, spider)
+        return await self._solve(request, spider)
+
+    async def _solve_cached(self, request, spider):
+        """带缓存的求解：进程内的并发刷新合并为一次，跨进程通过锁文件协调
+
+        ``meta['stale_cookies']`` 为调用方已确认失效的cookies：缓存中仍是这组cookies时先删除缓存，
+        其他进程不再读到失效的cookies，转而等待本次刷新。
+        """
+        if self.cache is None:
+            self.cache = ClearanceCache(self.cache_path.format(spider.name), default_ttl=self.cache_ttl)
+        stale = request.meta.get('stale_cookies')
+        if stale:
+            self.cache.invalidate(stale)
+
+        async with self.refresh_lock:
+            deadline = time.monotonic() + self.max_timeout / 1000
+            while True:
+                entry = self.cache.load()
+                if entry and entry['cookies'] != stale:
+                    return self._cached_response(request, entry)
+                if self.cache.try_lock():
+                    break
+                if time.monotonic() > deadline:
+                    spider.logger.warning("Timed out waiting for clearance refresh by another process")
+                    break
+                await asyncio.sleep(1)
+
+            try:
+                # 拿到锁后再检查一次，其他进程可能刚刚完成刷新
+                entry = self.cache.load()
+                if entry and entry['cookies'] != stale:
+                    return self._cached_response(request, entry)
+                response = await self._solve(request, spider)
+                self.cache.save(response.cookies, response.user_agent, response.cookies_expires)
+                spider.logger.info("Clearance cookies refreshed and cached")
+                return response
+            finally:
+                self.cache.unlock()
+
+    def _cached_response(self, request, entry):
+        response = scrapy.http.TextResponse(url=request.url, body=b'', encoding='utf-8', request=request)
+        response.cookies = entry['cookies']
+        response.user_agent = entry.get('user_agent')
+        response.cookies_expires = entry['expires']
+        return response
 
+    async def _solve(self, request, spider):
+        """调用FlareSolverr求解并构造响应"""
         try:
             payload = {
                 "cmd": "request.get",
                 "url": request.url,
-                "maxTimeout": 60000,
+                "maxTimeout": self.max_timeout,
                 "pageLoadTimeout": 10,
             }
             if request.meta.get("waitForSelector"):
                 payload['waitForSelector'] = request.meta.get("waitForSelector")
                 # payload['xpathWaitTimeout'] = 20
-            response = requests.post(self.flaresolverr_url, json=payload)
-            data = response.json()
-
-            if data.get('status') == 'ok':
-                solution = data['solution']
-                body = solution.get('response', '')
-                cookies = {}
-                if 'cookies' in solution:
-                    for cookie in solution['cookies']:
-                        cookies[cookie['name']] = cookie['value']
-                response = scrapy.http.TextResponse(
-                    url=request.url,
-                    body=body.encode('utf-8'),
-                    encoding='utf-8'
-                )
-                response.cookies = cookies
-                return response
-            else:
-                spider.logger.error(f"FlareSolverr error: {data}")
-                raise IgnoreRequest()
+            session_id = await self._get_session(spider)
+            if session_id:
+                payload['session'] = session_id
 
+            async with self.semaphore:
+                data = await self._call(payload)
         except Exception as e:
             spider.logger.error(f"FlareSolverr middleware error: {str(e)}")
-            raise IgnoreRequest()
\ No newline at end of file
+            raise IgnoreRequest(str(e))
+
+        if data.get('status') != 'ok':
+            spider.logger.error(f"FlareSolverr error: {data}")
+            raise IgnoreRequest(data.get('message', 'FlareSolverr error'))
+
+        solution = data['solution']
+        body = solution.get('response', '')
+        cookies = {}
+        if 'cookies' in solution:
+            for cookie in solution['cookies']:
+                cookies[cookie['name']] = cookie['value']
+        response = scrapy.http.TextResponse(
+            url=request.url,
+            body=body.encode('utf-8'),
+            encoding='utf-8',
+            request=request,
+        )
+        response.cookies = cookies
+        response.user_agent = solution.get('userAgent')
+        response.cookies_expires = cookies_expiry(solution.get('cookies', []))
+        return response
+
+    async def _get_session(self, spider):
+        """获取（必要时创建）复用的FlareSolverr会话，创建失败时退回无会话模式"""
+        async with self.session_lock:
+            if self.session_id is None:
+                session_id = f"{spider.name}-{os.getpid()}"
+                try:
+                    data = await self._call({"cmd": "sessions.create", "session": session_id})
+                except Exception as e:
+                    data = {'message': str(e)}
+                if data.get('status') == 'ok':
+                    self.session_id = data.get('session', session_id)
+                    spider.logger.info(f"FlareSolverr session created: {self.session_id}")
+                else:
+                    self.session_id = ''
+                    spider.logger.warning(f"FlareSolverr session unavailable, solving without session: {data}")
+            return self.session_id
+
+    async def _call(self, payload):
+        """通过Scrapy下载器调用FlareSolverr接口"""
+        request = scrapy.Request(
+            url=self.flaresolverr_url,
+            method='POST',
+            body=json.dumps(payload),
+            headers={'Content-Type': 'application/json'},
+            dont_filter=True,
+            meta={
+                'allow_offsite': True,
+                'download_timeout': self.max_timeout / 1000 + 30,
+            },
+        )
+        response = await maybe_deferred_to_future(self.crawler.engine.download(request))
+        return json.loads(response.text)
+
+    def spider_closed(self, spider):
+        """销毁会话；下载器此时已关闭，在线程中同步调用，返回的Deferred完成前引擎不会停止，但不阻塞reactor"""
+        if not self.session_id:
+            return None
+        d = threads.deferToThread(requests.post, self.flaresolverr_url,
+                                  json={"cmd": "sessions.destroy", "session": self.session_id}, timeout=10)
+        d.addErrback(lambda failure: spider.logger.warning(
+            f"Failed to destroy FlareSolverr session {self.session_id}: {failure.value}"))
+        return d
+
+
+def api_endpoints(spider, *extra):
+    """tzxm 接口的 (URL前缀, 接口名) 列表；接口地址可由 -a 参数覆盖，需在爬虫打开后获取"""
+    endpoints = [
+        (url.split('{')[0], endpoint)
+        for endpoint, url in (('list_api', getattr(spider, 'list_api', None)),
+                              ('detail_api', getattr(spider, 'detail_api', None)),
+                              ('download_api', getattr(spider, 'download_api', None)))
+        if url
+    ]
+    endpoints.extend(extra)
+    return tuple(endpoints)
+
+
+def match_endpoint(url, endpoints):
+    for prefix, endpoint in endpoints:
+        if url.startswith(prefix):
+            return endpoint
+    return None
+
+
+def api_code(body):
+    """响应体开头的 ``code`` 字段，不解码整个JSON；不是JSON或没有code时返回None"""
+    match = API_CODE_RE.search(body[:512])
+    return match.group(1).decode('utf-8', 'replace') if match else None
+
+
+def is_congestion_code(code):
+    """接口code是否表示限流或服务端错误（``SYS.429``、``SYS.5xx``），与HTTP状态的判断一致"""
+    number = code.rpartition('.')[2]
+    return number.isdigit() and (number == '429' or number.startswith('5') and len(number) == 3)
+
+
+class AdaptiveConcurrencyMiddleware:
+    """按接口自适应调整下载槽并发（AIMD，见 concurrency.py）
+
+    tzxm 接口的请求按URL归入 ``list_api``、``detail_api``、``download_api`` 三个下载槽，
+    每个响应的延迟、HTTP状态（429/5xx）和JSON中的 ``code`` 交给对应接口的控制器，
+    只有限流和服务端错误（HTTP 429/5xx、``SYS.429``/``SYS.5xx``）和超时按拥塞处理，
+    项目不存在（``SYS.404``）等业务code是正常响应。控制器算出的并发上限直接写回下载槽。需排在 RetryMiddleware（550）之后，
+    在重试之前看到429/5xx响应。附件由 AttachmentDownloadPipeline 下载，共享 download_api 的控制器。
+    """
+
+    CONGESTION_EXCEPTIONS = (TimeoutError, TCPTimedOutError, ConnectionRefusedError)
+
+    def __init__(self, crawler, log_interval=30.0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.log_interval = log_interval
+        self.endpoints = ()
+        self.log_loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        middleware = cls(crawler, log_interval=crawler.settings.getfloat('ADAPTIVE_CONCURRENCY_LOG_INTERVAL', 30.0))
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        self.endpoints = api_endpoints(spider)
+        for _, endpoint in self.endpoints:
+            self.record(endpoint, get_controller(self.crawler, endpoint))
+        if self.log_interval > 0:
+            self.log_loop = task.LoopingCall(self.log, spider)
+            self.log_loop.start(self.log_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.log_loop is not None and self.log_loop.running:
+            self.log_loop.stop()
+        self.log(spider)
+
+    def process_request(self, request, spider):
+        endpoint = match_endpoint(request.url, self.endpoints)
+        if endpoint is not None:
+            request.meta.setdefault('download_slot', endpoint)
+            self.apply(request, get_controller(self.crawler, endpoint))
+        return None
+
+    def process_response(self, request, response, spider):
+        endpoint = match_endpoint(request.url, self.endpoints)
+        if endpoint is None:
+            return response
+        controller = get_controller(self.crawler, endpoint)
+        reason = None
+        if response.headers.get('cf-mitigated') == b'challenge':
+            # Cloudflare验证页（cookies失效）不是服务端过载，由爬虫刷新cookies
+            pass
+        elif response.status == 429 or response.status >= 500:
+            reason = f'http {response.status}'
+        elif endpoint != 'download_api' and response.status == 200:
+            code = api_code(response.body)
+            if code is not None and is_congestion_code(code):
+                reason = f'code {code}'
+
+        if reason is not None:
+            changed = controller.on_congestion()
+        else:
+            changed = controller.on_success(request.meta.get('download_latency'))
+        if changed:
+            self.changed(endpoint, controller, reason, spider)
+        self.apply(request, controller)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        endpoint = match_endpoint(request.url, self.endpoints)
+        if endpoint is None or not isinstance(exception, self.CONGESTION_EXCEPTIONS):
+            return None
+        controller = get_controller(self.crawler, endpoint)
+        if controller.on_congestion():
+            self.changed(endpoint, controller, type(exception).__name__, spider)
+        self.apply(request, controller)
+        return None
+
+    def apply(self, request, controller):
+        """把并发上限写回下载槽；槽在空闲一段时间后会被回收重建，每次都重新写入"""
+        slot = self.crawler.engine.downloader.slots.get(request.meta.get('download_slot'))
+        if slot is not None and slot.concurrency != controller.limit:
+            slot.concurrency = controller.limit
+
+    def changed(self, endpoint, controller, reason, spider):
+        self.record(endpoint, controller)
+        if reason is not None:
+            spider.logger.info(f"{endpoint} 拥塞（{reason}），并发降为 {controller.limit}")
+        else:
+            spider.logger.debug(f"{endpoint} 并发升为 {controller.limit}")
+
+    def record(self, endpoint, controller):
+        self.stats.set_value(f'adaptive_concurrency/{endpoint}/limit', controller.limit)
+        self.stats.max_value(f'adaptive_concurrency/{endpoint}/max_limit', controller.limit)
+        self.stats.set_value(f'adaptive_concurrency/{endpoint}/congestion', controller.congestions)
+        self.stats.set_value(f'adaptive_concurrency/{endpoint}/decreases', controller.decreases)
+
+    def log(self, spider):
+        parts = []
+        for endpoint, controller in sorted(controllers(self.crawler).items()):
+            self.record(endpoint, controller)
+            latency = f'{controller.last_latency:.3f}s' if controller.last_latency is not None else '-'
+            parts.append(f'{endpoint}={controller.limit} (延迟 {latency}, 拥塞 {controller.congestions})')
+        if parts:
+            spider.logger.info(f"自适应并发: {', '.join(parts)}")
+
+
+class RetryLater(IgnoreRequest):
+    """请求已推迟，到时由 ResilientRetryMiddleware 重新交给引擎调度；errback 收到时不应按失败处理"""
+
+
+class ResilientRetryMiddleware:
+    """统一重试：按接口的重试次数和重试预算、指数退避加抖动、熔断（取代 Scrapy 的 RetryMiddleware）
+
+    tzxm 接口（list_api、detail_api）和 FlareSolverr 调用按接口分别计数：
+    - HTTP状态在 RETRY_HTTP_CODES 中、异常在 RETRY_EXCEPTIONS 中，或接口返回的 code 不是 ``SYS.200``
+      （RETRY_PERMANENT_API_CODES 中的除外）时重试；响应带 Retry-After 时至少推迟该时长
+    - 每次重试按 backoff_delay 推迟，并消耗接口的重试预算，预算用完时不再重试
+    - 熔断器断开时该接口的请求推迟到恢复探测时，半开时只放行一个探测请求
+    中间件里不等待：需要推迟的请求以 RetryLater 结束本次下载，到时再由引擎调度，等待期间不占下载器的并发；
+    还有推迟的请求时爬虫不会因空闲关闭。FlareSolverr 调用由 engine.download 直接发出、调用方在等结果，
+    无法重新调度，重试不退避，熔断时直接失败。
+    HTTP 429 只重试不计入熔断；Cloudflare验证页（cookies失效）由爬虫刷新cookies，这里不重试也不计入失败。
+    其他请求（如项目页面）按 RETRY_TIMES 重试，不经过预算和熔断。
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_retry_times = settings.getint('RETRY_TIMES')
+        self.priority_adjust = settings.getint('RETRY_PRIORITY_ADJUST')
+        self.retry_http_codes = set(settings.getlist('RETRY_HTTP_CODES'))
+        self.retry_exceptions = tuple(
+            load_object(exception) if isinstance(exception, str) else exception
+            for exception in settings.getlist('RETRY_EXCEPTIONS')
+        )
+        self.permanent_codes = set(settings.getlist('RETRY_PERMANENT_API_CODES'))
+        self.endpoint_retries = settings.getdict('RETRY_ENDPOINTS')
+        self.backoff_base = settings.getfloat('RETRY_BACKOFF_BASE', 1.0)
+        self.backoff_max = settings.getfloat('RETRY_BACKOFF_MAX', 60.0)
+        self.flaresolverr_url = settings.get('FLARESOLVERR_URL')
+        self.endpoints = ()
+        self.delayed = set()
+        self.budgets = {}
+        self.breakers = {}
+        for endpoint in ('list_api', 'detail_api', 'flaresolverr'):
+            self.budgets[endpoint] = get_budget(crawler, endpoint)
+            self.breakers[endpoint] = get_breaker(crawler, endpoint)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('RETRY_ENABLED'):
+            raise NotConfigured
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        extra = [(self.flaresolverr_url, 'flaresolverr')] if self.flaresolverr_url else []
+        self.endpoints = tuple(
+            (prefix, endpoint) for prefix, endpoint in api_endpoints(spider, *extra) if endpoint in self.breakers
+        )
+
+    def spider_idle(self, spider):
+        if self.delayed:
+            raise DontCloseSpider
+
+    def spider_closed(self, spider):
+        if self.delayed:
+            spider.logger.warning(f"爬虫关闭，丢弃 {len(self.delayed)} 个推迟中的请求")
+        for call in self.delayed:
+            call.cancel()
+        self.delayed.clear()
+
+    def process_request(self, request, spider):
+        endpoint = match_endpoint(request.url, self.endpoints)
+        if endpoint is None:
+            return None
+        wait, probe = self.breakers[endpoint].acquire()
+        if wait > 0:
+            self.stats.inc_value(f'circuit_breaker/{endpoint}/deferred')
+            if endpoint == 'flaresolverr':
+                raise IgnoreRequest(f'{endpoint} 熔断中')
+            # 调度器已见过这个请求，重新调度时跳过去重
+            self.reschedule(request.replace(dont_filter=True), wait)
+        request.meta['breaker_probe'] = probe
+        if not request.meta.get('retry_times'):
+            self.budgets[endpoint].deposit()
+        return None
+
+    def process_response(self, request, response, spider):
+        endpoint = match_endpoint(request.url, self.endpoints)
+        if response.headers.get('cf-mitigated') == b'challenge':
+            return response
+
+        reason = None
+        if response.status in self.retry_http_codes:
+            reason = f'http {response.status}'
+        elif endpoint in ('list_api', 'detail_api') and response.status == 200:
+            code = api_code(response.body)
+            if code is not None and code != 'SYS.200' and code not in self.permanent_codes:
+                reason = f'code {code}'
+
+        if endpoint is not None:
+            # 429是限流而不是故障，由退避和自适应并发处理，不计入熔断
+            self.record(endpoint, request, reason is None or response.status == 429, spider)
+        if reason is None or request.meta.get('dont_retry'):
+            return response
+        retry_request = self.retry(request, reason, endpoint, spider, self.retry_after(response))
+        return retry_request or response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, self.retry_exceptions):
+            return None
+        endpoint = match_endpoint(request.url, self.endpoints)
+        if endpoint is not None:
+            self.record(endpoint, request, False, spider)
+        if request.meta.get('dont_retry'):
+            return None
+        return self.retry(request, exception, endpoint, spider)
+
+    def record(self, endpoint, request, success, spider):
+        breaker = self.breakers[endpoint]
+        state = breaker.record(success, probe=request.meta.get('breaker_probe', False))
+        if state == CircuitBreaker.OPEN:
+            self.stats.inc_value(f'circuit_breaker/{endpoint}/opened')
+            spider.logger.warning(
+                f"{endpoint} 熔断：最近失败率 {breaker.failure_rate():.0%}，暂停 {breaker.open_seconds:.0f} 秒后探测"
+            )
+        elif state == CircuitBreaker.CLOSED:
+            spider.logger.info(f"{endpoint} 探测成功，恢复请求")
+
+    def retry(self, request, reason, endpoint, spider, retry_after=None):
+        """退避时间后重新调度重试请求（抛出 RetryLater）；次数或预算用完时返回None"""
+        retries = request.meta.get('retry_times', 0)
+        if endpoint is None:
+            max_retry_times = request.meta.get('max_retry_times', self.max_retry_times)
+        else:
+            max_retry_times = self.endpoint_retries.get(endpoint, {}).get('max_retries', self.max_retry_times)
+            if retries < max_retry_times and not self.budgets[endpoint].withdraw():
+                self.stats.inc_value(f'retry/budget_exhausted/{endpoint}')
+                spider.logger.warning(f"{endpoint} 重试预算已用完，放弃 {request.url}: {reason}")
+                return None
+
+        retry_request = get_retry_request(
+            request,
+            spider=spider,
+            reason=reason,
+            max_retry_times=max_retry_times,
+            priority_adjust=self.priority_adjust,
+        )
+        if retry_request is None:
+            return None
+        retry_request.meta.pop('breaker_probe', None)
+        delay = backoff_delay(retries, self.backoff_base, self.backoff_max)
+        if retry_after:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        if delay > 0 and endpoint != 'flaresolverr':
+            self.reschedule(retry_request, delay)
+        return retry_request
+
+    def reschedule(self, request, delay):
+        """delay 秒后把请求交给引擎重新调度，本次下载以 RetryLater 结束"""
+        # 模块级导入会在 Scrapy 安装 asyncio reactor 之前装上默认 reactor
+        from twisted.internet import reactor
+
+        def crawl():
+            self.delayed.discard(call)
+            self.crawler.engine.crawl(request)
+
+        call = reactor.callLater(delay, crawl)
+        self.delayed.add(call)
+        raise RetryLater(f'{delay:.1f} 秒后重新调度 {request.url}')
+
+    @staticmethod
+    def retry_after(response):
+        try:
+            return float(response.headers.get('Retry-After', b'').decode())
+        except ValueError:
+            return None
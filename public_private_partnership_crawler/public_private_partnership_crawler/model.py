@@ -1,11 +1,25 @@
-from sqlalchemy import create_engine, Column, String, Integer, DECIMAL, TEXT, DATETIME, Boolean, ForeignKey, Date
+from sqlalchemy import create_engine, inspect, text, Column, String, Integer, DECIMAL, TEXT, DATETIME, Boolean, ForeignKey, Date
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.schema import CreateIndex, CreateTable
 import logging
 
 Base = declarative_base()
 
 
+def create_db_engine(db_settings, **kwargs):
+    """根据 DATABASE 配置创建数据库引擎，配置了 url 时直接使用（如本地测试用的 sqlite:///）"""
+    if db_settings.get('url'):
+        if db_settings['url'].startswith('sqlite'):
+            # SQLite 不支持连接池大小等参数
+            kwargs = {k: v for k, v in kwargs.items() if not k.startswith('pool_') and k != 'max_overflow'}
+        return create_engine(db_settings['url'], **kwargs)
+    return create_engine(
+        f"mysql+pymysql://{db_settings['user']}:{db_settings['password']}@{db_settings['host']}:{db_settings['port']}/{db_settings['database']}?charset={db_settings.get('charset', 'utf8mb4')}",
+        **kwargs
+    )
+
+
 class FranchiseProject(Base):
     __tablename__ = 'franchise_projects'
 
@@ -110,6 +124,9 @@ class FranchiseProject(Base):
     create_time = Column(DATETIME, comment='创建时间')
     update_time = Column(DATETIME, comment='更新时间', index=True)
     crawl_time = Column(DATETIME, comment='爬取时间', index=True)
+    # 内容变化检测：业务字段哈希未变化的项目重新抓取时只更新 last_seen_time
+    content_hash = Column(String(32), comment='业务字段内容哈希')
+    last_seen_time = Column(DATETIME, comment='最近一次抓取到的时间')
 
     # 关联附件
     attachments = relationship('FranchiseAttachment', back_populates='project', cascade='all, delete-orphan')
@@ -129,6 +146,7 @@ class FranchiseAttachment(Base):
     original_filename = Column(String(500), comment='原始文件名')
     content_type = Column(String(200), comment='文件MIME类型')
     file_size = Column(Integer, comment='文件大小（字节）')
+    file_hash = Column(String(64), comment='文件内容SHA-256（本地存储文件名）', index=True)
 
     # 文件下载链接（不存储内容，只存储下载链接）
     download_url = Column(String(1000), comment='文件下载链接')
@@ -141,4 +159,149 @@ class FranchiseAttachment(Base):
     is_downloaded = Column(Boolean, default=False, comment='是否已下载')
     download_time = Column(DATETIME, comment='下载时间')
 
-    project = relationship('FranchiseProject', back_populates='attachments')
\ No newline at end of file
+    project = relationship('FranchiseProject', back_populates='attachments')
+
+
+class FranchiseProjectRollup(Base):
+    """项目汇总表：按 省份/行业/实施模式/阶段 分组的项目数和投资合计，由存储管道随项目写入增量维护（见 rollup.py）
+
+    维度为空的项目计入空字符串分组；项目全部移出后分组保留为0行。
+    """
+    __tablename__ = 'franchise_project_rollups'
+
+    province_code = Column(String(10), primary_key=True, default='', comment='省份代码')
+    industry_code = Column(String(20), primary_key=True, default='', comment='所属行业代码')
+    exec_mode = Column(String(10), primary_key=True, default='', comment='实施模式代码')
+    project_stage = Column(String(10), primary_key=True, default='', comment='进行阶段代码')
+
+    project_count = Column(Integer, nullable=False, default=0, comment='项目数')
+    total_investment = Column(DECIMAL(22, 4), nullable=False, default=0, comment='总投资合计（万元）')
+    expected_private_capital = Column(DECIMAL(22, 4), nullable=False, default=0, comment='预计民间投资合计（万元）')
+
+
+# 二级索引集合（DB_INDEX_SET）：
+# - none：只有主键和唯一索引
+# - model：模型中 index=True 的全部单列索引
+# - curated：按实际查询方式整理的组合索引
+INDEX_SETS = ('none', 'model', 'curated')
+
+CURATED_INDEXES = {
+    'franchise_projects': (
+        ('ix_fp_province_industry_stage', ('province_code', 'industry_code', 'project_stage')),
+        ('ix_fp_province_city_county', ('province_code', 'city_code', 'county_code')),
+        ('ix_fp_exec_mode_stage', ('exec_mode', 'project_stage')),
+        ('ix_fp_industry_investment', ('industry_code', 'total_investment')),
+        ('ix_fp_update_time', ('update_time',)),
+        ('ix_fp_project_code', ('project_code',)),
+    ),
+    'franchise_attachments': (
+        # 外键列上的索引
+        ('ix_fa_project_id', ('project_id',)),
+        ('ix_fa_file_hash', ('file_hash',)),
+    ),
+}
+
+# MySQL 中 TEXT 列只能建前缀索引，utf8mb4 下191字符不超过767字节的索引长度限制
+TEXT_INDEX_PREFIX = 191
+
+
+def index_specs(table, index_set='model'):
+    """表的非唯一二级索引 [(索引名, 列名元组)]"""
+    if index_set not in INDEX_SETS:
+        raise ValueError(f"Unsupported DB_INDEX_SET: {index_set}")
+    if index_set == 'none':
+        return []
+    if index_set == 'curated':
+        return list(CURATED_INDEXES.get(table.name, ()))
+    return sorted((index.name, tuple(column.name for column in index.columns))
+                  for index in table.indexes if not index.unique)
+
+
+def _index_columns(engine, table, columns):
+    preparer = engine.dialect.identifier_preparer
+    parts = []
+    for name in columns:
+        part = preparer.quote(name)
+        if engine.dialect.name == 'mysql' and isinstance(table.c[name].type, TEXT):
+            part += f'({TEXT_INDEX_PREFIX})'
+        parts.append(part)
+    return ', '.join(parts)
+
+
+def create_schema(engine, index_set='model', defer_indexes=False):
+    """创建缺失的表
+
+    主键和唯一索引随表创建（upsert依赖唯一键）；二级索引按 index_set 创建。
+    defer_indexes 为True时用于全量导入：不创建二级索引，并删除已有表上的二级索引，
+    导入完成后调用 build_indexes 一次性建立。
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if inspector.has_table(table.name):
+                _add_missing_columns(conn, inspector, table)
+                continue
+            conn.execute(CreateTable(table))
+            for index in table.indexes:
+                if index.unique:
+                    conn.execute(CreateIndex(index))
+    if defer_indexes:
+        return drop_indexes(engine)
+    return build_indexes(engine, index_set)
+
+
+def _add_missing_columns(conn, inspector, table):
+    """已有表补上模型中新增的列（如 file_hash），新增列均可为空，索引由 build_indexes 补建"""
+    existing = {column['name'] for column in inspector.get_columns(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    for column in table.columns:
+        if column.name in existing:
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} '
+                          f'ADD COLUMN {preparer.quote(column.name)} {column_type}'))
+
+
+def drop_indexes(engine):
+    """删除全部表上的非唯一二级索引（外键依赖的索引除外），返回删除的索引数"""
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    dropped = 0
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            foreign_keys = {tuple(fk['constrained_columns']) for fk in inspector.get_foreign_keys(table.name)}
+            for index in inspector.get_indexes(table.name):
+                if index['unique'] or tuple(index['column_names']) in foreign_keys:
+                    continue
+                if engine.dialect.name == 'mysql':
+                    conn.execute(text(f"DROP INDEX {preparer.quote(index['name'])} ON {preparer.format_table(table)}"))
+                else:
+                    conn.execute(text(f"DROP INDEX {preparer.quote(index['name'])}"))
+                dropped += 1
+    return dropped
+
+
+def build_indexes(engine, index_set='model'):
+    """建立 index_set 中缺失的二级索引，返回新建的索引数
+
+    MySQL 上每张表合并为一条 ``ALTER TABLE ... ADD INDEX ..., ADD INDEX ...``，只扫描一遍表数据。
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    created = 0
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            missing = [(name, columns) for name, columns in index_specs(table, index_set) if name not in existing]
+            if not missing:
+                continue
+            if engine.dialect.name == 'mysql':
+                clauses = ', '.join(f'ADD INDEX {preparer.quote(name)} ({_index_columns(engine, table, columns)})'
+                                    for name, columns in missing)
+                conn.execute(text(f'ALTER TABLE {preparer.format_table(table)} {clauses}'))
+            else:
+                for name, columns in missing:
+                    conn.execute(text(f'CREATE INDEX {preparer.quote(name)} ON {preparer.format_table(table)} '
+                                      f'({_index_columns(engine, table, columns)})'))
+            created += len(missing)
+    return created
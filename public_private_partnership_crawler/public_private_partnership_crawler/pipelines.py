@@ -8,200 +8,782 @@ import pymysql
 from datetime import datetime
 import logging
 from public_private_partnership_crawler.items import FranchiseProjectItem, FranchiseAttachmentItem
+from public_private_partnership_crawler.dedup import MemoryDedupStore, BloomDedupStore
+from public_private_partnership_crawler.schema import ContentHasher, ItemSchema, arrow_schema
+from public_private_partnership_crawler.metrics import MetricsRegistry, MetricsResource
+from public_private_partnership_crawler import signals as ppp_signals
+from public_private_partnership_crawler.concurrency import get_controller
+from public_private_partnership_crawler.resilience import CircuitBreaker, backoff_delay, get_breaker, get_budget
+from public_private_partnership_crawler.storage import backend_for, storage_backend
+from public_private_partnership_crawler.rollup import RollupDelta, clear, needs_rebuild, rebuild, rollup_values, stored_values
+from public_private_partnership_crawler.search import SearchIndex, document
 from model import *
+import collections
 import datetime
+import functools
+import hashlib
+import json
 import os
-import pandas as pd
+import re
+import threading
+import time
+import requests
+from decimal import Decimal
+from scrapy import signals
+from scrapy.exceptions import DropItem, IgnoreRequest, NotConfigured
+from sqlalchemy import select, update
+from twisted.internet import defer, reactor, task, threads
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+from twisted.web.server import Site
+from urllib.parse import unquote
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 
 class PublicPrivatePartnershipCrawlerPipeline:
-    """JSON文件存储管道"""
+    """JSON文件存储管道 - 流式写入
+
+    每个item到达时序列化为一行追加到缓冲区，达到条数或时间阈值后写入
+    ``tmp/<spider>/json/<ts>.jsonl.part``；爬虫结束时原子重命名为正式文件。
+    中途崩溃时 ``.part`` 文件中已落盘的行仍然是完整可用的JSON Lines。
+    """
 
-    def __init__(self):
-        self.df = pd.DataFrame()
-        self.src_path = r'./tmp/{}/json/{}.json'
+    def __init__(self, export_format='jsonl', flush_items=100, flush_interval=5.0):
+        if export_format not in ('jsonl', 'json'):
+            raise ValueError(f"Unsupported JSON_EXPORT_FORMAT: {export_format}")
+        self.export_format = export_format
+        self.flush_items = flush_items
+        self.flush_interval = flush_interval
+        self.src_path = r'./tmp/{}/json/{}.{}'
         self.time = datetime.datetime.now().strftime('%Y-%m-%dT%H_%M_%S')
+        self.file = None
+        self.path = None
+        self.buffer = []
+        self.items_written = 0
+        self.last_flush = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            export_format=settings.get('JSON_EXPORT_FORMAT', 'jsonl'),
+            flush_items=settings.getint('JSON_EXPORT_FLUSH_ITEMS', 100),
+            flush_interval=settings.getfloat('JSON_EXPORT_FLUSH_INTERVAL', 5.0),
+        )
 
     def open_spider(self, spider):
-        path = self.src_path.format(spider.name, self.time)
-        if not os.path.exists('./tmp'):
-            os.mkdir('./tmp')
-        if not os.path.exists('./tmp/{}'.format(spider.name)):
-            os.mkdir('./tmp/{}'.format(spider.name))
-        if not os.path.exists('./tmp/{}/json'.format(spider.name)):
-            os.mkdir('./tmp/{}/json'.format(spider.name))
+        self.path = self.src_path.format(spider.name, self.time, self.export_format)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.file = open(self.path + '.part', 'w', encoding='utf-8')
+        if self.export_format == 'json':
+            self.file.write('[')
 
     def process_item(self, item, spider):
-        line = pd.DataFrame([item])
-        self.df = pd.concat([self.df, line], ignore_index=True)
+        line = json.dumps(ItemAdapter(item).asdict(), ensure_ascii=False, default=_json_default)
+        if self.export_format == 'json' and (self.items_written or self.buffer):
+            line = ',\n' + line
+        elif self.export_format == 'jsonl':
+            line += '\n'
+        self.buffer.append(line)
+
+        if len(self.buffer) >= self.flush_items or time.monotonic() - self.last_flush >= self.flush_interval:
+            self._flush()
         return item
 
+    def _flush(self):
+        """将缓冲区写入磁盘"""
+        if self.buffer:
+            self.file.write(''.join(self.buffer))
+            self.items_written += len(self.buffer)
+            self.buffer = []
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_flush = time.monotonic()
+
     def close_spider(self, spider):
-        src_path = self.src_path.format(spider.name, self.time)
-        self.df.to_json(src_path, orient='records', ensure_ascii=False, indent=2)
+        self._flush()
+        if self.export_format == 'json':
+            self.file.write(']')
+            self._flush()
+        self.file.close()
+        # 写入完成后再替换为正式文件名，保证读者不会看到半截文件
+        os.replace(self.path + '.part', self.path)
+        spider.logger.info(f"JSON导出完成: {self.path} ({self.items_written} 条)")
 
 
-class DataValidationPipeline:
-    """数据验证管道"""
+def _json_default(value):
+    """JSON序列化无法直接处理的类型"""
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class AttachmentDownloadPipeline:
+    """附件下载管道
+
+    在独立的有界线程池中以流式方式把附件写入磁盘，不在内存中保存整个文件。
+    文件只按内容SHA-256命名（``<store>/ab/abcd...``，不带扩展名），不同项目或不同文件名引用的相同内容只保存一份，
+    原始文件名和MIME类型记在item（附件表）中；
+    下载中断时保留 ``partial/<attachment_id>.part``，下次以Range请求续传。
+    下载完成后回填 file_size、content_type、original_filename、file_hash、is_downloaded、download_time。
+
+    启用自适应并发时，同时进行的下载数由 download_api 的AIMD控制器决定（与 AdaptiveConcurrencyMiddleware
+    共享），首字节延迟、429/5xx 和超时作为拥塞信号；线程池大小取控制器的并发上限。
+
+    下载不经过Scrapy下载器，重试策略在这里按 ResilientRetryMiddleware 的规则执行：download_api 的重试次数
+    （RETRY_ENDPOINTS）、重试预算、指数退避和熔断器（get_budget/get_breaker），429 只重试不计入熔断，
+    Cloudflare验证页既不重试也不计入失败。熔断器断开时排队的下载等到探测时再发出；探测失败（持续故障）后
+    断开期间的下载直接按失败处理，不让item长时间停在管道中。请求头（含clearance cookies）在每次下载开始时从爬虫读取。
+    """
+
+    CONGESTION_ERRORS = (requests.Timeout, requests.ConnectionError)
+    RETRY_ERRORS = CONGESTION_ERRORS + (requests.exceptions.ChunkedEncodingError,)
+
+    def __init__(self, store_dir, max_threads=4, timeout=120, chunk_size=64 * 1024, controller=None,
+                 budget=None, breaker=None, max_retries=0, retry_http_codes=(), backoff_base=1.0, backoff_max=60.0):
+        self.store_dir = store_dir
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.controller = controller
+        if controller is not None:
+            max_threads = controller.maximum
+        self.max_threads = max_threads
+        self.budget = budget
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.retry_http_codes = set(retry_http_codes)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=max_threads, name='AttachmentDownloadPipeline')
+        self.local = threading.local()
+        self.store = None
+        # (deferred, item, spider, 已重试次数)
+        self.pending = collections.deque()
+        self.active = 0
+        self.wakeup = None
+        self.delayed = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        controller = budget = breaker = None
+        if settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            controller = get_controller(crawler, 'download_api')
+        max_retries = 0
+        if settings.getbool('RETRY_ENABLED'):
+            budget = get_budget(crawler, 'download_api')
+            breaker = get_breaker(crawler, 'download_api')
+            max_retries = settings.getdict('RETRY_ENDPOINTS').get('download_api', {}).get(
+                'max_retries', settings.getint('RETRY_TIMES'))
+        return cls(
+            settings.get('ATTACHMENT_STORE', './tmp/{}/attachments'),
+            max_threads=settings.getint('ATTACHMENT_DOWNLOAD_THREADS', 4),
+            timeout=settings.getfloat('ATTACHMENT_DOWNLOAD_TIMEOUT', 120),
+            controller=controller,
+            budget=budget,
+            breaker=breaker,
+            max_retries=max_retries,
+            retry_http_codes=settings.getlist('RETRY_HTTP_CODES'),
+            backoff_base=settings.getfloat('RETRY_BACKOFF_BASE', 1.0),
+            backoff_max=settings.getfloat('RETRY_BACKOFF_MAX', 60.0),
+        )
+
+    def open_spider(self, spider):
+        self.store = self.store_dir.format(spider.name)
+        os.makedirs(os.path.join(self.store, 'partial'), exist_ok=True)
+        self.threadpool.start()
+
+    def close_spider(self, spider):
+        for call in self.delayed | ({self.wakeup} if self.wakeup is not None else set()):
+            if call.active():
+                call.cancel()
+        self.delayed.clear()
+        self.wakeup = None
+        self.threadpool.stop()
 
     def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
+        if not isinstance(item, FranchiseAttachmentItem) or not item.get('download_url'):
+            return item
+
+        d = defer.Deferred()
+        if self.budget is not None:
+            self.budget.deposit()
+        self.pending.append((d, item, spider, 0))
+        self._start_downloads()
+        d.addCallback(self._downloaded, item, spider)
+        d.addErrback(self._failed, item, spider)
+        return d
+
+    def _start_downloads(self):
+        """在并发上限内启动排队的下载；熔断器断开时到可以探测时再启动"""
+        limit = self.controller.limit if self.controller is not None else self.max_threads
+        while self.pending and self.active < limit:
+            probe = False
+            if self.breaker is not None:
+                wait, probe = self.breaker.acquire()
+                if wait > 0 and self._outage():
+                    # 持续故障时直接失败，不让item在管道中等待；.part文件保留，下次运行续传
+                    d, item, spider, retries = self.pending.popleft()
+                    spider.crawler.stats.inc_value('circuit_breaker/download_api/rejected')
+                    d.errback(IgnoreRequest('download_api 熔断中'))
+                    continue
+                if wait > 0:
+                    # 等到可以探测（或探测返回）时再启动
+                    if self.wakeup is None:
+                        self.wakeup = reactor.callLater(wait, self._wake)
+                    return
+            d, item, spider, retries = self.pending.popleft()
+            self.active += 1
+            headers = spider.api_headers() if hasattr(spider, 'api_headers') else {}
+            download = threads.deferToThreadPool(reactor, self.threadpool, self._download, item, headers)
+            download.addBoth(self._download_finished, d, item, spider, retries, probe)
+
+    def _outage(self):
+        """熔断器断开且至少一次探测已失败（暂停时间已加倍）"""
+        breaker = self.breaker
+        return breaker.state == CircuitBreaker.OPEN and breaker.open_seconds > breaker.base_open_seconds
+
+    def _wake(self):
+        self.wakeup = None
+        self._start_downloads()
+
+    def _download_finished(self, result, d, item, spider, retries, probe):
+        self.active -= 1
+        error = result.value if isinstance(result, Failure) else None
+        if self.controller is not None:
+            if error is None:
+                self.controller.on_success(result['latency'])
+            elif self._is_congestion(error):
+                self.controller.on_congestion()
+        if self.breaker is not None and not self._is_challenge(error):
+            # 429是限流而不是故障，不计入熔断
+            self._record(error is None or self._status(error) == 429, probe, spider)
+
+        if error is not None and self._should_retry(error, retries, spider):
+            delay = backoff_delay(retries, self.backoff_base, self.backoff_max)
+            retry_after = self._retry_after(error)
+            if retry_after:
+                delay = max(delay, min(retry_after, self.backoff_max))
+            spider.crawler.stats.inc_value('attachment/retried')
+            spider.logger.debug(f"附件 {item['attachment_id']} {delay:.1f} 秒后第 {retries + 1} 次重试: {error}")
+
+            def requeue():
+                self.delayed.discard(call)
+                self.pending.appendleft((d, item, spider, retries + 1))
+                self._start_downloads()
+
+            call = reactor.callLater(delay, requeue)
+            self.delayed.add(call)
+        elif error is not None:
+            d.errback(result)
+        else:
+            d.callback(result)
+        self._start_downloads()
+
+    def _record(self, success, probe, spider):
+        state = self.breaker.record(success, probe=probe)
+        if state == CircuitBreaker.OPEN:
+            spider.crawler.stats.inc_value('circuit_breaker/download_api/opened')
+            spider.logger.warning(f"download_api 熔断：最近失败率 {self.breaker.failure_rate():.0%}，"
+                                  f"暂停 {self.breaker.open_seconds:.0f} 秒后探测")
+        elif state == CircuitBreaker.CLOSED:
+            spider.logger.info("download_api 探测成功，恢复下载")
+
+    def _should_retry(self, error, retries, spider):
+        if retries >= self.max_retries or self._is_challenge(error):
+            return False
+        if not (isinstance(error, self.RETRY_ERRORS) or self._status(error) in self.retry_http_codes):
+            return False
+        if self.budget is not None and not self.budget.withdraw():
+            spider.crawler.stats.inc_value('retry/budget_exhausted/download_api')
+            return False
+        return True
+
+    @staticmethod
+    def _status(error):
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code
+        return None
+
+    @classmethod
+    def _is_challenge(cls, error):
+        return cls._status(error) is not None and error.response.headers.get('cf-mitigated') == 'challenge'
+
+    @classmethod
+    def _retry_after(cls, error):
+        if cls._status(error) is None:
+            return None
+        try:
+            return float(error.response.headers.get('Retry-After', ''))
+        except ValueError:
+            return None
+
+    def _is_congestion(self, error):
+        status = self._status(error)
+        if status is not None:
+            return status == 429 or status >= 500
+        return isinstance(error, self.CONGESTION_ERRORS)
+
+    def _session(self):
+        """每个下载线程使用自己的requests会话"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        return session
+
+    def _download(self, item, headers):
+        """流式下载到 .part 文件，支持续传，完成后按内容哈希归档"""
+        part_path = os.path.join(self.store, 'partial', f"{item['attachment_id']}.part")
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {k: v for k, v in headers.items() if k != 'Content-Type'}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+
+        digest = hashlib.sha256()
+        started = time.monotonic()
+        with self._session().get(item['download_url'], headers=headers, stream=True, timeout=self.timeout) as response:
+            latency = time.monotonic() - started
+            # 416表示.part已是完整文件
+            if response.status_code != 416:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    # 服务端不支持Range，从头下载
+                    offset = 0
+                if offset:
+                    with open(part_path, 'rb') as f:
+                        for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                            digest.update(chunk)
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for chunk in response.iter_content(self.chunk_size):
+                        f.write(chunk)
+                        digest.update(chunk)
+            else:
+                with open(part_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                        digest.update(chunk)
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+            original_filename = _filename_from_disposition(response.headers.get('Content-Disposition', ''))
+
+        file_hash = digest.hexdigest()
+        final_path = os.path.join(self.store, file_hash[:2], file_hash)
+        if os.path.exists(final_path):
+            os.remove(part_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(part_path, final_path)
+
+        return {
+            'file_hash': file_hash,
+            'file_size': os.path.getsize(final_path),
+            'content_type': content_type or None,
+            'original_filename': original_filename,
+            'latency': latency,
+        }
+
+    def _downloaded(self, result, item, spider):
+        result.pop('latency', None)
+        item.update(result)
+        item['is_downloaded'] = True
+        item['download_time'] = datetime.datetime.now()
+        spider.crawler.stats.inc_value('attachment/downloaded')
+        spider.crawler.stats.inc_value('attachment/bytes', result['file_size'])
+        return item
+
+    def _failed(self, failure, item, spider):
+        # 下载失败不影响附件元数据入库，.part文件保留用于下次续传
+        spider.logger.warning(f"附件下载失败 {item['attachment_id']}: {failure.value}")
+        spider.crawler.stats.inc_value('attachment/failed')
+        item['is_downloaded'] = False
+        return item
+
 
+def _filename_from_disposition(value):
+    """从Content-Disposition中解析原始文件名"""
+    match = re.search(r"filename\*=[\w-]+''([^;]+)", value)
+    if match:
+        return unquote(match.group(1).strip())
+    match = re.search(r'filename="?([^";]+)"?', value)
+    if not match:
+        return None
+    name = match.group(1).strip()
+    try:
+        # requests按latin-1解码响应头，服务端实际多为UTF-8
+        name = name.encode('latin-1').decode('utf-8')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        pass
+    return unquote(name)
+
+
+class DataValidationPipeline:
+    """数据验证管道
+
+    字段转换表由 FranchiseProject 的列类型和长度编译而来（见 schema.ItemSchema），
+    DECIMAL列转换为精确的Decimal，字符串按列长度截断。
+    """
+
+    project_schema = ItemSchema(FranchiseProject, FranchiseProjectItem)
+
+    def process_item(self, item, spider):
         if isinstance(item, FranchiseProjectItem):
             # 验证必需字段
-            if not adapter.get('project_id'):
+            if not item.get('project_id'):
                 raise ValueError("project_id is required")
-            if not adapter.get('project_name'):
+            if not item.get('project_name'):
                 raise ValueError("project_name is required")
 
             # 数据类型转换和验证
-            self._validate_and_convert_project_item(adapter, spider)
+            try:
+                self.project_schema.convert(item, spider.logger)
+            except Exception as e:
+                spider.logger.error(f"数据验证出错: {e}")
+                raise
 
         elif isinstance(item, FranchiseAttachmentItem):
             # 验证附件必需字段
-            if not adapter.get('attachment_id'):
+            if not item.get('attachment_id'):
                 raise ValueError("attachment_id is required")
-            if not adapter.get('project_id'):
+            if not item.get('project_id'):
                 raise ValueError("project_id is required")
 
         return item
 
-    def _validate_and_convert_project_item(self, adapter, spider):
-        """验证和转换项目数据"""
-        try:
-            # 转换数值字段
-            numeric_fields = [
-                'total_investment', 'expected_private_capital', 'expected_project_capital',
-                'gov_invest_ratio', 'gov_share_ratio', 'gov_invest_capital',
-                'subsidy_limit', 'private_share_ratio'
-            ]
-
-            for field in numeric_fields:
-                value = adapter.get(field)
-                if value is not None and value != '':
-                    try:
-                        adapter[field] = float(value)
-                    except (ValueError, TypeError):
-                        adapter[field] = 0.0
-                        spider.logger.warning(f"无法转换字段 {field} 的值: {value}")
-                else:
-                    adapter[field] = 0.0
-
-            # 转换整数字段
-            integer_fields = ['franchise_period']
-            for field in integer_fields:
-                value = adapter.get(field)
-                if value is not None and value != '':
-                    try:
-                        adapter[field] = int(float(value))
-                    except (ValueError, TypeError):
-                        adapter[field] = 0
-                        spider.logger.warning(f"无法转换字段 {field} 的值: {value}")
-                else:
-                    adapter[field] = 0
-
-            # 转换布尔字段
-            boolean_fields = ['has_gov_subsidy', 'has_operation_subsidy',]
-            for field in boolean_fields:
-                value = adapter.get(field)
-                if isinstance(value, str):
-                    adapter[field] = value.lower() in ('1', 'true', 'yes', '是')
-                elif value is None:
-                    adapter[field] = False
-                else:
-                    adapter[field] = bool(value)
-
-            # 确保字符串字段长度限制
-            string_fields = {
-                'project_code': 100,
-                'project_name': 500,
-                'area_code': 50,
-                'province_code': 10,
-                'city_code': 10,
-                'county_code': 10,
-                'project_level': 10,
-                'industry_code': 20,
-                'project_type': 10,
-                'exec_mode': 10,
-                'verification_code': 20
-            }
-
-            for field, max_length in string_fields.items():
-                value = adapter.get(field, '')
-                if isinstance(value, str) and len(value) > max_length:
-                    adapter[field] = value[:max_length]
-                    spider.logger.warning(f"字段 {field} 长度超限，已截断")
 
-        except Exception as e:
-            spider.logger.error(f"数据验证出错: {e}")
-            raise
+class DatabasePipeline:
+    """数据库存储管道 - 优化版
+
+    数据库由存储后端提供（``DB_BACKEND``，见 storage.py），MySQL和SQLite共用 model.py 中的表结构。
+    默认逐条写入；开启 ``MYSQL_BULK_ENABLED`` 后先在内存中缓冲，
+    按条数、时间间隔或爬虫结束时合并为多行upsert（MySQL ``ON DUPLICATE KEY UPDATE``，SQLite ``ON CONFLICT``）。
+    写入失败的批次放回缓冲区随下一批重试，连续失败超过 ``MYSQL_BULK_RETRIES`` 次后丢弃，计入 ``db/failed_rows``。
+    开启 ``DB_BULK_LOAD`` 时写入期间只维护主键和唯一索引，爬虫结束后再一次性建立二级索引。
 
+    开启 ``CONTENT_HASH_ENABLED`` 时项目按业务字段的内容哈希判断是否变化：哈希与库中相同的项目不再
+    UPDATE整行，只更新 last_seen_time。库中的哈希逐条模式下按 project_id 查询，批量模式下每批一次
+    ``IN`` 查询；开启 ``CONTENT_HASH_PRELOAD`` 时启动时全部读入内存，之后不再查询。
 
-class MySQLPipeline:
-    """MySQL数据存储管道 - 优化版"""
+    开启 ``ROLLUP_ENABLED`` 时在同一事务中增量更新项目汇总表（见 rollup.py），启动时汇总表与项目表的合计不一致
+    或开启 ``ROLLUP_REBUILD`` 时全量重建；关闭时启动即清空汇总表，下次开启时重建。
+    """
 
-    def __init__(self, db_settings):
+    # 批量模式下的写入顺序：先项目后附件，保证外键可用
+    bulk_models = ((FranchiseProject, 'project_id'), (FranchiseAttachment, 'attachment_id'))
+
+    def __init__(self, db_settings, bulk_enabled=False, bulk_size=500, bulk_interval=10.0, index_set='model',
+                 bulk_load=False, change_detection=True, preload_hashes=False, backend=None,
+                 rollups=True, rebuild_rollups=False, bulk_retries=3):
+        if index_set not in INDEX_SETS:
+            raise ValueError(f"Unsupported DB_INDEX_SET: {index_set}")
         self.db_settings = db_settings
-        self.engine = create_engine(
-            f"mysql+pymysql://{db_settings['user']}:{db_settings['password']}@{db_settings['host']}:{db_settings['port']}/{db_settings['database']}?charset=utf8mb4",
-            pool_size=10,
-            max_overflow=20,
-            pool_pre_ping=True,
-            pool_recycle=3600
-        )
+        self.backend = backend if backend is not None else backend_for(db_settings)
+        self.index_set = index_set
+        self.bulk_load = bulk_load
+        self.hasher = ContentHasher(FranchiseProject, FranchiseProjectItem, exclude=('crawl_time',)) \
+            if change_detection else None
+        self.preload_hashes = preload_hashes
+        self.rollups = rollups
+        self.rebuild_rollups = rebuild_rollups
+        # project_id -> 库中的content_hash，只在开启预加载时使用
+        self.known_hashes = None
+        self.engine = self.backend.create_engine()
         self.Session = sessionmaker(bind=self.engine)
 
+        self.bulk_enabled = bulk_enabled
+        self.bulk_size = bulk_size
+        self.bulk_interval = bulk_interval
+        self.bulk_retries = bulk_retries
+        # 连续写入失败的次数，写入成功后清零
+        self.failed_flushes = 0
+        # 每张表一个缓冲区，以唯一键去重，同一批次内后到的数据覆盖先到的
+        self.buffers = {model: {} for model, _ in self.bulk_models}
+        self.flush_loop = None
+        self.crawler = None
+
     @classmethod
     def from_crawler(cls, crawler):
         """从crawler获取数据库配置"""
-        db_settings = crawler.settings.getdict("DATABASE")
-        return cls(db_settings)
+        pipeline = cls(crawler.settings.getdict("DATABASE"), **cls.settings_kwargs(crawler))
+        pipeline.crawler = crawler
+        return pipeline
+
+    @classmethod
+    def settings_kwargs(cls, crawler):
+        """设置 -> 构造参数（db_settings 除外），子类在此基础上增加自己的参数"""
+        settings = crawler.settings
+        return dict(
+            bulk_enabled=settings.getbool('MYSQL_BULK_ENABLED', False),
+            bulk_size=settings.getint('MYSQL_BULK_SIZE', 500),
+            bulk_interval=settings.getfloat('MYSQL_BULK_INTERVAL', 10.0),
+            bulk_retries=settings.getint('MYSQL_BULK_RETRIES', 3),
+            index_set=settings.get('DB_INDEX_SET', 'model'),
+            bulk_load=settings.getbool('DB_BULK_LOAD', False),
+            change_detection=settings.getbool('CONTENT_HASH_ENABLED', True),
+            preload_hashes=settings.getbool('CONTENT_HASH_PRELOAD', False),
+            backend=storage_backend(settings, crawler.spider.name),
+            rollups=settings.getbool('ROLLUP_ENABLED', True),
+            rebuild_rollups=settings.getbool('ROLLUP_REBUILD', False),
+        )
 
     def open_spider(self, spider):
         """爬虫开始时连接数据库"""
         try:
-            Base.metadata.create_all(self.engine)
-            spider.logger.info("Connected to MySQL database successfully")
+            dropped = create_schema(self.engine, self.index_set, defer_indexes=self.bulk_load)
+            if self.bulk_load:
+                spider.logger.info(f"Bulk load: secondary indexes deferred ({dropped} existing dropped)")
+            spider.logger.info(f"Connected to {self.backend.name} database successfully")
         except Exception as e:
-            spider.logger.error(f"Failed to connect to MySQL: {e}")
+            spider.logger.error(f"Failed to connect to {self.backend.name} database: {e}")
             raise
 
+        with self.engine.begin() as conn:
+            if not self.rollups:
+                # 本次写入不维护汇总表，清空后下次开启时由一致性检查触发重建，而不是留下过期的合计
+                if clear(conn):
+                    spider.logger.warning(
+                        "Rollups disabled: cleared project rollups until the next run with ROLLUP_ENABLED")
+            else:
+                reason = 'ROLLUP_REBUILD' if self.rebuild_rollups else needs_rebuild(conn)
+                if reason:
+                    spider.logger.info(f"Rebuilt project rollups ({reason}): {rebuild(conn)} groups")
+
+        if self.hasher is not None and self.preload_hashes:
+            with self.engine.connect() as conn:
+                self.known_hashes = dict(
+                    conn.execute(select(FranchiseProject.project_id, FranchiseProject.content_hash)).all())
+            spider.logger.info(f"Preloaded {len(self.known_hashes)} content hashes")
+
+        if self.bulk_enabled and self.bulk_interval > 0:
+            self.flush_loop = task.LoopingCall(self._flush, spider)
+            self.flush_loop.start(self.bulk_interval, now=False)
+
     def close_spider(self, spider):
         """爬虫结束时关闭数据库连接"""
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        # 失败的批次会放回缓冲区，重试次数用完后丢弃，循环必然结束
+        while self.bulk_enabled and any(self.buffers.values()):
+            self._flush(spider)
+        self._build_deferred_indexes(spider)
         self.engine.dispose()
-        spider.logger.info("Disconnected from MySQL database")
+        spider.logger.info(f"Disconnected from {self.backend.name} database")
+
+    def _build_deferred_indexes(self, spider):
+        """全量导入结束后一次性建立二级索引"""
+        if not self.bulk_load:
+            return
+        start = time.monotonic()
+        try:
+            created = build_indexes(self.engine, self.index_set)
+        except Exception as e:
+            spider.logger.error(f"Failed to build indexes ({self.index_set}): {e}")
+            return
+        spider.logger.info(f"Built {created} {self.index_set} indexes in {time.monotonic() - start:.1f}s")
 
     def process_item(self, item, spider):
         """处理每个项目数据"""
+        if self.bulk_enabled:
+            self._buffer_item(item, spider)
+        else:
+            self._write_item(item, spider)
+        return item
+
+    def _write_item(self, item, spider):
+        """逐条写入单个item"""
         session = self.Session()
+        start = time.monotonic()
 
         try:
+            unchanged = False
             if isinstance(item, FranchiseProjectItem):
-                self._process_project_item(item, session, spider)
+                unchanged = self._process_project_item(item, session, spider)
             elif isinstance(item, FranchiseAttachmentItem):
                 self._process_attachment_item(item, session, spider)
 
             session.commit()
+            if self.known_hashes is not None and 'content_hash' in session.info:
+                self.known_hashes[item['project_id']] = session.info['content_hash']
+            self._report_flush(time.monotonic() - start, 0 if unchanged else 1, 1 if unchanged else 0)
+            if isinstance(item, FranchiseProjectItem):
+                self._report_persisted([(item['project_id'], item.get('update_time'))], [])
+            elif isinstance(item, FranchiseAttachmentItem):
+                self._report_persisted([], [item['attachment_id']])
 
         except Exception as e:
             session.rollback()
             spider.logger.error(f"Failed to process item: {e}")
+            self._report_failure(1)
             raise
 
         finally:
             session.close()
 
-        return item
+    def _buffer_item(self, item, spider):
+        """批量模式：缓冲item，达到批次大小时写入"""
+        if isinstance(item, FranchiseProjectItem):
+            row = _model_row(FranchiseProject, item)
+            if self.hasher is not None:
+                row['content_hash'] = self.hasher.hash(item)
+            row['last_seen_time'] = datetime.datetime.now()
+            self.buffers[FranchiseProject][item['project_id']] = row
+        elif isinstance(item, FranchiseAttachmentItem):
+            self.buffers[FranchiseAttachment][item['attachment_id']] = _model_row(FranchiseAttachment, item)
+
+        if sum(len(rows) for rows in self.buffers.values()) >= self.bulk_size:
+            return self._flush(spider)
+
+    def _flush(self, spider):
+        """将缓冲区中的数据以多行upsert写入数据库"""
+        batches = self._take_batches()
+        if not batches:
+            return
+        try:
+            self._write_batches(batches, spider)
+        except Exception as e:
+            self._flush_failed(e, batches, spider)
+        else:
+            self.failed_flushes = 0
+
+    def _take_batches(self):
+        """取出缓冲区中的数据并清空缓冲区"""
+        batches = [(model, key, list(self.buffers[model].values()))
+                   for model, key in self.bulk_models if self.buffers[model]]
+        self.buffers = {model: {} for model, _ in self.bulk_models}
+        return batches
+
+    def _flush_failed(self, error, batches, spider):
+        """写入失败：批次放回缓冲区随下一批重试，缓冲区中同键的较新数据优先；
+        连续失败超过 bulk_retries 次后丢弃并计入 db/failed_rows"""
+        total = sum(len(rows) for _, _, rows in batches)
+        self.failed_flushes += 1
+        if self.failed_flushes > self.bulk_retries:
+            spider.logger.error(f"Failed to flush {total} rows after {self.failed_flushes} attempts, dropped: {error}")
+            self.failed_flushes = 0
+            self._report_failure(total)
+            return
+        spider.logger.warning(f"Failed to flush {total} rows (attempt {self.failed_flushes}), will retry: {error}")
+        for model, key, rows in batches:
+            buffer = self.buffers[model]
+            for row in rows:
+                buffer.setdefault(row[key], row)
+
+    def _write_batches(self, batches, spider):
+        """在一个事务中写入取出的批次，失败时抛出异常"""
+        total = sum(len(rows) for _, _, rows in batches)
+        start = time.monotonic()
+        unchanged = []
+        with self.engine.begin() as conn:
+            for model, key, rows in batches:
+                if model is FranchiseProject and self.hasher is not None:
+                    rows, unchanged = self._split_unchanged(conn, rows)
+                    self._touch(conn, unchanged)
+                if model is FranchiseProject and self.rollups and rows:
+                    self._update_rollups(conn, rows)
+                if rows:
+                    self.backend.upsert(conn, model, key, rows)
+        if self.known_hashes is not None:
+            for model, key, rows in batches:
+                if model is FranchiseProject:
+                    self.known_hashes.update((row['project_id'], row['content_hash']) for row in rows)
+        elapsed = time.monotonic() - start
+        spider.logger.info(f"Flushed {total - len(unchanged)} rows ({len(unchanged)} unchanged) in {elapsed:.3f}s")
+        self._report_flush(elapsed, total - len(unchanged), len(unchanged))
+        persisted = {model: rows for model, _, rows in batches}
+        self._report_persisted(
+            [(row['project_id'], row.get('update_time')) for row in persisted.get(FranchiseProject, ())],
+            [row['attachment_id'] for row in persisted.get(FranchiseAttachment, ())])
+
+    def _stored_hashes(self, conn, project_ids):
+        """库中的内容哈希：预加载时查内存，否则一次 IN 查询"""
+        if self.known_hashes is not None:
+            return {project_id: self.known_hashes.get(project_id) for project_id in project_ids}
+        return dict(conn.execute(
+            select(FranchiseProject.project_id, FranchiseProject.content_hash)
+            .where(FranchiseProject.project_id.in_(project_ids))
+        ).all())
+
+    def _split_unchanged(self, conn, rows):
+        """按内容哈希把一批项目分为 (需要写入的行, 未变化的project_id)"""
+        stored = self._stored_hashes(conn, [row['project_id'] for row in rows])
+        changed, unchanged = [], []
+        for row in rows:
+            if stored.get(row['project_id']) == row['content_hash']:
+                unchanged.append(row['project_id'])
+            else:
+                changed.append(row)
+        return changed, unchanged
+
+    def _update_rollups(self, conn, rows):
+        """写入前按库中的旧值和写入后的新值累加汇总表"""
+        previous = stored_values(conn, [row['project_id'] for row in rows])
+        delta = RollupDelta()
+        for row in rows:
+            old = previous.get(row['project_id'])
+            # upsert不更新行中没有的列，新值以旧值为底
+            delta.move(old, {**old, **row} if old else row)
+        delta.apply(conn, self.backend)
+
+    def _touch(self, conn, project_ids):
+        """未变化的项目只更新 last_seen_time"""
+        if project_ids:
+            conn.execute(update(FranchiseProject)
+                         .where(FranchiseProject.project_id.in_(project_ids))
+                         .values(last_seen_time=datetime.datetime.now()))
+
+    def _report_flush(self, seconds, rows, unchanged=0):
+        """发送 db_flushed 信号；写入可能发生在线程池中，信号统一在reactor线程发出"""
+        if self.crawler is not None:
+            # callFromThread 的关键字参数会与 asyncio reactor 内部 callLater 的 seconds 参数冲突，用partial绑定
+            reactor.callFromThread(functools.partial(self._flushed, seconds=seconds, rows=rows, unchanged=unchanged))
+
+    def _report_persisted(self, projects, attachments):
+        """发送 db_persisted 信号，去重管道据此登记已入库的键"""
+        if self.crawler is not None:
+            reactor.callFromThread(functools.partial(
+                self.crawler.signals.send_catch_log, signal=ppp_signals.db_persisted,
+                projects=projects, attachments=attachments))
+
+    def _report_failure(self, rows):
+        """写入失败而丢失的行数计入 db/failed_rows，爬虫据此不推进断点"""
+        if self.crawler is not None:
+            reactor.callFromThread(self.crawler.stats.inc_value, 'db/failed_rows', rows)
+
+    def _flushed(self, seconds, rows, unchanged):
+        if unchanged:
+            self.crawler.stats.inc_value('db/unchanged', unchanged)
+        self.crawler.signals.send_catch_log(signal=ppp_signals.db_flushed, seconds=seconds, rows=rows,
+                                            unchanged=unchanged)
 
     def _process_project_item(self, item, session, spider):
-        """处理项目数据"""
+        """处理项目数据，内容未变化时只更新 last_seen_time 并返回True"""
+        now = datetime.datetime.now()
+        content_hash = None
+        if self.hasher is not None:
+            content_hash = self.hasher.hash(item)
+            stored = self._stored_hashes(session, [item['project_id']]).get(item['project_id'])
+            if stored == content_hash:
+                self._touch(session, [item['project_id']])
+                spider.logger.debug(f"Unchanged project: {item['project_name']}")
+                return True
+
         existing_project = session.query(FranchiseProject).filter_by(project_id=item['project_id']).first()
+        old_values = None
 
         if existing_project:
+            old_values = rollup_values(existing_project)
             # 更新现有项目
             for key, value in item.items():
                 if hasattr(existing_project, key):
                     setattr(existing_project, key, value)
+            existing_project.content_hash = content_hash
+            existing_project.last_seen_time = now
             spider.logger.info(f"Updated project: {item['project_name']}")
         else:
             # 插入新项目
@@ -213,10 +795,19 @@ class MySQLPipeline:
                 else:
                     spider.logger.debug(f"Skipping field {key} - not in model")
 
-            new_project = FranchiseProject(**project_data)
+            new_project = FranchiseProject(**project_data, content_hash=content_hash, last_seen_time=now)
             session.add(new_project)
             spider.logger.info(f"Inserted new project: {item['project_name']}")
 
+        if self.rollups:
+            delta = RollupDelta()
+            delta.move(old_values, rollup_values(existing_project or new_project))
+            delta.apply(session, self.backend)
+
+        # 提交成功后再登记到预加载的哈希表
+        session.info['content_hash'] = content_hash
+        return False
+
     def _process_attachment_item(self, item, session, spider):
         """处理附件数据"""
         existing_attachment = session.query(FranchiseAttachment).filter_by(
@@ -242,49 +833,359 @@ class MySQLPipeline:
             spider.logger.info(f"Inserted new attachment: {item['file_name']}")
 
 
+class AsyncDatabasePipeline(DatabasePipeline):
+    """数据库存储管道 - 异步版
+
+    数据库写入放到独立的有界线程池执行，process_item 返回Deferred，reactor不再被pymysql阻塞。
+    同一 project_id 的写入按到达顺序串行（附件与其项目同键，外键顺序也得到保证）；
+    进行中的写入超过 ``MYSQL_ASYNC_MAX_PENDING`` 时后续item排队等待，
+    由Scrapy的item处理背压限制下载速度。
+    """
+
+    # 批量模式下所有缓冲写入共用一个键，保证批次按顺序提交
+    bulk_key = object()
+
+    def __init__(self, db_settings, max_threads=4, max_pending=100, **kwargs):
+        super().__init__(db_settings, **kwargs)
+        # SQLite只允许一个写事务，多个写线程只会互相等待锁
+        max_threads = min(max_threads, self.backend.max_writers or max_threads)
+        self.threadpool = ThreadPool(minthreads=1, maxthreads=max_threads, name='AsyncDatabasePipeline')
+        self.semaphore = defer.DeferredSemaphore(max_pending)
+        self.locks = {}
+        self.pending = set()
+
+    @classmethod
+    def settings_kwargs(cls, crawler):
+        settings = crawler.settings
+        return dict(
+            super().settings_kwargs(crawler),
+            max_threads=settings.getint('MYSQL_ASYNC_THREADS', 4),
+            max_pending=settings.getint('MYSQL_ASYNC_MAX_PENDING', 100),
+        )
+
+    def open_spider(self, spider):
+        self.threadpool.start()
+        super().open_spider(spider)
+
+    def close_spider(self, spider):
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        d = defer.DeferredList(list(self.pending))
+        if self.bulk_enabled:
+            d.addCallback(self._drain, spider)
+        if self.bulk_load:
+            d.addCallback(lambda _: threads.deferToThreadPool(
+                reactor, self.threadpool, self._build_deferred_indexes, spider))
+        d.addBoth(self._shutdown, spider)
+        return d
+
+    def _shutdown(self, result, spider):
+        self.threadpool.stop()
+        self.engine.dispose()
+        spider.logger.info(f"Disconnected from {self.backend.name} database")
+
+    def process_item(self, item, spider):
+        if self.bulk_enabled:
+            d = self._buffer_item(item, spider)
+        else:
+            d = self._enqueue(ItemAdapter(item).get('project_id'), self._write_item, item, spider)
+        if d is None:
+            return item
+        return d.addCallback(lambda _: item)
+
+    def _flush(self, spider):
+        batches = self._take_batches()
+        if batches:
+            d = self._enqueue(self.bulk_key, self._write_batches, batches, spider)
+            return d.addCallbacks(self._flush_succeeded, self._flush_errback, errbackArgs=(batches, spider))
+
+    def _flush_succeeded(self, result):
+        self.failed_flushes = 0
+
+    def _flush_errback(self, failure, batches, spider):
+        self._flush_failed(failure.value, batches, spider)
+
+    def _drain(self, result, spider):
+        """爬虫结束时写完缓冲区，包括失败后放回的批次"""
+        d = self._flush(spider)
+        if d is not None:
+            return d.addCallback(self._drain, spider)
+
+    def _enqueue(self, key, func, *args):
+        """在线程池中执行写入：全局并发受信号量限制，同键写入按顺序串行"""
+        lock = self.locks.setdefault(key, defer.DeferredLock())
+        d = self.semaphore.run(lock.run, threads.deferToThreadPool, reactor, self.threadpool, func, *args)
+        self.pending.add(d)
+        d.addBoth(self._finished, d, key, lock)
+        return d
+
+    def _finished(self, result, d, key, lock):
+        self.pending.discard(d)
+        if not lock.locked and not lock.waiting and self.locks.get(key) is lock:
+            del self.locks[key]
+        return result
+
+
+# 兼容旧配置中的类名
+MySQLPipeline = DatabasePipeline
+AsyncMySQLPipeline = AsyncDatabasePipeline
+
+
+class SearchIndexPipeline:
+    """全文索引管道
+
+    已入库的项目缓冲到 ``SEARCH_INDEX_BATCH_SIZE`` 条后，在线程中以一个事务写入
+    ``tmp/<spider>/search.sqlite3``（search.py 的FTS5索引），文本和筛选字段未变化的项目不重新索引。
+    批次按顺序写入，写入期间 process_item 返回Deferred，由Scrapy的item处理背压限制下载速度。
+    """
+
+    def __init__(self, path='./tmp/{}/search.sqlite3', batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.index = None
+        self.buffer = {}
+        self.lock = defer.DeferredLock()
+        self.indexed = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('SEARCH_INDEX_ENABLED', False):
+            raise NotConfigured
+        return cls(
+            path=settings.get('SEARCH_INDEX_PATH', './tmp/{}/search.sqlite3'),
+            batch_size=settings.getint('SEARCH_INDEX_BATCH_SIZE', 500),
+        )
+
+    def open_spider(self, spider):
+        self.path = self.path.format(spider.name)
+        self.index = SearchIndex(self.path).open()
+
+    def process_item(self, item, spider):
+        if not isinstance(item, FranchiseProjectItem):
+            return item
+        adapter = ItemAdapter(item)
+        self.buffer[adapter['project_id']] = document(adapter)
+        if len(self.buffer) >= self.batch_size:
+            return self._flush(spider).addCallback(lambda _: item)
+        return item
+
+    def _flush(self, spider):
+        documents = list(self.buffer.values())
+        self.buffer = {}
+        d = self.lock.run(threads.deferToThread, self.index.add, documents)
+        d.addCallbacks(self._written, self._failed, errbackArgs=(spider, len(documents)))
+        return d
+
+    def _written(self, indexed):
+        self.indexed += indexed
+
+    def _failed(self, failure, spider, count):
+        spider.logger.error(f"Failed to index {count} projects: {failure.getErrorMessage()}")
+
+    def close_spider(self, spider):
+        d = self._flush(spider) if self.buffer else self.lock.run(defer.succeed, None)
+        d.addBoth(self._close, spider)
+        return d
+
+    def _close(self, _, spider):
+        spider.logger.info(f"全文索引: 本次重新索引 {self.indexed} 个项目, 共 {len(self.index)} 个 ({self.path})")
+        self.index.close()
+
+
+def _model_row(model, item):
+    """提取item中属于模型列的字段"""
+    columns = model.__table__.columns.keys()
+    return {key: value for key, value in item.items() if key in columns}
+
+
 class DuplicatesPipeline:
-    """去重管道"""
+    """去重管道
+
+    ``DEDUP_BACKEND`` 选择去重存储：memory 只在单次运行内去重，bloom 使用
+    ``tmp/<spider>/dedup/`` 下的布隆过滤器文件跨运行去重。开启 ``DEDUP_SEED_FROM_DB``
+    时在 open_spider 用数据库中已有的记录预热，重复抓取的数据在进入后续管道前即被丢弃。
+    项目以 project_id + update_time 为键，项目更新后仍会重新入库；附件以 attachment_id 为键。
 
-    def __init__(self):
-        self.seen_projects = set()
-        self.seen_attachments = set()
+    键在数据库管道提交成功（``db_persisted`` 信号）后才写入去重存储：验证失败、写入失败或进程退出时
+    仍在途的数据下次运行会重新抓取。已放行但尚未入库的键记在内存中，同一次运行内的重复数据同样丢弃。
+    存储在 spider_closed 时关闭，此时数据库管道已写完缓冲区。
+    """
+
+    def __init__(self, backend='memory', storage=None, seed_from_db=False,
+                 bloom_capacity=2000000, bloom_error_rate=0.001):
+        if backend not in ('memory', 'bloom'):
+            raise ValueError(f"Unsupported DEDUP_BACKEND: {backend}")
+        self.backend = backend
+        self.storage = storage
+        self.seed_from_db = seed_from_db
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.dedup_dir = r'./tmp/{}/dedup'
+        self.seen_projects = None
+        self.seen_attachments = None
+        # 已放行、尚未入库的键
+        self.pending_projects = set()
+        self.pending_attachments = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            backend=settings.get('DEDUP_BACKEND', 'memory'),
+            storage=storage_backend(settings, crawler.spider.name),
+            seed_from_db=settings.getbool('DEDUP_SEED_FROM_DB', False),
+            bloom_capacity=settings.getint('DEDUP_BLOOM_CAPACITY', 2000000),
+            bloom_error_rate=settings.getfloat('DEDUP_BLOOM_ERROR_RATE', 0.001),
+        )
+        crawler.signals.connect(pipeline.persisted, signal=ppp_signals.db_persisted)
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    def open_spider(self, spider):
+        self.seen_projects = self._create_store(spider, 'projects')
+        self.seen_attachments = self._create_store(spider, 'attachments')
+        if self.seed_from_db:
+            self._seed(spider)
+
+    def spider_closed(self, spider):
+        spider.logger.info(f"去重存储: 项目 {len(self.seen_projects)} 条, 附件 {len(self.seen_attachments)} 条, "
+                           f"未入库 {len(self.pending_projects)} + {len(self.pending_attachments)} 条")
+        self.seen_projects.close()
+        self.seen_attachments.close()
+
+    def persisted(self, projects, attachments):
+        """数据库提交成功后登记键"""
+        keys = [_project_key(project_id, update_time) for project_id, update_time in projects]
+        self.seen_projects.add_many(keys)
+        self.pending_projects.difference_update(keys)
+        self.seen_attachments.add_many(attachments)
+        self.pending_attachments.difference_update(attachments)
+
+    def _create_store(self, spider, name):
+        if self.backend == 'bloom':
+            path = os.path.join(self.dedup_dir.format(spider.name), f'{name}.bloom')
+            return BloomDedupStore(path, self.bloom_capacity, self.bloom_error_rate)
+        return MemoryDedupStore()
+
+    def _seed(self, spider):
+        """从数据库中已有的项目和附件预热去重存储"""
+        engine = self.storage.create_engine()
+        try:
+            with engine.connect() as conn:
+                conn = conn.execution_options(stream_results=True, yield_per=10000)
+                rows = conn.execute(select(FranchiseProject.project_id, FranchiseProject.update_time))
+                for project_id, update_time in rows:
+                    self.seen_projects.add(_project_key(project_id, update_time))
+                rows = conn.execute(select(FranchiseAttachment.attachment_id))
+                for attachment_id, in rows:
+                    self.seen_attachments.add(attachment_id)
+        except Exception as e:
+            spider.logger.error(f"Failed to seed dedup store from database: {e}")
+        finally:
+            engine.dispose()
+        spider.logger.info(f"去重存储预热完成: 项目 {len(self.seen_projects)} 条, 附件 {len(self.seen_attachments)} 条")
 
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
 
         if isinstance(item, FranchiseProjectItem):
             project_id = adapter['project_id']
-            if project_id in self.seen_projects:
+            key = _project_key(project_id, adapter.get('update_time'))
+            if key in self.seen_projects or key in self.pending_projects:
                 spider.logger.debug(f"Duplicate project found: {project_id}")
                 raise DropItem(f"Duplicate project: {project_id}")
-            else:
-                self.seen_projects.add(project_id)
+            self.pending_projects.add(key)
 
         elif isinstance(item, FranchiseAttachmentItem):
             attachment_id = adapter['attachment_id']
-            if attachment_id in self.seen_attachments:
+            if attachment_id in self.seen_attachments or attachment_id in self.pending_attachments:
                 spider.logger.debug(f"Duplicate attachment found: {attachment_id}")
                 raise DropItem(f"Duplicate attachment: {attachment_id}")
-            else:
-                self.seen_attachments.add(attachment_id)
+            self.pending_attachments.add(attachment_id)
 
         return item
 
 
+def _project_key(project_id, update_time):
+    """项目去重键：同一项目的不同版本视为不同数据"""
+    if isinstance(update_time, datetime.datetime):
+        update_time = update_time.strftime('%Y-%m-%d %H:%M:%S')
+    return f"{project_id}|{update_time or ''}"
+
+
 class StatisticsPipeline:
-    """统计管道"""
+    """统计管道
+
+    开启 ``METRICS_ENABLED`` 后在 ``METRICS_HOST:METRICS_PORT`` 以Prometheus文本格式实时暴露指标：
+    各类item数量及速率、各回调的响应延迟分布、调度队列深度、数据库写入延迟、丢弃/重复数、
+    项目阶段和实施模式分布。
+    """
 
-    def __init__(self):
+    def __init__(self, crawler=None, metrics_enabled=False, metrics_host='127.0.0.1', metrics_port=9410,
+                 rate_interval=5.0):
         self.projects_count = 0
         self.attachments_count = 0
         self.project_stages = {}
         self.exec_modes = {}
 
+        self.crawler = crawler
+        self.metrics_enabled = metrics_enabled
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.rate_interval = rate_interval
+        self.listener = None
+        self.rate_loop = None
+        self.rate_snapshot = {}
+
+        self.registry = MetricsRegistry()
+        self.items_total = self.registry.counter('ppp_items_total', 'Items scraped', ['type'])
+        self.items_rate = self.registry.gauge('ppp_items_per_second', 'Items scraped per second', ['type'])
+        self.dropped_total = self.registry.counter('ppp_items_dropped_total', 'Items dropped', ['type', 'reason'])
+        self.response_latency = self.registry.histogram(
+            'ppp_response_latency_seconds', 'Download latency by callback', ['callback'])
+        self.responses_total = self.registry.counter(
+            'ppp_responses_total', 'Responses received', ['callback', 'status'])
+        self.db_flush_latency = self.registry.histogram('ppp_db_flush_seconds', 'Database flush latency')
+        self.db_rows_total = self.registry.counter('ppp_db_rows_total', 'Rows written to the database')
+        self.db_unchanged_total = self.registry.counter('ppp_db_unchanged_total',
+                                                        'Projects skipped because their content hash was unchanged')
+        self.queue_depth = self.registry.gauge('ppp_scheduler_queue_depth', 'Requests waiting in the scheduler')
+        self.inflight = self.registry.gauge('ppp_downloader_inflight', 'Requests being downloaded')
+        self.stage_gauge = self.registry.gauge('ppp_project_stage', 'Projects by stage', ['stage'])
+        self.exec_mode_gauge = self.registry.gauge('ppp_exec_mode', 'Projects by exec mode', ['exec_mode'])
+        self.registry.add_collector(self._collect)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            crawler,
+            metrics_enabled=settings.getbool('METRICS_ENABLED', False),
+            metrics_host=settings.get('METRICS_HOST', '127.0.0.1'),
+            metrics_port=settings.getint('METRICS_PORT', 9410),
+        )
+        if pipeline.metrics_enabled:
+            crawler.signals.connect(pipeline.response_received, signal=signals.response_received)
+            crawler.signals.connect(pipeline.item_dropped, signal=signals.item_dropped)
+            crawler.signals.connect(pipeline.db_flushed, signal=ppp_signals.db_flushed)
+        return pipeline
+
+    def open_spider(self, spider):
+        if not self.metrics_enabled:
+            return
+        self.listener = reactor.listenTCP(self.metrics_port, Site(MetricsResource(self.registry)),
+                                          interface=self.metrics_host)
+        self.rate_loop = task.LoopingCall(self._update_rates)
+        self.rate_loop.start(self.rate_interval, now=False)
+        spider.logger.info(f"Metrics endpoint: http://{self.metrics_host}:{self.metrics_port}/metrics")
+
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
 
         if isinstance(item, FranchiseProjectItem):
             self.projects_count += 1
+            self.items_total.inc('project')
 
             # 统计项目阶段
             stage = adapter.get('project_stage_name', 'Unknown')
@@ -296,13 +1197,190 @@ class StatisticsPipeline:
 
         elif isinstance(item, FranchiseAttachmentItem):
             self.attachments_count += 1
+            self.items_total.inc('attachment')
 
         return item
 
+    def response_received(self, response, request, spider):
+        callback = getattr(request.callback, '__name__', 'parse')
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.response_latency.observe(latency, callback)
+        self.responses_total.inc(callback, response.status)
+
+    def item_dropped(self, item, response, exception, spider):
+        item_type = 'project' if isinstance(item, FranchiseProjectItem) else 'attachment'
+        reason = 'duplicate' if str(exception).startswith('Duplicate') else 'dropped'
+        self.dropped_total.inc(item_type, reason)
+
+    def db_flushed(self, seconds, rows, unchanged=0):
+        self.db_flush_latency.observe(seconds)
+        self.db_rows_total.inc(amount=rows)
+        self.db_unchanged_total.inc(amount=unchanged)
+
+    def _update_rates(self):
+        """按固定间隔计算各类item的速率"""
+        now = time.monotonic()
+        for labels, count in list(self.items_total.values.items()):
+            last_time, last_count = self.rate_snapshot.get(labels, (now - self.rate_interval, 0))
+            if now > last_time:
+                self.items_rate.set((count - last_count) / (now - last_time), *labels)
+            self.rate_snapshot[labels] = (now, count)
+
+    def _collect(self):
+        """输出指标前刷新按需计算的指标"""
+        engine = self.crawler.engine if self.crawler else None
+        slot = getattr(engine, 'slot', None) or getattr(engine, '_slot', None)
+        if slot is not None:
+            self.queue_depth.set(len(slot.scheduler))
+        if engine is not None and engine.downloader is not None:
+            self.inflight.set(len(engine.downloader.active))
+        self.stage_gauge.replace(self.project_stages)
+        self.exec_mode_gauge.replace(self.exec_modes)
+
     def close_spider(self, spider):
         """爬虫结束时输出统计信息"""
+        if self.rate_loop and self.rate_loop.running:
+            self.rate_loop.stop()
+        if self.listener is not None:
+            self.listener.stopListening()
+
         spider.logger.info(f"爬取统计:")
         spider.logger.info(f"- 项目总数: {self.projects_count}")
         spider.logger.info(f"- 附件总数: {self.attachments_count}")
         spider.logger.info(f"- 项目阶段分布: {self.project_stages}")
-        spider.logger.info(f"- 实施模式分布: {self.exec_modes}")
\ No newline at end of file
+        spider.logger.info(f"- 实施模式分布: {self.exec_modes}")
+
+
+class ParquetExportPipeline:
+    """Parquet列式导出管道
+
+    项目和附件分别写入 ``tmp/<spider>/parquet/{projects,attachments}/province_code=<省>/crawl_date=<日期>/``，
+    目录按Hive分区命名，按地区或日期查询时只读取对应分区；列类型由 model.py 的列定义生成。
+    每个分区一个写入器，缓冲满 ``PARQUET_ROW_GROUP_SIZE`` 行写出一个row group。每次运行写入新文件，
+    多次运行的结果在同一分区目录下累加；写入中的文件以 ``.`` 开头（读取数据集时被忽略），结束时重命名。
+
+    读取时显式声明分区列为字符串，避免省份编码被推断为整数::
+
+        ds.dataset(path, partitioning=ds.partitioning(
+            pa.schema([('province_code', pa.string()), ('crawl_date', pa.string())]), flavor='hive'))
+    """
+
+    datasets = (
+        (FranchiseProjectItem, FranchiseProject, 'projects'),
+        (FranchiseAttachmentItem, FranchiseAttachment, 'attachments'),
+    )
+    # 省份编码为空时的分区名，与Hive/pyarrow的默认空分区一致
+    null_partition = '__HIVE_DEFAULT_PARTITION__'
+
+    def __init__(self, root='./tmp/{}/parquet', row_group_size=5000, compression='zstd'):
+        self.root = root
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.time = datetime.datetime.now().strftime('%Y-%m-%dT%H_%M_%S')
+        self.schemas = {}  # item类 -> (数据集名, schema, [(字段, 类型)])
+        self.buffers = {}  # (数据集名, 省份, 日期) -> 行列表
+        self.writers = {}  # (数据集名, 省份, 日期) -> (ParquetWriter, 临时路径, 正式路径)
+        self.rows_written = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PARQUET_EXPORT_ENABLED', False):
+            raise NotConfigured
+        if pa is None:
+            raise NotConfigured('Parquet导出需要安装 pyarrow')
+        return cls(
+            root=settings.get('PARQUET_EXPORT_PATH', './tmp/{}/parquet'),
+            row_group_size=settings.getint('PARQUET_ROW_GROUP_SIZE', 5000),
+            compression=settings.get('PARQUET_COMPRESSION', 'zstd'),
+        )
+
+    def open_spider(self, spider):
+        self.root = self.root.format(spider.name)
+        for item_class, model, name in self.datasets:
+            # 省份编码已体现在分区目录中，不再重复写入文件
+            schema = arrow_schema(model, item_class, exclude=('province_code',))
+            self.schemas[item_class] = (name, schema, [(field.name, _arrow_kind(field.type)) for field in schema])
+
+    def process_item(self, item, spider):
+        entry = self.schemas.get(type(item))
+        if entry is None:
+            return item
+        name, schema, columns = entry
+        adapter = ItemAdapter(item)
+
+        # 附件的省份代码由爬虫从所属项目带上
+        province = adapter.get('province_code') or None
+        crawl_time = adapter.get('crawl_time')
+        crawl_date = (crawl_time if isinstance(crawl_time, datetime.date) else datetime.date.today()).strftime('%Y-%m-%d')
+
+        key = (name, province or self.null_partition, crawl_date)
+        buffer = self.buffers.setdefault(key, [])
+        buffer.append({field: _arrow_value(adapter.get(field), kind) for field, kind in columns})
+        if len(buffer) >= self.row_group_size:
+            self._flush(key, schema)
+        return item
+
+    def _flush(self, key, schema):
+        """把一个分区的缓冲写成一个row group"""
+        rows = self.buffers.pop(key, None)
+        if not rows:
+            return
+        writer = self.writers.get(key)
+        if writer is None:
+            name, province, crawl_date = key
+            directory = os.path.join(self.root, name, f'province_code={province}', f'crawl_date={crawl_date}')
+            os.makedirs(directory, exist_ok=True)
+            final_path = os.path.join(directory, f'part-{self.time}.parquet')
+            part_path = os.path.join(directory, f'.part-{self.time}.parquet')
+            writer = self.writers[key] = (
+                pq.ParquetWriter(part_path, schema, compression=self.compression), part_path, final_path)
+        writer[0].write_table(pa.Table.from_pylist(rows, schema=schema))
+        self.rows_written += len(rows)
+
+    def close_spider(self, spider):
+        schemas = {name: schema for name, schema, _ in self.schemas.values()}
+        for key in list(self.buffers):
+            self._flush(key, schemas[key[0]])
+        for writer, part_path, final_path in self.writers.values():
+            writer.close()
+            os.replace(part_path, final_path)
+        spider.logger.info(f"Parquet导出完成: {self.root} ({self.rows_written} 行, {len(self.writers)} 个分区文件)")
+
+
+def _arrow_kind(arrow_type):
+    """pyarrow类型 -> _arrow_value 使用的转换类别"""
+    if pa.types.is_decimal(arrow_type):
+        return 'decimal'
+    if pa.types.is_timestamp(arrow_type):
+        return 'timestamp'
+    if pa.types.is_date(arrow_type):
+        return 'date'
+    if pa.types.is_boolean(arrow_type):
+        return 'bool'
+    if pa.types.is_integer(arrow_type):
+        return 'int'
+    return 'string'
+
+
+def _arrow_value(value, kind):
+    """把item字段值转换为可写入对应Parquet列的值，无法转换时为NULL"""
+    if value is None or value == '':
+        return None
+    try:
+        if kind == 'decimal':
+            return value if isinstance(value, Decimal) else Decimal(str(value))
+        if kind == 'timestamp':
+            return value if isinstance(value, datetime.datetime) else None
+        if kind == 'date':
+            if isinstance(value, datetime.datetime):
+                return value.date()
+            return value if isinstance(value, datetime.date) else None
+        if kind == 'bool':
+            return bool(value)
+        if kind == 'int':
+            return int(value)
+    except (ValueError, TypeError, ArithmeticError):
+        return None
+    return value if isinstance(value, str) else str(value)
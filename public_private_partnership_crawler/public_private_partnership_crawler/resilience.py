@@ -0,0 +1,150 @@
+"""重试预算、指数退避和熔断器
+
+- RetryBudget：每个首次请求为接口积累 ``ratio`` 次重试额度（上限 ``maximum``），每次重试消耗1次；
+  接口大面积失败时重试量被限制在正常请求量的一定比例内，不会形成重试风暴
+- backoff_delay：指数退避加全抖动（full jitter），多个请求同时失败时错开重试时间
+- CircuitBreaker：最近 ``window`` 个请求中失败比例达到阈值时断开，暂停该接口 ``open_seconds`` 秒后
+  放行一个探测请求（半开）；探测成功恢复，失败则再次断开且暂停时间加倍
+
+同一爬虫同一接口的预算和熔断器由 get_budget/get_breaker 共享（ResilientRetryMiddleware 和附件下载管道共用）。
+都只在reactor线程中使用，不加锁。
+"""
+import collections
+import random
+import time
+import weakref
+
+# crawler -> {接口: RetryBudget} / {接口: CircuitBreaker}
+_budgets = weakref.WeakKeyDictionary()
+_breakers = weakref.WeakKeyDictionary()
+
+
+class RetryBudget:
+    """单个接口的重试额度"""
+
+    def __init__(self, ratio=0.2, reserve=10, maximum=100):
+        self.ratio = ratio
+        self.maximum = maximum
+        self.tokens = float(min(reserve, maximum))
+
+    def deposit(self):
+        """首次请求积累额度"""
+        self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """消耗一次重试额度，额度不足时返回False"""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def backoff_delay(retries, base=1.0, maximum=60.0):
+    """第 retries 次重试（从0开始）前的等待秒数"""
+    return random.uniform(0, min(maximum, base * 2 ** retries))
+
+
+class CircuitBreaker:
+    """单个接口的熔断器"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    # 半开状态下探测请求未返回时，其他请求推迟的秒数
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, name, window=20, min_requests=10, failure_ratio=0.5, open_seconds=30.0,
+                 max_open_seconds=300.0):
+        self.name = name
+        self.outcomes = collections.deque(maxlen=window)
+        self.min_requests = min_requests
+        self.failure_ratio = failure_ratio
+        self.base_open_seconds = open_seconds
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = self.CLOSED
+        self.reopen_at = 0.0
+        self.probing = False
+        self.probe_started = 0.0
+        self.opened = 0
+
+    def failure_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def acquire(self):
+        """不等待地申请放行，返回 (需推迟的秒数, 是否探测请求)；推迟秒数大于0时本请求不能发出"""
+        now = time.monotonic()
+        if self.state == self.CLOSED:
+            return 0.0, False
+        if self.state == self.OPEN:
+            wait = self.reopen_at - now
+            if wait > 0:
+                return wait, False
+            self.state = self.HALF_OPEN
+            self.probing = False
+        # 探测请求没有带回结果（如被丢弃）时，超过一个暂停周期后另选一个请求探测
+        if not self.probing or now - self.probe_started > self.open_seconds:
+            self.probing = True
+            self.probe_started = now
+            return 0.0, True
+        return self.POLL_INTERVAL, False
+
+    def record(self, success, probe=False):
+        """记录请求结果，状态变化时返回新状态"""
+        if probe:
+            self.probing = False
+            if success:
+                self.state = self.CLOSED
+                self.outcomes.clear()
+                self.open_seconds = self.base_open_seconds
+                return self.CLOSED
+            self.open_seconds = min(self.max_open_seconds, self.open_seconds * 2)
+            return self._open()
+
+        if self.state != self.CLOSED:
+            # 断开前已发出的请求，结果不影响探测
+            return None
+        self.outcomes.append(success)
+        if len(self.outcomes) >= self.min_requests and self.failure_rate() >= self.failure_ratio:
+            return self._open()
+        return None
+
+    def _open(self):
+        self.state = self.OPEN
+        self.reopen_at = time.monotonic() + self.open_seconds
+        self.opened += 1
+        return self.OPEN
+
+
+def get_budget(crawler, endpoint):
+    """返回爬虫某个接口共享的重试预算，首次调用时按设置创建"""
+    budgets = _budgets.setdefault(crawler, {})
+    budget = budgets.get(endpoint)
+    if budget is None:
+        settings = crawler.settings
+        budget = budgets[endpoint] = RetryBudget(
+            ratio=settings.getfloat('RETRY_BUDGET_RATIO', 0.2),
+            reserve=settings.getint('RETRY_BUDGET_RESERVE', 10),
+            maximum=settings.getint('RETRY_BUDGET_MAX', 100),
+        )
+    return budget
+
+
+def get_breaker(crawler, endpoint):
+    """返回爬虫某个接口共享的熔断器，首次调用时按设置创建"""
+    breakers = _breakers.setdefault(crawler, {})
+    breaker = breakers.get(endpoint)
+    if breaker is None:
+        settings = crawler.settings
+        breaker = breakers[endpoint] = CircuitBreaker(
+            endpoint,
+            window=settings.getint('CIRCUIT_BREAKER_WINDOW', 20),
+            min_requests=settings.getint('CIRCUIT_BREAKER_MIN_REQUESTS', 10),
+            failure_ratio=settings.getfloat('CIRCUIT_BREAKER_FAILURE_RATIO', 0.5),
+            open_seconds=settings.getfloat('CIRCUIT_BREAKER_OPEN_SECONDS', 30),
+            max_open_seconds=settings.getfloat('CIRCUIT_BREAKER_MAX_OPEN_SECONDS', 300),
+        )
+    return breaker
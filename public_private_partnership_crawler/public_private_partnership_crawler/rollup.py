@@ -0,0 +1,174 @@
+"""项目汇总表（franchise_project_rollups）的增量维护和查询
+
+按 ROLLUP_DIMENSIONS 分组保存项目数、总投资合计和预计民间投资合计。存储管道写入项目时，
+用库中的旧值和写入后的新值计算增量：旧分组减去旧值、新分组加上新值，项目在阶段之间移动时
+两个分组都得到修正。增量与项目写入在同一事务中提交，按分组排序后累加，并发事务的加锁顺序一致。
+
+看板的分组统计查询汇总表即可，代价与分组数相关，与项目数无关：
+
+    summarize(conn, by=('province_code',), project_stage='03')
+
+存储管道启动时比较汇总表与项目表的项目数和投资合计，不一致（关闭 ROLLUP_ENABLED 期间的写入、
+其他进程或手工修改了项目表）时全量重建；关闭 ROLLUP_ENABLED 的运行启动时清空汇总表，下次开启时重建。
+也可以手动检查或重建：
+
+    python -m public_private_partnership_crawler.rollup check
+    python -m public_private_partnership_crawler.rollup rebuild
+"""
+import argparse
+import sys
+from decimal import Decimal
+
+from sqlalchemy import func, insert, literal, select
+
+from model import FranchiseProject, FranchiseProjectRollup
+
+ROLLUP_DIMENSIONS = ('province_code', 'industry_code', 'exec_mode', 'project_stage')
+ROLLUP_MEASURES = ('total_investment', 'expected_private_capital')
+ROLLUP_COLUMNS = ROLLUP_DIMENSIONS + ROLLUP_MEASURES
+# 合计比较的容差：SQLite以浮点保存DECIMAL，逐次累加与一次求和可能有舍入差
+TOTAL_TOLERANCE = Decimal('0.01')
+
+
+def rollup_values(source):
+    """项目的维度和度量值：source 为ORM对象或字典"""
+    get = source.get if isinstance(source, dict) else lambda key: getattr(source, key)
+    return {key: get(key) for key in ROLLUP_COLUMNS}
+
+
+class RollupDelta:
+    """一个事务内对汇总表的增量：分组 -> [项目数, 总投资, 预计民间投资]"""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, values, sign):
+        key = tuple(values.get(name) or '' for name in ROLLUP_DIMENSIONS)
+        entry = self.groups.setdefault(key, [0, Decimal(0), Decimal(0)])
+        entry[0] += sign
+        for i, name in enumerate(ROLLUP_MEASURES, 1):
+            value = values.get(name)
+            if value is not None:
+                entry[i] += sign * Decimal(str(value))
+
+    def move(self, old, new):
+        """项目从旧值变为新值；old 为None表示新项目"""
+        if old is not None:
+            self.add(old, -1)
+        self.add(new, 1)
+
+    def rows(self):
+        """非零增量，按分组排序"""
+        rows = []
+        for key in sorted(self.groups):
+            count, *measures = self.groups[key]
+            if count or any(measures):
+                rows.append(dict(zip(ROLLUP_DIMENSIONS, key), project_count=count,
+                                 **dict(zip(ROLLUP_MEASURES, measures))))
+        return rows
+
+    def apply(self, conn, backend):
+        """把增量累加到汇总表"""
+        rows = self.rows()
+        if rows:
+            backend.accumulate(conn, FranchiseProjectRollup, ROLLUP_DIMENSIONS, rows)
+        return len(rows)
+
+
+def stored_values(conn, project_ids):
+    """库中项目的维度和度量值：project_id -> dict"""
+    if not project_ids:
+        return {}
+    columns = [getattr(FranchiseProject, name) for name in ROLLUP_COLUMNS]
+    result = conn.execute(select(FranchiseProject.project_id, *columns)
+                          .where(FranchiseProject.project_id.in_(project_ids)))
+    return {row[0]: dict(zip(ROLLUP_COLUMNS, row[1:])) for row in result}
+
+
+def rebuild(conn):
+    """由项目表全量重建汇总表，返回分组数"""
+    rollup = FranchiseProjectRollup.__table__
+    dimensions = [func.coalesce(getattr(FranchiseProject, name), literal('')) for name in ROLLUP_DIMENSIONS]
+    conn.execute(rollup.delete())
+    query = select(
+        *dimensions,
+        func.count(),
+        *[func.coalesce(func.sum(getattr(FranchiseProject, name)), 0) for name in ROLLUP_MEASURES],
+    ).group_by(*dimensions)
+    conn.execute(insert(rollup).from_select([*ROLLUP_DIMENSIONS, 'project_count', *ROLLUP_MEASURES], query))
+    return conn.execute(select(func.count()).select_from(rollup)).scalar()
+
+
+def clear(conn):
+    """清空汇总表，返回删除的分组数"""
+    return conn.execute(FranchiseProjectRollup.__table__.delete()).rowcount
+
+
+def totals(conn):
+    """(项目表合计, 汇总表合计)，合计为 (项目数, 总投资, 预计民间投资)"""
+    rollup = FranchiseProjectRollup
+    base = conn.execute(select(
+        func.count(), *[func.coalesce(func.sum(getattr(FranchiseProject, name)), 0) for name in ROLLUP_MEASURES],
+    )).one()
+    stored = conn.execute(select(
+        func.coalesce(func.sum(rollup.project_count), 0),
+        *[func.coalesce(func.sum(getattr(rollup, name)), 0) for name in ROLLUP_MEASURES],
+    )).one()
+    return tuple(base), tuple(stored)
+
+
+def needs_rebuild(conn):
+    """汇总表与项目表不一致时返回说明，一致时返回None
+
+    只比较合计：只在分组之间移动、合计不变的修改（如手工改阶段）检查不出来，需要手动重建。
+    """
+    base, stored = totals(conn)
+    if base[0] != stored[0]:
+        return f"project count {stored[0]} != {base[0]}"
+    for name, expected, actual in zip(ROLLUP_MEASURES, base[1:], stored[1:]):
+        if abs(Decimal(str(expected)) - Decimal(str(actual))) > TOTAL_TOLERANCE:
+            return f"{name} {actual} != {expected}"
+    return None
+
+
+def summarize(conn, by=ROLLUP_DIMENSIONS, **filters):
+    """按 by 中的维度汇总，filters 为维度等值条件；返回 [dict]，按项目数倒序"""
+    rollup = FranchiseProjectRollup
+    unknown = (set(by) | set(filters)) - set(ROLLUP_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unsupported rollup dimensions: {sorted(unknown)}")
+    count = func.sum(rollup.project_count)
+    query = select(
+        *[getattr(rollup, name) for name in by],
+        count.label('project_count'),
+        *[func.sum(getattr(rollup, name)).label(name) for name in ROLLUP_MEASURES],
+    ).where(*[getattr(rollup, name) == value for name, value in filters.items()])
+    query = query.group_by(*[getattr(rollup, name) for name in by]).having(count > 0).order_by(count.desc())
+    return [dict(row._mapping) for row in conn.execute(query)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m public_private_partnership_crawler.rollup')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('check', help='检查汇总表与项目表（DB_BACKEND/DATABASE）是否一致')
+    commands.add_parser('rebuild', help='由项目表全量重建汇总表')
+    args = parser.parse_args(argv)
+
+    from scrapy.utils.project import get_project_settings
+    from public_private_partnership_crawler.storage import storage_backend
+
+    engine = storage_backend(get_project_settings(), 'franchise_spider').create_engine()
+    try:
+        with engine.begin() as conn:
+            if args.command == 'rebuild':
+                print(f'rebuilt {rebuild(conn)} groups')
+                return 0
+            reason = needs_rebuild(conn)
+            print(f'out of date: {reason}' if reason else 'up to date')
+            return 1 if reason else 0
+    finally:
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""由SQLAlchemy模型列定义编译的item字段转换器
+
+转换规则在构造时根据列类型一次性生成，处理item时只遍历预先编译好的字段表：
+
+- DECIMAL(p, s)：转换为按s位小数四舍五入的Decimal，超出p位精度时置为NULL
+- Integer：转换为int
+- Boolean：字符串 '1'/'true'/'yes'/'是' 为真
+- String(n)：超长截断
+
+数值和布尔字段缺失时填入默认值（布尔字段取列默认值），与原有校验逻辑一致。
+
+arrow_schema 按同样的列定义生成 Parquet 导出使用的 pyarrow schema；
+ContentHasher 按列定义选出业务字段计算内容哈希，用于判断重新抓取的项目是否有变化。
+"""
+import datetime
+import hashlib
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, String
+
+TRUE_STRINGS = frozenset(('1', 'true', 'yes', '是'))
+
+
+def _decimal_converter(field, scale, precision):
+    quantum = Decimal(1).scaleb(-scale)
+    limit = Decimal(10) ** (precision - scale)
+    zero = Decimal(0).quantize(quantum)
+    exponent = -scale
+
+    def convert(value, logger):
+        value_type = type(value)
+        try:
+            if value_type is Decimal:
+                # 已转换过的值（精度和范围都正确）原样保留
+                if value.as_tuple().exponent == exponent and value.is_finite() and abs(value) < limit:
+                    return value
+                number = value.quantize(quantum, ROUND_HALF_UP)
+            elif value_type is int:
+                number = Decimal(value).quantize(quantum, ROUND_HALF_UP)
+            elif value is None or value == '':
+                return zero
+            else:
+                # float 经 repr 转换，与原来按 str 转换的结果一致（避免二进制误差）
+                number = Decimal(value if value_type is str else repr(value)).quantize(quantum, ROUND_HALF_UP)
+            if not number.is_finite():
+                raise ValueError(value)
+        except (ValueError, TypeError, ArithmeticError):
+            if logger:
+                logger.warning(f"无法转换字段 {field} 的值: {value}")
+            return zero
+        if abs(number) >= limit:
+            if logger:
+                logger.warning(f"字段 {field} 的值超出列精度，已置空: {value}")
+            return None
+        return number
+
+    return convert
+
+
+def _integer_converter(field):
+    def convert(value, logger):
+        if type(value) is int:
+            return value
+        if value is None or value == '':
+            return 0
+        try:
+            return int(Decimal(value if isinstance(value, str) else str(value)))
+        except (ValueError, TypeError, ArithmeticError):
+            if logger:
+                logger.warning(f"无法转换字段 {field} 的值: {value}")
+            return 0
+
+    return convert
+
+
+def _boolean_converter(default):
+    def convert(value, logger):
+        if type(value) is bool:
+            return value
+        if isinstance(value, str):
+            return value.strip().lower() in TRUE_STRINGS
+        if value is None:
+            return default
+        return bool(value)
+
+    return convert
+
+
+def _string_converter(field, max_length):
+    def convert(value, logger):
+        if isinstance(value, str) and len(value) > max_length:
+            if logger:
+                logger.warning(f"字段 {field} 长度超限，已截断")
+            return value[:max_length]
+        return value
+
+    return convert
+
+
+class ItemSchema:
+    """模型列 -> item字段转换表
+
+    每列编译为一个转换函数，返回值与原值是同一对象时（已是正确类型和精度的值、未超长的字符串）不回写。
+    """
+
+    def __init__(self, model, item_class):
+        decimals, integers, booleans, strings = [], [], [], []
+        for column in model.__table__.columns:
+            if column.name not in item_class.fields:
+                continue
+            column_type = column.type
+            if isinstance(column_type, Boolean):
+                default = column.default.arg if column.default is not None and column.default.is_scalar else False
+                booleans.append((column.name, _boolean_converter(default)))
+            elif isinstance(column_type, Numeric):
+                converter = _decimal_converter(column.name, column_type.scale or 0, column_type.precision or 15)
+                decimals.append((column.name, converter))
+            elif isinstance(column_type, Integer):
+                integers.append((column.name, _integer_converter(column.name)))
+            elif isinstance(column_type, String) and column_type.length:
+                strings.append((column.name, _string_converter(column.name, column_type.length)))
+        # 保持原来按类型分组的处理顺序（告警顺序不变）
+        self.converters = tuple(decimals + integers + booleans + strings)
+
+    def convert(self, item, logger=None):
+        """原地转换一个item"""
+        # scrapy.Item 的值保存在 _values 中，直接读写省去 MutableMapping.get 和字段检查的开销；
+        # 转换表只包含item类中声明的字段
+        values = getattr(item, '_values', item)
+        for field, converter in self.converters:
+            value = values.get(field)
+            result = converter(value, logger)
+            if result is not value:
+                values[field] = result
+        return item
+
+    def convert_batch(self, items, logger=None):
+        """批量转换，返回转换后的item列表"""
+        convert = self.convert
+        return [convert(item, logger) for item in items]
+
+
+def arrow_schema(model, item_class, exclude=()):
+    """由模型列定义生成 pyarrow schema（只包含item中存在的字段），需要安装 pyarrow"""
+    import pyarrow as pa
+
+    fields = []
+    for column in model.__table__.columns:
+        if column.name not in item_class.fields or column.name in exclude:
+            continue
+        column_type = column.type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, Numeric):
+            arrow_type = pa.decimal128(column_type.precision or 15, column_type.scale or 0)
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, DateTime):
+            arrow_type = pa.timestamp('s')
+        elif isinstance(column_type, Date):
+            arrow_type = pa.date32()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=not column.primary_key))
+    return pa.schema(fields)
+
+
+class ContentHasher:
+    """业务字段的内容哈希
+
+    字段为模型列中item也有的字段（去掉 exclude，如每次都会变的 crawl_time），按列名排序后逐个序列化，
+    数值按值（1.50 与 1.5 相同）、日期按ISO格式、缺失与None相同，结果不依赖字段顺序和数值的表示方式。
+    """
+
+    def __init__(self, model, item_class, exclude=()):
+        self.fields = tuple(sorted(
+            column.name for column in model.__table__.columns
+            if column.name in item_class.fields and column.name not in exclude
+        ))
+
+    @staticmethod
+    def _canonical(value):
+        if value is None or value == '':
+            return b''
+        if isinstance(value, bool):
+            return b'1' if value else b'0'
+        if isinstance(value, (int, float, Decimal)):
+            return format(Decimal(str(value)).normalize(), 'f').encode()
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat().encode()
+        return str(value).encode('utf-8')
+
+    def hash(self, item):
+        """返回32位十六进制哈希"""
+        digest = hashlib.blake2b(digest_size=16)
+        canonical = self._canonical
+        for field in self.fields:
+            digest.update(field.encode())
+            digest.update(b'\x1f')
+            digest.update(canonical(item.get(field)))
+            digest.update(b'\x1e')
+        return digest.hexdigest()
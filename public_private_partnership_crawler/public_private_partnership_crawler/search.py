@@ -0,0 +1,261 @@
+"""项目全文检索：project_name、scale_content、private_enterprise_plan 上的 SQLite FTS5 索引
+
+索引是独立于业务库的SQLite边车文件（MySQL和SQLite后端都可用），由 SearchIndexPipeline 随抓取增量维护。
+FTS5自带的分词器不切分中文，写入前先自行分词：连续的中文按相邻两字切成二元组（“污水处理” ->
+“污水 水处 处理”），字母数字按词转小写，全角字符先按NFKC归一化。查询时每个词转为二元组短语，
+相当于子串匹配；多个词（空格分隔）须同时命中。单字查询按前缀匹配以该字开头的二元组（有单字前缀索引）。
+
+地区、行业和阶段作为标签词元写入单独的 tags 列，筛选条件与检索词一起在倒排表上求交集。
+
+排序使用FTS5内置的 bm25()（k1=1.2, b=0.75）在全部命中上计算，各列按 WEIGHTS 加权，项目名称权重最高，
+tags 列不参与打分；得分相同时较新入库的项目在前。bm25() 要扫描短语的全部命中统计文档频率，
+常用词的查询耗时随命中数增长。
+
+    index = SearchIndex('./tmp/franchise_spider/search.sqlite3').open()
+    index.search('污水处理', region='510600', project_stage='03')
+
+已有数据库可以一次性建立索引：
+
+    python -m public_private_partnership_crawler.search build ./tmp/franchise_spider/search.sqlite3
+    python -m public_private_partnership_crawler.search query ./tmp/franchise_spider/search.sqlite3 污水处理 --region 510600
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import unicodedata
+
+from public_private_partnership_crawler.divisions import ancestors
+
+TEXT_FIELDS = ('project_name', 'scale_content', 'private_enterprise_plan')
+FILTER_FIELDS = ('province_code', 'city_code', 'county_code', 'industry_code', 'project_stage')
+# 筛选字段在 tags 列中的词元前缀，如 province510000
+TAG_PREFIXES = {
+    'province_code': 'province',
+    'city_code': 'city',
+    'county_code': 'county',
+    'industry_code': 'industry',
+    'project_stage': 'stage',
+}
+# bm25() 列权重，与 TEXT_FIELDS 对应，tags 列为0
+WEIGHTS = (10.0, 2.0, 1.0)
+
+TOKEN_RE = re.compile(r'([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)|[0-9a-z]+')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    project_id TEXT NOT NULL UNIQUE,
+    digest TEXT NOT NULL
+);
+-- 文档数（documents）
+CREATE TABLE IF NOT EXISTS totals (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS project_text USING fts5({', '.join(TEXT_FIELDS)}, tags, prefix='1');
+"""
+
+
+def tokenize(text):
+    """文本 -> 词元列表：中文二元组（单字保留单字），字母数字按词"""
+    tokens = []
+    for match in TOKEN_RE.finditer(unicodedata.normalize('NFKC', text).lower()):
+        run = match.group(1)
+        if run is None:
+            tokens.append(match.group())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def parse_query(query):
+    """查询串 -> [(词元串, 是否前缀匹配)]，每个空格分隔的词一项"""
+    phrases = []
+    for word in query.split():
+        tokens = tokenize(word)
+        if len(tokens) == 1 and len(tokens[0]) == 1:
+            phrases.append((tokens[0], True))
+        elif tokens:
+            phrases.append((' '.join(tokens), False))
+    return phrases
+
+
+def match_expression(query):
+    """查询串 -> FTS5 MATCH 表达式；没有可检索的词时返回None"""
+    # 词元只含中文和字母数字，无需转义
+    phrases = [f'"{text}"*' if prefix else f'"{text}"' for text, prefix in parse_query(query)]
+    return ' '.join(phrases) or None
+
+
+def tag(field, value):
+    """筛选字段的标签词元，值中只保留字母数字"""
+    return TAG_PREFIXES[field] + re.sub(r'[^0-9a-z]', '', str(value).lower())
+
+
+def _digest(document):
+    values = [str(document.get(field) or '') for field in TEXT_FIELDS + FILTER_FIELDS]
+    return hashlib.blake2b('\x1f'.join(values).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class SearchIndex:
+    """项目全文索引，写入和查询可在不同线程中进行（共用一个连接，写入由调用方串行）"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def open(self):
+        if self.path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute("INSERT OR IGNORE INTO totals (name, value) VALUES ('documents', 0)")
+        return self
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT value FROM totals WHERE name = 'documents'").fetchone()[0]
+
+    def add(self, documents):
+        """在一个事务中写入或更新一批项目（含 project_id、TEXT_FIELDS 和 FILTER_FIELDS 的字典），
+        文本和筛选字段都未变化的跳过，返回重新索引的数量"""
+        indexed = added = 0
+        with self.conn:
+            for document in documents:
+                digest = _digest(document)
+                row = self.conn.execute('SELECT id, digest FROM projects WHERE project_id = ?',
+                                        (document['project_id'],)).fetchone()
+                if row is None:
+                    rowid = self.conn.execute('INSERT INTO projects (project_id, digest) VALUES (?, ?)',
+                                              (document['project_id'], digest)).lastrowid
+                    added += 1
+                elif row[1] == digest:
+                    continue
+                else:
+                    rowid = row[0]
+                    self.conn.execute('UPDATE projects SET digest = ? WHERE id = ?', (digest, rowid))
+                    self.conn.execute('DELETE FROM project_text WHERE rowid = ?', (rowid,))
+                texts = [' '.join(tokenize(document.get(field) or '')) for field in TEXT_FIELDS]
+                tags = ' '.join(tag(field, document[field]) for field in FILTER_FIELDS if document.get(field))
+                self.conn.execute(
+                    f"INSERT INTO project_text (rowid, {', '.join(TEXT_FIELDS)}, tags) "
+                    f"VALUES (?{', ?' * len(TEXT_FIELDS)}, ?)", (rowid, *texts, tags))
+                indexed += 1
+            self._count_documents(added)
+        return indexed
+
+    def remove(self, project_ids):
+        removed = 0
+        with self.conn:
+            for project_id in project_ids:
+                row = self.conn.execute('SELECT id FROM projects WHERE project_id = ?', (project_id,)).fetchone()
+                if row is not None:
+                    self.conn.execute('DELETE FROM project_text WHERE rowid = ?', row)
+                    self.conn.execute('DELETE FROM projects WHERE id = ?', row)
+                    removed += 1
+            self._count_documents(-removed)
+
+    def _count_documents(self, delta):
+        if delta:
+            self.conn.execute("UPDATE totals SET value = value + ? WHERE name = 'documents'", (delta,))
+
+    def search(self, query, region=None, industry_code=None, project_stage=None, limit=20, offset=0):
+        """按相关度返回 project_id 列表
+
+        region 为任一级行政区划代码（省、市或区县），industry_code 和 project_stage 为等值条件。
+        """
+        if not parse_query(query):
+            return []
+        filters = {'industry_code': industry_code, 'project_stage': project_stage}
+        if region:
+            province, city, county = ancestors(region)
+            if county:
+                filters['county_code'] = county
+            elif city:
+                filters['city_code'] = city
+            else:
+                filters['province_code'] = province
+        expression = f"{{{' '.join(TEXT_FIELDS)}}}: ({match_expression(query)})"
+        tags = [tag(field, value) for field, value in filters.items() if value]
+        if tags:
+            expression += f" AND tags: ({' '.join(tags)})"
+
+        # bm25() 越相关值越小
+        rows = self.conn.execute(
+            f"SELECT p.project_id FROM project_text t JOIN projects p ON p.id = t.rowid "
+            f"WHERE project_text MATCH ? "
+            f"ORDER BY bm25(project_text, {', '.join(map(str, WEIGHTS))}, 0.0), t.rowid DESC LIMIT ? OFFSET ?",
+            (expression, limit, offset)).fetchall()
+        return [row[0] for row in rows]
+
+
+def document(source):
+    """item、ORM对象或字典 -> 索引文档"""
+    get = source.get if hasattr(source, 'get') else lambda key: getattr(source, key, None)
+    return {field: get(field) for field in ('project_id',) + TEXT_FIELDS + FILTER_FIELDS}
+
+
+def build_from_db(index, engine, batch_size=1000):
+    """由数据库中已有的项目建立索引，返回重新索引的数量"""
+    from sqlalchemy import select
+    from model import FranchiseProject
+
+    columns = [getattr(FranchiseProject, field) for field in ('project_id',) + TEXT_FIELDS + FILTER_FIELDS]
+    indexed = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(select(*columns))
+        for rows in result.partitions():
+            indexed += index.add(dict(row._mapping) for row in rows)
+    return indexed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m public_private_partnership_crawler.search')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='由数据库（DB_BACKEND/DATABASE）建立或更新索引')
+    build.add_argument('path')
+    query = commands.add_parser('query', help='检索')
+    query.add_argument('path')
+    query.add_argument('query')
+    query.add_argument('--region')
+    query.add_argument('--industry-code')
+    query.add_argument('--project-stage')
+    query.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with SearchIndex(args.path).open() as index:
+        if args.command == 'build':
+            from scrapy.utils.project import get_project_settings
+            from public_private_partnership_crawler.storage import storage_backend
+
+            engine = storage_backend(get_project_settings(), 'franchise_spider').create_engine()
+            try:
+                print(f'indexed {build_from_db(index, engine)} projects, {len(index)} in index')
+            finally:
+                engine.dispose()
+        else:
+            for project_id in index.search(args.query, region=args.region, industry_code=args.industry_code,
+                                           project_stage=args.project_stage, limit=args.limit):
+                print(project_id)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
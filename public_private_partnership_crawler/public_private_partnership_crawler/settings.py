@@ -7,6 +7,8 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = "public_private_partnership_crawler"
 
 SPIDER_MODULES = ["public_private_partnership_crawler.spiders"]
@@ -19,7 +21,8 @@ NEWSPIDER_MODULE = "public_private_partnership_crawler.spiders"
 ROBOTSTXT_OBEY = False
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-# CONCURRENT_REQUESTS = 32
+# 各接口的实际并发由下面的自适应并发控制，这里只是总上限
+CONCURRENT_REQUESTS = 64
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
@@ -29,6 +32,81 @@ ROBOTSTXT_OBEY = False
 # CONCURRENT_REQUESTS_PER_DOMAIN = 16
 # CONCURRENT_REQUESTS_PER_IP = 16
 
+# 列表页下载槽：第一页返回总页数后其余页一次性调度，并发数受此限制
+LIST_CONCURRENCY = int(os.getenv('LIST_CONCURRENCY', '8'))
+DOWNLOAD_SLOTS = {
+    "list_api": {"concurrency": LIST_CONCURRENCY},
+}
+
+# 按接口自适应并发（AIMD）：list_api、detail_api、download_api 各自根据延迟、429/5xx 和接口的 SYS.429/SYS.5xx 调整并发，
+# 启用后上面的 LIST_CONCURRENCY 作为列表页的并发上限；ADAPTIVE_CONCURRENCY 为各接口的 起始/最小/最大 并发
+ADAPTIVE_CONCURRENCY_ENABLED = os.getenv('ADAPTIVE_CONCURRENCY_ENABLED', '1') == '1'
+ADAPTIVE_CONCURRENCY = {
+    "list_api": {"start": min(4, LIST_CONCURRENCY), "min": 1, "max": LIST_CONCURRENCY},
+    "detail_api": {"start": 4, "min": 1, "max": int(os.getenv('DETAIL_MAX_CONCURRENCY', '32'))},
+    "download_api": {"start": 2, "min": 1, "max": 8},
+}
+# 拥塞时并发乘以的系数
+ADAPTIVE_CONCURRENCY_DECREASE = 0.5
+# 延迟超过基线（观测到的最小延迟）的倍数视为拥塞
+ADAPTIVE_CONCURRENCY_LATENCY_FACTOR = 3.0
+# 两次降并发的最小间隔（秒），同一轮内的多个拥塞信号只降一次
+ADAPTIVE_CONCURRENCY_COOLDOWN = 1.0
+# 定时输出各接口当前并发的间隔（秒），0为不输出
+ADAPTIVE_CONCURRENCY_LOG_INTERVAL = 30
+# 列表页返回非 SYS.200 时单独重试的次数
+LIST_PAGE_MAX_RETRIES = 3
+
+# 统一重试：ResilientRetryMiddleware 取代 Scrapy 的 RetryMiddleware，按接口限制重试次数和重试预算，
+# 指数退避加随机抖动；接口返回的 code 不是 SYS.200 时同样重试（RETRY_PERMANENT_API_CODES 除外）
+RETRY_ENDPOINTS = {
+    "list_api": {"max_retries": LIST_PAGE_MAX_RETRIES},
+    "detail_api": {"max_retries": 3},
+    "flaresolverr": {"max_retries": 1},
+    # 附件下载（AttachmentDownloadPipeline）在管道线程中进行，同样使用这里的次数、预算和熔断
+    "download_api": {"max_retries": 3},
+}
+# 重试也不会成功的接口code（如项目不存在）
+RETRY_PERMANENT_API_CODES = ['SYS.404']
+# 第n次重试推迟 0~min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2^n) 秒
+RETRY_BACKOFF_BASE = 1.0
+RETRY_BACKOFF_MAX = 60.0
+# 重试预算：每个首次请求为所在接口积累 RETRY_BUDGET_RATIO 次重试额度，起始 RETRY_BUDGET_RESERVE，最多 RETRY_BUDGET_MAX
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_RESERVE = 10
+RETRY_BUDGET_MAX = 100
+# 熔断：最近 CIRCUIT_BREAKER_WINDOW 个请求中失败比例达到阈值时暂停该接口，CIRCUIT_BREAKER_OPEN_SECONDS 秒后
+# 放行一个探测请求，探测失败则暂停时间加倍（最长 CIRCUIT_BREAKER_MAX_OPEN_SECONDS）
+CIRCUIT_BREAKER_WINDOW = 20
+CIRCUIT_BREAKER_MIN_REQUESTS = 10
+CIRCUIT_BREAKER_FAILURE_RATIO = 0.5
+CIRCUIT_BREAKER_OPEN_SECONDS = 30
+CIRCUIT_BREAKER_MAX_OPEN_SECONDS = 300
+
+# 增量抓取水位来源：checkpoint（上次成功运行写入的检查点）、db（franchise_projects.update_time最大值）
+# 或 auto（先检查点；检查点文件不存在时才用数据库，全量抓取中断后不会退回到数据库水位）；
+# 命令行 -a last_update_time=... 优先
+INCREMENTAL_WATERMARK_SOURCE = os.getenv('INCREMENTAL_WATERMARK_SOURCE', 'auto')
+CHECKPOINT_PATH = './tmp/{}/checkpoint.json'
+# 列表接口按operateTime倒序返回时，增量抓取遇到整页早于水位即停止翻页
+LIST_ORDERED_BY_OPERATE_TIME = True
+
+# 详情缓存：以 (project_id, operateTime) 为键缓存详情接口数据，项目未变化时不再请求详情接口
+DETAIL_CACHE_ENABLED = os.getenv('DETAIL_CACHE_ENABLED', '1') == '1'
+DETAIL_CACHE_PATH = './tmp/{}/detail_cache.sqlite3'
+DETAIL_CACHE_MAX_AGE_DAYS = 30  # 超过该天数未被使用的条目淘汰
+DETAIL_CACHE_MAX_ENTRIES = 500000  # 超出时淘汰最久未使用的条目
+
+# 附件下载（-a download_attachments=true 时生效）：按内容哈希存储，支持断点续传
+ATTACHMENT_STORE = os.getenv('ATTACHMENT_STORE', './tmp/{}/attachments')
+ATTACHMENT_DOWNLOAD_THREADS = 4  # 同时下载的附件数（启用自适应并发时由 ADAPTIVE_CONCURRENCY['download_api'] 决定）
+ATTACHMENT_DOWNLOAD_TIMEOUT = 120
+
+# 实时指标：StatisticsPipeline 在本地端口以Prometheus文本格式暴露指标
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9410'))
+
 # Disable cookies (enabled by default)
 # COOKIES_ENABLED = False
 
@@ -45,14 +123,18 @@ ROBOTSTXT_OBEY = False
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 SPIDER_MIDDLEWARES = {
     "public_private_partnership_crawler.middlewares.PublicPrivatePartnershipCrawlerSpiderMiddleware": 543,
-    "public_private_partnership_crawler.middlewares.FlareSolverrMiddleware": 540,
 }
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-# DOWNLOADER_MIDDLEWARES = {
-#    "public_private_partnership_crawler.middlewares.PublicPrivatePartnershipCrawlerDownloaderMiddleware": 543,
-# }
+DOWNLOADER_MIDDLEWARES = {
+    # "public_private_partnership_crawler.middlewares.PublicPrivatePartnershipCrawlerDownloaderMiddleware": 543,
+    "public_private_partnership_crawler.middlewares.FlareSolverrMiddleware": 540,
+    "scrapy.downloadermiddlewares.retry.RetryMiddleware": None,
+    "public_private_partnership_crawler.middlewares.ResilientRetryMiddleware": 550,
+    # 排在 RetryMiddleware（550）之后，先于重试看到 429/5xx
+    "public_private_partnership_crawler.middlewares.AdaptiveConcurrencyMiddleware": 580,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
@@ -65,22 +147,103 @@ SPIDER_MIDDLEWARES = {
 ITEM_PIPELINES = {
     'public_private_partnership_crawler.pipelines.DuplicatesPipeline': 200,
     'public_private_partnership_crawler.pipelines.DataValidationPipeline': 300,
-    'public_private_partnership_crawler.pipelines.MySQLPipeline': 400,
+    'public_private_partnership_crawler.pipelines.AttachmentDownloadPipeline': 350,
+    'public_private_partnership_crawler.pipelines.AsyncDatabasePipeline': 400,
+    'public_private_partnership_crawler.pipelines.SearchIndexPipeline': 450,
     'public_private_partnership_crawler.pipelines.PublicPrivatePartnershipCrawlerPipeline': 500,
+    'public_private_partnership_crawler.pipelines.ParquetExportPipeline': 550,
     'public_private_partnership_crawler.pipelines.StatisticsPipeline': 600,
 }
 
-import os
+# 管道耗时统计：把 ITEM_PIPELINES 的每一项换成带计时的包装，无需修改各管道
+PIPELINE_TIMING_ENABLED = os.getenv('PIPELINE_TIMING_ENABLED', '0') == '1'
+if PIPELINE_TIMING_ENABLED:
+    from public_private_partnership_crawler.instrumentation import timed_pipelines
+
+    ITEM_PIPELINES = timed_pipelines(ITEM_PIPELINES)
+# 设置后采样调用栈并写出 folded stacks 文件（flamegraph.pl / speedscope 可直接读取）
+PIPELINE_PROFILE_PATH = os.getenv('PIPELINE_PROFILE_PATH')
+PIPELINE_PROFILE_INTERVAL = 0.01
 
 FLARESOLVERR_URL = os.getenv('FLARESOLVERR_URL', 'http://localhost:8191/v1')
+FLARESOLVERR_MAX_CONCURRENCY = 1  # 同时进行的FlareSolverr求解数
+FLARESOLVERR_MAX_TIMEOUT = 60000  # 单次求解超时（毫秒）
+# 清除cookie缓存，多次运行及并行进程共享；cookie未给出过期时间时按默认有效期（秒）处理
+CLEARANCE_CACHE_PATH = os.getenv('CLEARANCE_CACHE_PATH', './tmp/{}/clearance.json')
+CLEARANCE_DEFAULT_TTL = 1800
 DATABASE = {
     'host': os.getenv('DB_HOST', '127.0.0.1'),
     'port': int(os.getenv('DB_PORT', '3306')),
     'user': os.getenv('DB_USER', 'root'),
     'password': os.getenv('DB_PASSWORD', '123456'),
     'database': os.getenv('DB_NAME', 'ppp_project'),
-    'charset': os.getenv('DB_CHARSET', 'utf8mb4')
+    'charset': os.getenv('DB_CHARSET', 'utf8mb4'),
+    # 完整连接URL，设置后忽略上面各项
+    'url': os.getenv('DB_URL'),
 }
+# 存储后端：mysql（DATABASE中的MySQL服务器）或 sqlite（本地SQLite文件，WAL模式），见 storage.py
+# DATABASE['url'] 为 sqlite:/// 时总是使用SQLite
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
+SQLITE_PATH = os.getenv('SQLITE_PATH', './tmp/{}/ppp.sqlite3')
+
+# JSON导出：jsonl（每行一个item，崩溃后仍可用）或 json（标准JSON数组）
+JSON_EXPORT_FORMAT = os.getenv('JSON_EXPORT_FORMAT', 'jsonl')
+# 缓冲达到条数或间隔秒数后落盘
+JSON_EXPORT_FLUSH_ITEMS = 100
+JSON_EXPORT_FLUSH_INTERVAL = 5.0
+
+# 分布式模式：多个进程/节点共享Redis中的请求队列和请求指纹集合，见 distributed.py
+DISTRIBUTED_ENABLED = os.getenv('DISTRIBUTED_ENABLED', '0') == '1'
+REDIS_URL = os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/0')
+REDIS_KEY_PREFIX = 'ppp:{}'
+REDIS_HEARTBEAT_INTERVAL = 10.0
+REDIS_LEASE_TTL = 60  # 进程心跳超过该秒数未刷新时，其处理中的请求重新入队
+REDIS_IDLE_POLL_INTERVAL = 0.5  # 发送缓冲的新请求和确认删除、本地取空后检查共享队列的间隔
+REDIS_PREFETCH = 8  # 每次从共享队列预取的请求数
+REDIS_PUSH_BATCH = 100  # 本地缓冲的新请求达到该数量时立即入队
+if DISTRIBUTED_ENABLED:
+    SCHEDULER = 'public_private_partnership_crawler.distributed.RedisScheduler'
+    DUPEFILTER_CLASS = 'public_private_partnership_crawler.distributed.RedisDupeFilter'
+
+# Parquet导出：按 province_code/crawl_date 分区的列式文件，需要安装 pyarrow
+PARQUET_EXPORT_ENABLED = os.getenv('PARQUET_EXPORT_ENABLED', '0') == '1'
+PARQUET_EXPORT_PATH = './tmp/{}/parquet'
+PARQUET_ROW_GROUP_SIZE = 5000  # 每个分区缓冲满该行数写出一个row group
+PARQUET_COMPRESSION = 'zstd'
+
+# 数据库批量写入：缓冲后以多行upsert提交（MySQL ON DUPLICATE KEY UPDATE，SQLite ON CONFLICT DO UPDATE）
+MYSQL_BULK_ENABLED = os.getenv('MYSQL_BULK_ENABLED', '0') == '1'
+MYSQL_BULK_SIZE = 500  # 缓冲条数达到该值时写入
+MYSQL_BULK_INTERVAL = 10.0  # 最长写入间隔（秒）
+MYSQL_BULK_RETRIES = 3  # 写入失败的批次放回缓冲区重试的次数，连续失败超过后丢弃并计入 db/failed_rows
+# AsyncDatabasePipeline：写入线程数（SQLite固定为1）及最大在途写入数（超出后item排队，形成背压）
+MYSQL_ASYNC_THREADS = 4
+MYSQL_ASYNC_MAX_PENDING = 100
+
+# 二级索引集合：none（只有主键和唯一索引）、model（模型中的单列索引）、curated（组合索引，见 model.CURATED_INDEXES）
+DB_INDEX_SET = os.getenv('DB_INDEX_SET', 'model')
+# 全量导入模式：建表时只建主键和唯一索引（已有表的二级索引先删除），爬虫结束后一次性建立 DB_INDEX_SET 中的索引
+DB_BULK_LOAD = os.getenv('DB_BULK_LOAD', '0') == '1'
+# 内容变化检测：业务字段哈希与库中相同的项目不再UPDATE整行，只更新 last_seen_time
+CONTENT_HASH_ENABLED = os.getenv('CONTENT_HASH_ENABLED', '1') == '1'
+# 启动时把全部 project_id -> content_hash 读入内存，之后判断是否变化不再查询数据库
+CONTENT_HASH_PRELOAD = os.getenv('CONTENT_HASH_PRELOAD', '0') == '1'
+# 项目汇总表（省份/行业/实施模式/阶段 -> 项目数、投资合计）随项目写入增量维护，见 rollup.py
+ROLLUP_ENABLED = os.getenv('ROLLUP_ENABLED', '1') == '1'
+# 启动时无条件全量重建汇总表；合计不一致时会自动重建，只在分组之间移动的手工修改需要手动开启
+ROLLUP_REBUILD = os.getenv('ROLLUP_REBUILD', '0') == '1'
+
+# 全文索引：project_name/scale_content/private_enterprise_plan 的 SQLite FTS5 边车文件，见 search.py
+SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', '0') == '1'
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', './tmp/{}/search.sqlite3')
+SEARCH_INDEX_BATCH_SIZE = 500  # 缓冲条数达到该值时写入一批
+
+# 去重：memory（单次运行内）或 bloom（磁盘布隆过滤器，跨运行）
+DEDUP_BACKEND = os.getenv('DEDUP_BACKEND', 'memory')
+# 启动时用数据库中已有的项目/附件预热去重存储
+DEDUP_SEED_FROM_DB = os.getenv('DEDUP_SEED_FROM_DB', '0') == '1'
+DEDUP_BLOOM_CAPACITY = 2000000
+DEDUP_BLOOM_ERROR_RATE = 0.001
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
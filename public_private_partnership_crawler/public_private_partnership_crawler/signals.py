@@ -0,0 +1,7 @@
+"""项目自定义的Scrapy信号"""
+
+# 数据库写入完成：参数 seconds（耗时）、rows（写入的行数）、unchanged（内容未变化、只更新 last_seen_time 的项目数）
+db_flushed = object()
+
+# 数据已提交到数据库：参数 projects（[(project_id, update_time)]）、attachments（[attachment_id]）
+db_persisted = object()
@@ -1,10 +1,21 @@
 import scrapy
+import sqlite3
 import traceback
 import json
+import os
 import re
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from scrapy import Request
 from ..items import FranchiseProjectItem, FranchiseAttachmentItem
+from ..clearance import ClearanceCache
+from ..detail_cache import DetailCache
+from ..divisions import get_index
+from ..field_mapping import FieldMapper, loads
+from ..middlewares import RetryLater
+from ..storage import storage_backend
+from model import FranchiseProject
+from sqlalchemy import func, select
 
 
 class FranchiseSpider(scrapy.Spider):
@@ -30,34 +41,372 @@ class FranchiseSpider(scrapy.Spider):
         'X-Auth-Token': 'null'
     }
 
+    # cookies失效时接口返回的HTTP状态码
+    challenge_statuses = [401, 403, 503]
+    # 单个请求因cookies失效最多重试的次数
+    max_clearance_retries = 2
+    # 是否生成起始请求；分布式模式下由调度器设置，只有协调者生成
+    should_seed = True
+
+    # 代码表
+    code_tables = {
+        "PROJECT_LEVEL": {
+            "A00001": "国家级",
+            "A00002": "省级",
+            "A00003": "市级",
+            "A00004": "县级",
+            "A00099": "其他"
+        },
+        "GOV_INV_TYPE": {
+            "A00001": "无",
+            "A00002": "直接投资",
+            "A00003": "资本金注入",
+            "A00004": "投资补助",
+            "A00005": "贷款贴息"
+        },
+        "PROJECT_TYPE": {
+            "A00001": "新建项目",
+            "A00002": "改扩建项目",
+            "A00003": "不涉及新建、改扩建的存量项目"
+        },
+        "ENTTYPE": {
+            "A00001": "民营企业",
+            "A00002": "外商投资企业",
+            "A00003": "中央企业",
+            "A00004": "项目所在地省级国有企业",
+            "A00005": "项目所在地市级国有企业",
+            "A00006": "项目所在地县级国有企业",
+            "A00007": "非项目所在地其他国有企业",
+            "A00099": "其他"
+        },
+        "EXEC_MODE": {
+            "A00001": "BOT",
+            "A00002": "TOT",
+            "A00003": "ROT",
+            "A00004": "BOOT",
+            "A00005": "DBFOT",
+            "A00006": "BOO",
+            "A00099": "其他"
+        },
+        "BID_TYPE": {
+            "A00001": "公开招标",
+            "A00099": "其他公开竞争方式"
+        }
+    }
+
+    stage_names = {
+        '01': '特许经营方案编制阶段',
+        '02': '特许经营方案论证阶段',
+        '03': '特许经营者选择阶段',
+        '04': '特许经营协议签订阶段',
+        '05': '特许经营项目建设或运营阶段',
+        '06': '特许经营项目移交阶段'
+    }
+
+    # 项目item字段映射：(item字段, 数据来源, 源字段, 转换器[, 缺失默认值])，见 field_mapping.py
+    project_fields = (
+        # 基本信息（来自列表页）
+        ('project_id', 'list', 'id', None),
+        ('project_code', 'list', 'projectCode', None),
+        ('project_name', 'list', 'projectName', None),
+
+        # 项目分类信息
+        ('project_level', 'list', 'projectLevel', None),
+        ('project_level_name', 'list', 'projectLevel', 'code:PROJECT_LEVEL'),
+        ('industry_code', 'list', 'theIndustry', None),
+        ('industry_name', 'list', 'theIndustryName', None),
+        ('project_type', 'list', 'projectType', None),
+        ('project_type_name', 'list', 'projectTypeName', None),
+
+        # 实施模式
+        ('exec_mode', 'list', 'execMode', None),
+        ('exec_mode_name', 'list', 'execModeName', None),
+
+        # 投资信息
+        ('total_investment', 'list', 'planTotalMoney', 'decimal', 0),
+        ('scale_content', 'list', 'scaleContent', None),
+
+        # 项目阶段
+        ('project_stage', 'list', 'stageType', None),
+        ('project_stage_name', 'list', 'stageType', 'stage'),
+
+        # 实施机构信息
+        ('implement_org_name', 'list', 'enforBodyName', None),
+        ('implement_contact', 'list', 'enforBodyLinp', None),
+        ('implement_phone', 'list', 'enBodyTel', None),
+
+        # 咨询机构信息
+        ('consult_org_name', 'list', 'consOrgName', None),
+        ('consult_contact', 'list', 'consOrgPri', None),
+        ('consult_phone', 'list', 'consOrgPriTel', None),
+
+        # 法律机构信息
+        ('law_firm_name', 'list', 'lawFirmName', None),
+        ('law_firm_contact', 'list', 'lawFirmPri', None),
+        ('law_firm_phone', 'list', 'lawFirmPriTel', None),
+
+        # 授权政府
+        ('mandate_gov', 'list', 'mandateGov', None),
+
+        # 状态信息
+        ('is_published', 'list', 'isEnable', 'flag', '1'),
+        ('verification_code', 'list', 'verificationCode', None),
+
+        # 时间戳
+        ('create_time', 'list', 'createTime', 'datetime'),
+        ('update_time', 'list', 'operateTime', 'datetime'),
+
+        # 详情页投资信息
+        ('expected_private_capital', 'PaEbPppProjectVo', 'expPriCap', 'decimal', 0),
+        ('expected_project_capital', 'PaEbPppProjectVo', 'expectedProjectCapital', 'decimal', 0),
+
+        # 特许经营参数信息
+        ('franchise_period', 'PaEbArgumentInfoVo', 'franDeadline', 'int', 0),
+        ('pre_start_date', 'PaEbArgumentInfoVo', 'preStartDate', 'date'),
+        ('pre_end_date', 'PaEbArgumentInfoVo', 'preComplDate', 'date'),
+
+        # 政府补贴信息
+        ('has_gov_subsidy', 'PaEbArgumentInfoVo', 'isGovInvSupport', 'flag', '0'),
+        ('gov_invest_type', 'PaEbArgumentInfoVo', 'invSupportType', 'code:GOV_INV_TYPE'),
+        ('gov_invest_ratio', 'PaEbArgumentInfoVo', 'preGovInvRatio', 'decimal', 0),
+        ('gov_representative', 'PaEbArgumentInfoVo', 'govInvReferee', None),
+        ('gov_share_ratio', 'PaEbArgumentInfoVo', 'govInvRefereeBonus', 'decimal', 0),
+        ('gov_invest_capital', 'PaEbArgumentInfoVo', 'preGovInvCap', 'decimal', 0),
+
+        # 运营补贴信息
+        ('has_operation_subsidy', 'PaEbArgumentInfoVo', 'isOperSubsidy', 'flag', '0'),
+        ('subsidy_source', 'PaEbArgumentInfoVo', 'operSubsidySource', None),
+        ('subsidy_limit', 'PaEbArgumentInfoVo', 'operSubsidyLimit', 'decimal', 0),
+        ('subsidy_mode', 'PaEbArgumentInfoVo', 'operSubsidyMode', None),
+
+        # 民营企业参与
+        ('private_enterprise_plan', 'PaEbArgumentInfoVo', 'privateEntPlan', None),
+        ('private_share_ratio', 'PaEbArgumentInfoVo', 'privateEntPlan', 'private_ratio'),
+
+        # 招投标信息（取第一条）
+        ('bidding_method', 'InvbidsVo[0]', 'bidType', 'code:BID_TYPE'),
+        ('bidding_time', 'InvbidsVo[0]', 'pubBidDate', 'date'),
+
+        # 中标信息（多条以逗号拼接）
+        ('winner_nature', 'WinbidsVo[*]', 'enttype', 'code:ENTTYPE'),
+        ('winner_names', 'WinbidsVo[*]', 'winbidEntname', None),
+
+        # 审批信息
+        ('approval_org_name', 'PaDfPlanapprInfoVo', 'apprOrgName', None),
+        ('approval_date', 'PaDfPlanapprInfoVo', 'apprDate', 'date'),
+    )
+
     def __init__(self, *args, **kwargs):
         super(FranchiseSpider, self).__init__(*args, **kwargs)
         # 初始化参数
-        self.incremental = kwargs.get('incremental', True)
+        # 命令行 -a 传入的都是字符串，'false'/'0' 需要显式转换
+        self.incremental = self.to_bool(kwargs.get('incremental', True))
         self.last_update_time = kwargs.get('last_update_time', None)
-        self.download_attachments = kwargs.get('download_attachments', False)
+        self.download_attachments = self.to_bool(kwargs.get('download_attachments', False))
+        self.max_operate_time = None
+        # 本次运行未能抓取的项目中最早的operateTime，检查点不越过它；'' 表示有未知时间的失败
+        self.oldest_failure = None
+        self.detail_cache = None
         self.cookies = {}
+        self.clearance_user_agent = None
+        self.clearance_refreshing = False
+        self.parked_requests = []
+        self.project_mapper = self.compile_field_mapping(self.project_fields)
+
+    @staticmethod
+    def to_bool(value):
+        if isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes')
+        return bool(value)
+
+    def compile_field_mapping(self, spec):
+        """把映射规则编译为字段提取器，转换器绑定到当前实例（子类可覆盖）"""
+        return FieldMapper(spec, {
+            'decimal': self.safe_decimal,
+            'int': self.safe_int,
+            'date': self.parse_date,
+            'datetime': self.parse_datetime,
+            'flag': lambda value: value == '1',
+            'private_ratio': self.extract_private_ratio,
+            'stage': self.get_stage_name,
+            'code': self.code_converter,
+        })
 
     def start_requests(self):
+        if self.incremental and not self.last_update_time:
+            self.last_update_time = self.resolve_watermark()
+            if not self.last_update_time:
+                self.mark_full_crawl_started()
+
+        if self.settings.getbool('DETAIL_CACHE_ENABLED', False):
+            self.detail_cache = DetailCache(
+                self.settings.get('DETAIL_CACHE_PATH', './tmp/{}/detail_cache.sqlite3').format(self.name),
+                max_age_days=self.settings.getint('DETAIL_CACHE_MAX_AGE_DAYS', 30),
+                max_entries=self.settings.getint('DETAIL_CACHE_MAX_ENTRIES', 500000),
+            )
+
+        # 优先复用缓存中未过期的清除cookie，避免每次运行都调用FlareSolverr；
+        # 只消费共享队列的进程也要加载，否则每个进程都从被拦截开始、各自求解一次
+        cache_path = self.settings.get('CLEARANCE_CACHE_PATH')
+        entry = ClearanceCache(cache_path.format(self.name)).load() if cache_path else None
+        if entry:
+            self.apply_clearance(entry['cookies'], entry.get('user_agent'))
+            self.logger.info(f"复用缓存的cookies: {self.cookies}")
+
+        if not self.should_seed:
+            self.logger.info("分布式模式：起始请求由协调者生成，本进程只消费共享队列")
+            return
+
+        if entry:
+            yield self.list_request(1)
+            return
+
         # 首先访问主页获取cookies
         yield scrapy.Request(
             url=self.base_url,
             headers=self.headers,
             callback=self.get_cookies,
-            meta={'use_flaresolverr': True}
+            meta={'use_flaresolverr': True, 'clearance_cache': True}
         )
 
     def get_cookies(self, response):
         """获取cookies后开始正式抓取"""
         # 从response中提取cookies
         if hasattr(response, 'cookies'):
-            self.cookies = response.cookies
+            self.apply_clearance(response.cookies, getattr(response, 'user_agent', None))
             self.logger.info(f"获取到cookies: {self.cookies}")
 
-        # 构建请求体
+        yield self.list_request(1)
+
+    def apply_clearance(self, cookies, user_agent=None):
+        """保存清除cookie；cookie与获取它的User-Agent绑定，需一起使用"""
+        self.cookies = cookies
+        if user_agent:
+            self.clearance_user_agent = user_agent
+
+    def api_headers(self):
+        """构造API请求头，附带cookies"""
+        headers = self.headers.copy()
+        if self.clearance_user_agent:
+            headers['User-Agent'] = self.clearance_user_agent
+        if self.cookies:
+            cookie_str = '; '.join([f'{k}={v}' for k, v in self.cookies.items()])
+            headers['Cookie'] = cookie_str
+        return headers
+
+    def resolve_watermark(self):
+        """增量抓取未指定last_update_time时，从检查点文件或数据库推导水位
+
+        auto 模式下只有检查点文件不存在（本版本从未运行过，库中数据来自此前完成的抓取）时才使用数据库水位；
+        检查点文件存在但没有水位说明上次全量抓取未完成，库中的最大更新时间之前可能还有未抓取的项目。
+        """
+        source = self.settings.get('INCREMENTAL_WATERMARK_SOURCE', 'auto')
+        checkpoint = self.load_checkpoint()
+        watermark = None
+        if source in ('checkpoint', 'auto') and checkpoint is not None:
+            watermark = checkpoint.get('last_update_time')
+        if watermark is None and (source == 'db' or (source == 'auto' and checkpoint is None)):
+            watermark = self.query_db_watermark()
+
+        if watermark:
+            self.logger.info(f"增量抓取水位: {watermark}")
+        else:
+            self.logger.info("未找到增量抓取水位，执行全量抓取")
+        return watermark
+
+    def checkpoint_path(self):
+        return self.settings.get('CHECKPOINT_PATH', './tmp/{}/checkpoint.json').format(self.name)
+
+    def load_checkpoint(self):
+        """检查点文件内容，不存在时返回None"""
+        try:
+            with open(self.checkpoint_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_checkpoint(self, checkpoint):
+        path = self.checkpoint_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(path + '.tmp', path)
+
+    def mark_full_crawl_started(self):
+        """全量抓取开始时写入没有水位的检查点，中断后下次运行不会退回到数据库水位"""
+        checkpoint = self.load_checkpoint() or {}
+        if not checkpoint.get('last_update_time'):
+            self.write_checkpoint({'last_update_time': None, 'started_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+
+    def query_db_watermark(self):
+        """数据库中已入库项目的最大更新时间"""
+        engine = storage_backend(self.settings, self.name).create_engine()
+        try:
+            with engine.connect() as conn:
+                value = conn.execute(select(func.max(FranchiseProject.update_time))).scalar()
+        except Exception as e:
+            self.logger.warning(f"从数据库读取增量水位失败: {e}")
+            return None
+        finally:
+            engine.dispose()
+        return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+    def closed(self, reason):
+        if self.detail_cache is not None:
+            try:
+                evicted = self.detail_cache.evict()
+                self.logger.info(f"详情缓存: 命中 {self.detail_cache.hits}, 未命中 {self.detail_cache.misses}, 淘汰 {evicted}")
+                self.detail_cache.close()
+            except sqlite3.Error as e:
+                self.logger.warning(f"详情缓存淘汰失败: {e}")
+        self.save_checkpoint(reason)
+
+    def save_checkpoint(self, reason):
+        """运行成功结束（无错误日志）时写入检查点，作为下次增量抓取的水位
+
+        有项目未能抓取时水位不越过其中最早的operateTime，下次增量抓取会重新抓取这些项目。
+        """
+        if reason != 'finished' or not self.max_operate_time:
+            return
+        if self.crawler.stats.get_value('log_count/ERROR', 0):
+            self.logger.warning("本次运行存在错误，不更新增量检查点")
+            return
+        if self.crawler.stats.get_value('db/failed_rows', 0):
+            self.logger.warning("本次运行有数据未能写入数据库，不更新增量检查点")
+            return
+
+        watermark = max(filter(None, [self.max_operate_time, self.last_update_time]))
+        if self.oldest_failure is not None:
+            try:
+                capped = (datetime.strptime(self.oldest_failure, '%Y-%m-%d %H:%M:%S')
+                          - timedelta(seconds=1)).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                self.logger.warning("存在未能抓取且没有更新时间的项目，不更新增量检查点")
+                return
+            if capped < watermark:
+                self.logger.warning(f"{self.crawler.stats.get_value('checkpoint/failed_projects')} 个项目未能抓取，"
+                                    f"水位限制在 {capped}")
+                watermark = capped
+            if self.last_update_time and watermark <= self.last_update_time:
+                self.logger.info("水位未推进，检查点保持不变")
+                return
+
+        self.write_checkpoint({'last_update_time': watermark, 'finished_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        self.logger.info(f"增量检查点已更新: {watermark}")
+
+    def record_failed_project(self, list_data, reason):
+        """项目详情未能抓取：记录最早的operateTime，保存检查点时水位不越过它"""
+        self.crawler.stats.inc_value('checkpoint/failed_projects')
+        operate_time = list_data.get('operateTime') or ''
+        if self.oldest_failure is None or operate_time < self.oldest_failure:
+            self.oldest_failure = operate_time
+        self.logger.warning(f"项目 {list_data.get('id')} 未能抓取（{reason}），下次增量抓取时重试")
+
+    def list_request(self, page_num):
+        """构建列表页请求"""
         body = {
             "pageSize": 100,  # 每页100条，减少请求次数
-            "pageNum": 1,
+            "pageNum": page_num,
             "projectCode": "",
             "projectName": "",
             "apprOrgno": "",
@@ -66,224 +415,217 @@ class FranchiseSpider(scrapy.Spider):
             "planTotalMoneyStart": "",
             "planTotalMoneyEnd": ""
         }
-
-        # 更新headers，添加cookies
-        headers = self.headers.copy()
-        if self.cookies:
-            cookie_str = '; '.join([f'{k}={v}' for k, v in self.cookies.items()])
-            headers['Cookie'] = cookie_str
-
-        yield scrapy.Request(
+        return scrapy.Request(
             url=self.list_api,
             method='POST',
-            headers=headers,
+            headers=self.api_headers(),
             body=json.dumps(body),
             callback=self.parse_list,
-            meta={'page_num': 1}
+            errback=self.list_failed,
+            priority=10,  # 列表页优先，尽早得到全部项目
+            meta={
+                'page_num': page_num,
+                'handle_httpstatus_list': self.challenge_statuses,
+                # 列表页使用独立的下载槽，并发上限见 settings.DOWNLOAD_SLOTS
+                'download_slot': 'list_api',
+            }
+        )
+
+    def list_failed(self, failure):
+        """列表页在下载层重试耗尽后仍失败"""
+        if failure.check(RetryLater):
+            return
+        page_num = failure.request.meta.get('page_num')
+        self.logger.error(f"列表页 {page_num} 请求失败: {failure.value}")
+
+    def is_challenged(self, response):
+        """cookies失效时接口返回鉴权错误或验证页面而不是JSON"""
+        return response.status in self.challenge_statuses or not response.text.lstrip().startswith('{')
+
+    def refresh_clearance(self, request):
+        """cookies失效：暂存失败的请求，同一时间只发起一次刷新"""
+        if request.meta.get('clearance_retries', 0) >= self.max_clearance_retries:
+            self.logger.error(f"刷新cookies后仍被拦截，放弃请求: {request.url}")
+            if 'list_data' in request.meta:
+                self.record_failed_project(request.meta['list_data'], 'cookies')
+            return
+        self.parked_requests.append(request)
+        if self.clearance_refreshing:
+            return
+
+        self.clearance_refreshing = True
+        self.logger.warning("cookies已失效，重新获取")
+        yield scrapy.Request(
+            url=self.base_url,
+            headers=self.headers,
+            callback=self.on_clearance_refreshed,
+            errback=self.on_clearance_failed,
+            dont_filter=True,
+            priority=100,
+            meta={'use_flaresolverr': True, 'clearance_cache': True, 'stale_cookies': self.cookies}
         )
 
+    def on_clearance_refreshed(self, response):
+        """刷新完成后用新的cookies重发暂存的请求"""
+        self.apply_clearance(response.cookies, getattr(response, 'user_agent', None))
+        self.clearance_refreshing = False
+        parked, self.parked_requests = self.parked_requests, []
+        self.logger.info(f"cookies已刷新，重发 {len(parked)} 个请求")
+        for request in parked:
+            meta = dict(request.meta, clearance_retries=request.meta.get('clearance_retries', 0) + 1)
+            yield request.replace(headers=self.api_headers(), meta=meta, dont_filter=True)
+
+    def on_clearance_failed(self, failure):
+        self.logger.error(f"刷新cookies失败，丢弃 {len(self.parked_requests)} 个请求: {failure.value}")
+        for request in self.parked_requests:
+            if 'list_data' in request.meta:
+                self.record_failed_project(request.meta['list_data'], 'cookies')
+        self.clearance_refreshing = False
+        self.parked_requests = []
+
     def parse_list(self, response):
         """解析列表页"""
-        try:
-            data = json.loads(response.text)
-            if data['code'] == 'SYS.200':
-                result = data['data']
-                projects = result.get('list', [])
-
-                # 处理每个项目
-                for project in projects:
-                    # 增量抓取逻辑：检查更新时间
-                    if self.incremental and self.last_update_time:
-                        operate_time = project.get('operateTime', '')
-                        if operate_time and operate_time <= self.last_update_time:
-                            continue
-
-                    # 请求详情页
-                    project_id = project['id']
-                    detail_url = self.detail_api.format(project_id)
-                    headers = self.headers.copy()
-                    if self.cookies:
-                        cookie_str = '; '.join([f'{k}={v}' for k, v in self.cookies.items()])
-                        headers['Cookie'] = cookie_str
-
-                    yield scrapy.Request(
-                        url=detail_url,
-                        headers=headers,
-                        callback=self.parse_detail,
-                        meta={'list_data': project}
-                    )
-
-                # 翻页逻辑
-                current_page = result.get('pageNum', 1)
-                total_pages = result.get('pages', 1)
+        if self.is_challenged(response):
+            yield from self.refresh_clearance(response.request)
+            return
 
+        try:
+            data = loads(response.body)
+            if data['code'] != 'SYS.200':
+                # 重试由 ResilientRetryMiddleware 完成，到这里说明重试已用完
+                self.logger.error(f"列表页 {response.meta.get('page_num')} 返回 {data['code']}，放弃")
+                self.crawler.stats.inc_value(f"api_code/list_api/{data['code']}")
+                return
+
+            result = data['data']
+            projects = result.get('list', [])
+
+            # 处理每个项目
+            fresh_count = 0
+            for project in projects:
+                operate_time = project.get('operateTime', '')
+                if operate_time and (self.max_operate_time is None or operate_time > self.max_operate_time):
+                    self.max_operate_time = operate_time
+
+                # 增量抓取逻辑：检查更新时间
+                if self.incremental and self.last_update_time:
+                    if operate_time and operate_time <= self.last_update_time:
+                        continue
+                fresh_count += 1
+
+                # 详情缓存中operateTime一致的项目直接复用缓存
+                project_id = project['id']
+                if self.detail_cache is not None and operate_time:
+                    detail_data = self.cached_detail(project_id, operate_time)
+                    if detail_data is not None:
+                        self.crawler.stats.inc_value('detail_cache/hit')
+                        yield from self.replay_detail(detail_data, project)
+                        continue
+                    self.crawler.stats.inc_value('detail_cache/miss')
+
+                # 请求详情页
+                detail_url = self.detail_api.format(project_id)
+
+                yield scrapy.Request(
+                    url=detail_url,
+                    headers=self.api_headers(),
+                    callback=self.parse_detail,
+                    errback=self.detail_failed,
+                    meta={'list_data': project, 'handle_httpstatus_list': self.challenge_statuses}
+                )
+
+            # 翻页逻辑：第一页返回总页数后一次性调度其余所有页，由下载槽控制并发
+            current_page = result.get('pageNum', response.meta.get('page_num', 1))
+            total_pages = result.get('pages', 1)
+
+            if self.incremental and self.last_update_time and self.settings.getbool('LIST_ORDERED_BY_OPERATE_TIME', True):
+                # 增量抓取且列表按operateTime倒序：逐页翻，整页都早于水位即停止
                 if current_page < total_pages:
-                    next_page = current_page + 1
-                    body = {
-                        "pageSize": 100,
-                        "pageNum": next_page,
-                        "projectCode": "",
-                        "projectName": "",
-                        "apprOrgno": "",
-                        "execMode": "",
-                        "theIndustry": "",
-                        "planTotalMoneyStart": "",
-                        "planTotalMoneyEnd": ""
-                    }
-                    headers = self.headers.copy()
-                    if self.cookies:
-                        cookie_str = '; '.join([f'{k}={v}' for k, v in self.cookies.items()])
-                        headers['Cookie'] = cookie_str
-
-                    yield scrapy.Request(
-                        url=self.list_api,
-                        method='POST',
-                        headers=headers,
-                        body=json.dumps(body),
-                        callback=self.parse_list,
-                        meta={'page_num': next_page}
-                    )
+                    if fresh_count:
+                        yield self.list_request(current_page + 1)
+                    else:
+                        self.logger.info(f"第 {current_page} 页已全部早于水位，停止翻页")
+            elif current_page == 1 and total_pages > 1:
+                self.logger.info(f"共 {total_pages} 页，并发抓取剩余列表页")
+                for page_num in range(2, total_pages + 1):
+                    yield self.list_request(page_num)
         except Exception as e:
             self.logger.error(f"解析列表页出错: {e}")
 
     def parse_detail(self, response):
         """解析详情页"""
+        if self.is_challenged(response):
+            yield from self.refresh_clearance(response.request)
+            return
+
         try:
-            data = json.loads(response.text)
-            if data['code'] == 'SYS.200':
-                detail_data = data['data']
-                list_data = response.meta['list_data']
-
-                # 创建Item对象
-                item = FranchiseProjectItem()
-
-                # 基本信息（来自列表页）
-                item['project_id'] = list_data.get('id', '')
-                item['project_code'] = list_data.get('projectCode', '')
-                item['project_name'] = list_data.get('projectName', '')
-
-                # 地区信息解析 - 支持多级地区
-                area_info = self.parse_area_info(list_data)
-                item.update(area_info)
-
-                # 项目分类信息
-                item['project_level'] = list_data.get('projectLevel', '')
-                item['project_level_name'] = self.get_code_name('PROJECT_LEVEL', list_data.get('projectLevel', ''))
-                item['industry_code'] = list_data.get('theIndustry', '')
-                item['industry_name'] = list_data.get('theIndustryName', '')
-                item['project_type'] = list_data.get('projectType', '')
-                item['project_type_name'] = list_data.get('projectTypeName', '')
-
-                # 实施模式
-                item['exec_mode'] = list_data.get('execMode', '')
-                item['exec_mode_name'] = list_data.get('execModeName', '')
-
-                # 投资信息 - 转换为数值类型
-                item['total_investment'] = self.safe_decimal(list_data.get('planTotalMoney', 0))
-                item['construction_location'] = self.format_address_list(list_data.get('projectAddressList', []))
-                item['scale_content'] = list_data.get('scaleContent', '')
-
-                # 处理详情页数据
-                ppp_project_vo = detail_data.get('PaEbPppProjectVo', {})
-                if ppp_project_vo:
-                    item['expected_private_capital'] = self.safe_decimal(ppp_project_vo.get('expPriCap', 0))
-                    item['expected_project_capital'] = self.safe_decimal(
-                        ppp_project_vo.get('expectedProjectCapital', 0))
-
-                # 特许经营参数信息
-                argument_info = detail_data.get('PaEbArgumentInfoVo', {})
-                if argument_info:
-                    item['franchise_period'] = self.safe_int(argument_info.get('franDeadline', 0))
-                    item['pre_start_date'] = self.parse_date(argument_info.get('preStartDate', ''))
-                    item['pre_end_date'] = self.parse_date(argument_info.get('preComplDate', ''))
-
-                    # 政府补贴信息 - 转换为布尔值和数值
-                    item['has_gov_subsidy'] = argument_info.get('isGovInvSupport', '0') == '1'
-                    item['gov_invest_type'] = self.get_code_name('GOV_INV_TYPE',
-                                                                 argument_info.get('invSupportType', ''))
-                    item['gov_invest_ratio'] = self.safe_decimal(argument_info.get('preGovInvRatio', 0))
-                    item['gov_representative'] = argument_info.get('govInvReferee', '')
-                    item['gov_share_ratio'] = self.safe_decimal(argument_info.get('govInvRefereeBonus', 0))
-                    item['gov_invest_capital'] = self.safe_decimal(argument_info.get('preGovInvCap', 0))
-
-                    # 运营补贴信息
-                    item['has_operation_subsidy'] = argument_info.get('isOperSubsidy', '0') == '1'
-                    item['subsidy_source'] = argument_info.get('operSubsidySource', '')
-                    item['subsidy_limit'] = self.safe_decimal(argument_info.get('operSubsidyLimit', 0))
-                    item['subsidy_mode'] = argument_info.get('operSubsidyMode', '')
-
-                    # 民营企业参与
-                    item['private_enterprise_plan'] = argument_info.get('privateEntPlan', '')
-                    item['private_share_ratio'] = self.extract_private_ratio(argument_info.get('privateEntPlan', ''))
-
-                # 招投标信息
-                invbids = detail_data.get('InvbidsVo', [])
-                if invbids:
-                    first_bid = invbids[0]
-                    item['bidding_method'] = self.get_code_name('BID_TYPE', first_bid.get('bidType', ''))
-                    item['bidding_time'] = self.parse_date(first_bid.get('pubBidDate', ''))
-
-                # 中标信息
-                winbids = detail_data.get('WinbidsVo', [])
-                if winbids:
-                    winner_names = []
-                    winner_types = []
-                    for win in winbids:
-                        winner_names.append(win.get('winbidEntname', ''))
-                        winner_types.append(self.get_code_name('ENTTYPE', win.get('enttype', '')))
-                    item['winner_nature'] = ','.join(winner_types)
-                    item['winner_names'] = ','.join(winner_names)
-
-                # 项目阶段
-                item['project_stage'] = list_data.get('stageType', '')
-                item['project_stage_name'] = self.get_stage_name(list_data.get('stageType', ''))
-
-                # 审批信息
-                plan_appr_info = detail_data.get('PaDfPlanapprInfoVo', {})
-                if plan_appr_info:
-                    item['approval_org_name'] = plan_appr_info.get('apprOrgName', '')
-                    item['approval_date'] = self.parse_date(plan_appr_info.get('apprDate', ''))
-
-                # 实施机构信息
-                item['implement_org_name'] = list_data.get('enforBodyName', '')
-                item['implement_contact'] = list_data.get('enforBodyLinp', '')
-                item['implement_phone'] = list_data.get('enBodyTel', '')
-
-                # 咨询机构信息
-                item['consult_org_name'] = list_data.get('consOrgName', '')
-                item['consult_contact'] = list_data.get('consOrgPri', '')
-                item['consult_phone'] = list_data.get('consOrgPriTel', '')
-
-                # 法律机构信息
-                item['law_firm_name'] = list_data.get('lawFirmName', '')
-                item['law_firm_contact'] = list_data.get('lawFirmPri', '')
-                item['law_firm_phone'] = list_data.get('lawFirmPriTel', '')
-
-                # 授权政府
-                item['mandate_gov'] = list_data.get('mandateGov', '')
-
-                # 状态信息
-                item['is_published'] = list_data.get('isEnable', '1') == '1'
-                item['verification_code'] = list_data.get('verificationCode', '')
-
-                # 时间戳
-                item['create_time'] = self.parse_datetime(list_data.get('createTime', ''))
-                item['update_time'] = self.parse_datetime(list_data.get('operateTime', ''))
-                item['crawl_time'] = datetime.now()
-
-                # 先yield项目数据
-                yield item
-
-                # 处理附件下载
-                if self.download_attachments:
-                    yield from self.handle_attachments(list_data, detail_data, item['project_id'])
+            data = loads(response.body)
+            list_data = response.meta['list_data']
+            if data['code'] != 'SYS.200':
+                self.crawler.stats.inc_value(f"api_code/detail_api/{data['code']}")
+                if data['code'] in self.settings.getlist('RETRY_PERMANENT_API_CODES'):
+                    # 项目已不存在，重新抓取也不会成功，不阻挡水位
+                    self.logger.warning(f"详情 {list_data['id']} 返回 {data['code']}，跳过")
+                else:
+                    self.record_failed_project(list_data, data['code'])
+                return
+            if self.detail_cache is not None and list_data.get('operateTime'):
+                self.cache_detail(list_data, data['data'])
+            yield from self.build_items(data['data'], list_data)
 
         except Exception as e:
             error_message = f"解析详情页出错: {e}\n{traceback.format_exc()}"
             self.logger.error(error_message)
+            self.record_failed_project(response.meta['list_data'], 'parse error')
+
+    def detail_failed(self, failure):
+        """详情页在下载层重试耗尽后仍失败"""
+        if failure.check(RetryLater):
+            return
+        self.record_failed_project(failure.request.meta['list_data'], repr(failure.value))
 
-    def handle_attachments(self, list_data, detail_data, project_id):
-        """处理附件信息"""
+    def cached_detail(self, project_id, operate_time):
+        """读取详情缓存，读取失败按未命中处理"""
+        try:
+            return self.detail_cache.get(project_id, operate_time)
+        except sqlite3.Error as e:
+            self.crawler.stats.inc_value('detail_cache/error')
+            self.logger.warning(f"详情缓存读取失败 {project_id}: {e}")
+            return None
+
+    def cache_detail(self, list_data, detail_data):
+        """写入详情缓存；写入失败（如缓存文件被其他进程长时间锁住）不影响项目入库"""
+        try:
+            self.detail_cache.put(list_data['id'], list_data['operateTime'], detail_data)
+        except sqlite3.Error as e:
+            self.crawler.stats.inc_value('detail_cache/error')
+            self.logger.warning(f"详情缓存写入失败 {list_data['id']}: {e}")
+
+    def replay_detail(self, detail_data, list_data):
+        """用缓存的详情数据生成item，不请求详情接口"""
+        try:
+            yield from self.build_items(detail_data, list_data)
+        except Exception as e:
+            error_message = f"解析缓存详情出错: {e}\n{traceback.format_exc()}"
+            self.logger.error(error_message)
+            self.record_failed_project(list_data, 'cached detail parse error')
+
+    def build_items(self, detail_data, list_data):
+        """根据列表数据和详情数据生成项目及附件item"""
+        item = FranchiseProjectItem(self.project_mapper.extract(list_data, detail_data))
+        # 地区信息解析 - 支持多级地区
+        item.update(self.parse_area_info(list_data))
+        item['crawl_time'] = datetime.now()
+
+        # 先yield项目数据
+        yield item
+
+        # 处理附件下载
+        if self.download_attachments:
+            yield from self.handle_attachments(list_data, detail_data, item['project_id'], item.get('province_code'))
+
+    def handle_attachments(self, list_data, detail_data, project_id, province_code=None):
+        """处理附件信息，附件带上所属项目的省份代码"""
         attachments = []
 
         # 从列表数据收集附件
@@ -363,36 +705,38 @@ class FranchiseSpider(scrapy.Spider):
             attachment_item = FranchiseAttachmentItem()
             attachment_item['attachment_id'] = attachment['file_id']
             attachment_item['project_id'] = attachment['project_id']
+            attachment_item['province_code'] = province_code
             attachment_item['file_type'] = attachment['file_type']
             attachment_item['file_name'] = attachment['file_name']
             attachment_item['attachment_category'] = attachment['attachment_category']
             attachment_item['download_url'] = f"{self.download_api}?id={attachment['file_id']}&pppId={project_id}"
             attachment_item['is_downloaded'] = False
-            attachment_item['download_time'] = datetime.now()
             yield attachment_item
 
     def parse_area_info(self, list_data):
-        """解析地区信息，支持多级地区"""
+        """解析地区信息，支持多级地区
+
+        projectAddressList 中的全部代码一次性解析为叶子地区的完整名称，写入建设地点；
+        省/市/区县字段只在所有地区都属于同一省/市/区县时填写，跨区县项目不会被归到第一个区县。
+        """
         area_info = {}
 
-        # 从projectAddressList解析地区代码
-        address_list = list_data.get('projectAddressList', [])
-        if address_list:
-            # 假设地区代码是6位数字，前2位省份，前4位城市，6位区县
-            first_area = address_list[0]
-            if len(first_area) >= 2:
-                province_code = first_area[:2] + '0000'
-                area_info['province_code'] = province_code
-                area_info['province_name'] = list_data.get('sname1', '')
-
-            if len(first_area) >= 4:
-                city_code = first_area[:4] + '00'
-                area_info['city_code'] = city_code
-                area_info['city_name'] = list_data.get('sname2', '')
-
-            if len(first_area) == 6:
-                area_info['county_code'] = first_area
-                area_info['county_name'] = list_data.get('sname', '')
+        address_list = list_data.get('projectAddressList') or []
+        address_names = (list_data.get('projectAddressName') or '').split(',')
+        leaves = get_index().resolve_many(address_list, address_names)
+        area_info['construction_location'] = ','.join([' '.join(filter(None, path)) for _, path in leaves])
+
+        if leaves:
+            levels, path = leaves[0]
+            for level, field in enumerate(('province', 'city', 'county')):
+                code = levels[level]
+                if code is None:
+                    # 直辖市的区、省直辖县没有市一级
+                    continue
+                if len(leaves) > 1 and any(other[level] != code for other, _ in leaves):
+                    break
+                area_info[f'{field}_code'] = code
+                area_info[f'{field}_name'] = path[level]
 
         # 审批机关信息
         area_info['area_code'] = list_data.get('apprOrgno', '')
@@ -400,21 +744,14 @@ class FranchiseSpider(scrapy.Spider):
 
         return area_info
 
-    def format_address_list(self, address_list):
-        """格式化地址列表"""
-        if not address_list:
-            return ''
-        # 这里可以根据地区代码转换为地区名称
-        return ','.join(address_list)
-
     def safe_decimal(self, value):
         """安全转换为decimal类型"""
         try:
             if value is None or value == '':
-                return 0.0
-            return float(value)
-        except (ValueError, TypeError):
-            return 0.0
+                return Decimal(0)
+            return Decimal(str(value))
+        except (ValueError, TypeError, ArithmeticError):
+            return Decimal(0)
 
     def safe_int(self, value):
         """安全转换为int类型"""
@@ -429,6 +766,14 @@ class FranchiseSpider(scrapy.Spider):
         """解析日期字符串"""
         if not date_str:
             return None
+        try:
+            # 接口返回的标准格式直接用 fromisoformat 解析，比 strptime 快一个数量级
+            if len(date_str) == 10 and date_str[4] == '-' and date_str[7] == '-':
+                return date.fromisoformat(date_str)
+            if len(date_str) == 19 and date_str[10] == ' ':
+                return datetime.fromisoformat(date_str).date()
+        except ValueError:
+            pass
         try:
             # 尝试多种日期格式
             for fmt in ['%Y-%m-%d', '%Y-%m', '%Y-%m-%d %H:%M:%S']:
@@ -445,6 +790,8 @@ class FranchiseSpider(scrapy.Spider):
         if not datetime_str:
             return None
         try:
+            if len(datetime_str) == 19 and datetime_str[10] == ' ' and datetime_str[4] == '-':
+                return datetime.fromisoformat(datetime_str)
             return datetime.strptime(datetime_str, '%Y-%m-%d %H:%M:%S')
         except Exception:
             return None
@@ -452,76 +799,25 @@ class FranchiseSpider(scrapy.Spider):
     def extract_private_ratio(self, text):
         """从文本中提取民企持股比例"""
         if not text:
-            return 0.0
+            return Decimal(0)
 
         # 尝试匹配百分比
         pattern = r'(\d+(?:\.\d+)?)[%％]'
         match = re.search(pattern, text)
         if match:
-            return float(match.group(1))
-        return 0.0
-
-    def get_code_name(self, code_type, code_value):
-        """根据code_type和code_value获取对应的名称"""
-        if not code_value:
-            return ''
-
-        code_mapping = {
-            "PROJECT_LEVEL": {
-                "A00001": "国家级",
-                "A00002": "省级",
-                "A00003": "市级",
-                "A00004": "县级",
-                "A00099": "其他"
-            },
-            "GOV_INV_TYPE": {
-                "A00001": "无",
-                "A00002": "直接投资",
-                "A00003": "资本金注入",
-                "A00004": "投资补助",
-                "A00005": "贷款贴息"
-            },
-            "PROJECT_TYPE": {
-                "A00001": "新建项目",
-                "A00002": "改扩建项目",
-                "A00003": "不涉及新建、改扩建的存量项目"
-            },
-            "ENTTYPE": {
-                "A00001": "民营企业",
-                "A00002": "外商投资企业",
-                "A00003": "中央企业",
-                "A00004": "项目所在地省级国有企业",
-                "A00005": "项目所在地市级国有企业",
-                "A00006": "项目所在地县级国有企业",
-                "A00007": "非项目所在地其他国有企业",
-                "A00099": "其他"
-            },
-            "EXEC_MODE": {
-                "A00001": "BOT",
-                "A00002": "TOT",
-                "A00003": "ROT",
-                "A00004": "BOOT",
-                "A00005": "DBFOT",
-                "A00006": "BOO",
-                "A00099": "其他"
-            },
-            "BID_TYPE": {
-                "A00001": "公开招标",
-                "A00099": "其他公开竞争方式"
-            }
-        }
+            return Decimal(match.group(1))
+        return Decimal(0)
+
+    def code_converter(self, code_type):
+        """生成映射规则中 code:TYPE 使用的转换器"""
+        mapping = self.code_tables.get(code_type, {})
 
-        mapping = code_mapping.get(code_type, {})
-        return mapping.get(code_value, code_value)
+        def convert(code_value):
+            if not code_value:
+                return ''
+            return mapping.get(code_value, code_value)
+        return convert
 
     def get_stage_name(self, stage_code):
         """获取项目阶段名称"""
-        stage_map = {
-            '01': '特许经营方案编制阶段',
-            '02': '特许经营方案论证阶段',
-            '03': '特许经营者选择阶段',
-            '04': '特许经营协议签订阶段',
-            '05': '特许经营项目建设或运营阶段',
-            '06': '特许经营项目移交阶段'
-        }
-        return stage_map.get(stage_code, stage_code)
\ No newline at end of file
+        return self.stage_names.get(stage_code, stage_code)
@@ -0,0 +1,134 @@
+"""数据库存储后端
+
+DatabasePipeline 通过后端创建引擎和执行批量upsert，表结构统一使用 model.py，后端可替换：
+
+- MySQLBackend：网络MySQL服务器，多行 ``INSERT ... ON DUPLICATE KEY UPDATE``
+- SQLiteBackend：嵌入式SQLite文件，WAL日志模式，批次在一个事务中 executemany ``INSERT ... ON CONFLICT DO UPDATE``。
+  SQLite同一时间只允许一个写事务，写入线程数限制为1，单机运行和测试无需MySQL服务
+
+由 ``DB_BACKEND`` 选择，``DATABASE['url']`` 为 ``sqlite:///`` 时总是使用SQLite后端。
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from model import create_db_engine
+
+BACKENDS = ('mysql', 'sqlite')
+
+
+def _group_by_columns(rows):
+    """同一条多行INSERT要求列一致，按字段集合分组"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+
+class MySQLBackend:
+    """MySQL存储后端"""
+
+    name = 'mysql'
+    # 写入线程数上限，None 表示不限制
+    max_writers = None
+
+    def __init__(self, db_settings):
+        self.db_settings = db_settings
+
+    def create_engine(self):
+        return create_db_engine(
+            self.db_settings,
+            pool_size=10,
+            max_overflow=20,
+            pool_pre_ping=True,
+            pool_recycle=3600
+        )
+
+    def upsert(self, conn, model, key, rows):
+        """多行 INSERT ... ON DUPLICATE KEY UPDATE"""
+        for columns, group in _group_by_columns(rows).items():
+            stmt = mysql_insert(model.__table__).values(group)
+            stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in columns if c != key})
+            conn.execute(stmt)
+
+    def accumulate(self, conn, model, keys, rows):
+        """多行 INSERT ... ON DUPLICATE KEY UPDATE c = c + VALUES(c)，累加 keys 以外的列"""
+        table = model.__table__
+        stmt = mysql_insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update({c: table.c[c] + stmt.inserted[c] for c in rows[0] if c not in keys})
+        conn.execute(stmt)
+
+
+class SQLiteBackend:
+    """SQLite存储后端"""
+
+    name = 'sqlite'
+    max_writers = 1
+
+    # WAL下读写互不阻塞；synchronous=NORMAL 只在检查点时fsync，断电最多丢失最近的事务，不会损坏数据库
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA busy_timeout=30000',
+    )
+
+    def __init__(self, url):
+        self.url = url
+
+    @classmethod
+    def from_path(cls, path):
+        return cls(f'sqlite:///{path}')
+
+    def create_engine(self):
+        path = self.url[len('sqlite:///'):]
+        if path and path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        engine = create_db_engine({'url': self.url})
+        event.listen(engine, 'connect', self._configure)
+        return engine
+
+    def _configure(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in self.PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+    def upsert(self, conn, model, key, rows):
+        """INSERT ... ON CONFLICT(key) DO UPDATE，每组列一条语句 executemany
+
+        嵌入式数据库没有网络往返，多行VALUES省不下什么，反而每批都要重新编译SQL；
+        单行语句可以被SQLAlchemy缓存，由sqlite3的executemany在同一事务中逐行执行。
+        """
+        for columns, group in _group_by_columns(rows).items():
+            stmt = sqlite_insert(model.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[key], set_={c: stmt.excluded[c] for c in columns if c != key})
+            conn.execute(stmt, group)
+
+    def accumulate(self, conn, model, keys, rows):
+        """INSERT ... ON CONFLICT(keys) DO UPDATE SET c = c + excluded.c，累加 keys 以外的列"""
+        table = model.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys), set_={c: table.c[c] + stmt.excluded[c] for c in rows[0] if c not in keys})
+        conn.execute(stmt, rows)
+
+
+def backend_for(db_settings):
+    """按 DATABASE 配置选择后端：sqlite:/// URL 使用SQLite，其余使用MySQL"""
+    if (db_settings.get('url') or '').startswith('sqlite'):
+        return SQLiteBackend(db_settings['url'])
+    return MySQLBackend(db_settings)
+
+
+def storage_backend(settings, spider_name):
+    """按设置创建存储后端"""
+    db_settings = settings.getdict('DATABASE')
+    name = settings.get('DB_BACKEND', 'mysql')
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported DB_BACKEND: {name}")
+    if name == 'sqlite' and not db_settings.get('url'):
+        return SQLiteBackend.from_path(settings.get('SQLITE_PATH', './tmp/{}/ppp.sqlite3').format(spider_name))
+    return backend_for(db_settings)
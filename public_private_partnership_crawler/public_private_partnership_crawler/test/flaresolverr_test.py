@@ -0,0 +1,244 @@
+"""FlareSolverrMiddleware 的会话复用、清除cookie缓存、刷新锁和关闭时销毁会话
+
+FlareSolverr由本地的假服务代替（记录收到的命令）；engine.download 换成直接向假服务发POST，
+其余都是中间件自身的代码。测试在asyncio reactor的事件循环上运行协程，不启动reactor。
+
+在包目录下执行:
+    python -m pytest test/flaresolverr_test.py
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PKG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [PKG_DIR, os.path.dirname(PKG_DIR)]
+
+from scrapy.utils.reactor import install_reactor, is_reactor_installed
+
+if not is_reactor_installed():
+    install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+
+import pytest
+import requests
+import scrapy
+from scrapy.http import TextResponse
+from twisted.internet import defer
+
+from public_private_partnership_crawler.clearance import ClearanceCache
+from public_private_partnership_crawler.middlewares import FlareSolverrMiddleware
+
+
+class FakeFlareSolverr:
+    """记录收到的命令；request.get 返回带 cf_clearance 的解，cookie有效期 ttl 秒"""
+
+    def __init__(self, ttl=3600):
+        self.ttl = ttl
+        self.commands = []
+        self.solves = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def names(self):
+        return [command['cmd'] for command in self.commands]
+
+    def respond(self, payload):
+        self.commands.append(payload)
+        if payload['cmd'] in ('sessions.create', 'sessions.destroy'):
+            return {'status': 'ok', 'session': payload.get('session')}
+        self.solves += 1
+        return {'status': 'ok', 'solution': {
+            'url': payload['url'], 'status': 200, 'response': '<html></html>',
+            'userAgent': 'FakeBrowser/1.0',
+            'cookies': [{'name': 'cf_clearance', 'value': f'solved-{self.solves}',
+                         'expires': time.time() + self.ttl}],
+        }}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                body = json.dumps(fake.respond(payload)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def download(request):
+    """代替 engine.download：在线程中把请求直接发给假服务"""
+    def post():
+        response = requests.post(request.url, data=request.body, headers={'Content-Type': 'application/json'},
+                                 timeout=10)
+        return TextResponse(url=request.url, body=response.content, encoding='utf-8', request=request)
+
+    return defer.Deferred.fromFuture(asyncio.ensure_future(asyncio.to_thread(post)))
+
+
+def run(awaitable):
+    return asyncio.get_event_loop().run_until_complete(awaitable)
+
+
+@pytest.fixture
+def flaresolverr():
+    fake = FakeFlareSolverr()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def spider():
+    return scrapy.Spider(name='test_spider')
+
+
+@pytest.fixture
+def make_middleware(flaresolverr, tmp_path):
+    def make(cache=True, **kwargs):
+        crawler = types.SimpleNamespace(engine=types.SimpleNamespace(download=download))
+        cache_path = str(tmp_path / '{}' / 'clearance.json') if cache else None
+        return FlareSolverrMiddleware(crawler, flaresolverr.url, max_timeout=5000, cache_path=cache_path, **kwargs)
+    return make
+
+
+def clearance_request(**meta):
+    return scrapy.Request('https://example.com/', meta={'use_flaresolverr': True, 'clearance_cache': True, **meta})
+
+
+def test_plain_requests_are_not_solved(make_middleware, flaresolverr, spider):
+    assert run(make_middleware().process_request(scrapy.Request('https://example.com/'), spider)) is None
+    assert flaresolverr.commands == []
+
+
+def test_session_created_once_and_reused(make_middleware, flaresolverr, spider):
+    middleware = make_middleware(cache=False)
+    request = scrapy.Request('https://example.com/', meta={'use_flaresolverr': True})
+
+    async def solve_three():
+        return await asyncio.gather(*[middleware.process_request(request, spider) for _ in range(3)])
+
+    responses = run(solve_three())
+
+    assert flaresolverr.names() == ['sessions.create'] + ['request.get'] * 3
+    session = flaresolverr.commands[0]['session']
+    assert session == middleware.session_id
+    assert all(command['session'] == session for command in flaresolverr.commands[1:])
+    assert all(response.user_agent == 'FakeBrowser/1.0' for response in responses)
+
+
+def test_cache_hit_skips_flaresolverr(make_middleware, flaresolverr, spider, tmp_path):
+    first = run(make_middleware().process_request(clearance_request(), spider))
+    assert first.cookies == {'cf_clearance': 'solved-1'}
+    entry = ClearanceCache(str(tmp_path / spider.name / 'clearance.json')).load()
+    assert entry['cookies'] == first.cookies and entry['user_agent'] == 'FakeBrowser/1.0'
+
+    # 下一次运行（新的中间件实例）直接读取缓存
+    second = run(make_middleware().process_request(clearance_request(), spider))
+    assert second.cookies == first.cookies
+    assert second.user_agent == 'FakeBrowser/1.0'
+    assert flaresolverr.solves == 1
+
+
+def test_expired_cache_is_refreshed(make_middleware, flaresolverr, spider, tmp_path):
+    cache = ClearanceCache(str(tmp_path / spider.name / 'clearance.json'))
+    cache.save({'cf_clearance': 'old'}, 'OldBrowser/1.0', expires=time.time() - 1)
+
+    response = run(make_middleware().process_request(clearance_request(), spider))
+
+    assert response.cookies == {'cf_clearance': 'solved-1'}
+    assert cache.load()['cookies'] == {'cf_clearance': 'solved-1'}
+    assert flaresolverr.solves == 1
+
+
+def test_stale_cookies_invalidate_cache(make_middleware, flaresolverr, spider, tmp_path):
+    cache = ClearanceCache(str(tmp_path / spider.name / 'clearance.json'))
+    cache.save({'cf_clearance': 'rejected'}, 'OldBrowser/1.0')
+
+    response = run(make_middleware().process_request(
+        clearance_request(stale_cookies={'cf_clearance': 'rejected'}), spider))
+
+    assert response.cookies == {'cf_clearance': 'solved-1'}
+    assert flaresolverr.solves == 1
+
+
+def test_concurrent_refreshes_share_one_solve(make_middleware, flaresolverr, spider):
+    middleware = make_middleware()
+
+    async def refresh_twice():
+        return await asyncio.gather(middleware.process_request(clearance_request(), spider),
+                                    middleware.process_request(clearance_request(), spider))
+
+    first, second = run(refresh_twice())
+
+    assert first.cookies == second.cookies == {'cf_clearance': 'solved-1'}
+    assert flaresolverr.solves == 1
+
+
+def test_waits_for_refresh_by_another_process(make_middleware, flaresolverr, spider, tmp_path):
+    path = str(tmp_path / spider.name / 'clearance.json')
+    other = ClearanceCache(path)
+    assert other.try_lock()
+
+    def finish_refresh():
+        time.sleep(0.5)
+        other.save({'cf_clearance': 'from-other-process'}, 'OtherBrowser/1.0')
+        other.unlock()
+
+    threading.Thread(target=finish_refresh).start()
+    response = run(make_middleware().process_request(clearance_request(), spider))
+
+    assert response.cookies == {'cf_clearance': 'from-other-process'}
+    assert flaresolverr.commands == []
+    assert not os.path.exists(path + '.lock')
+
+
+def test_lock_released_after_failed_solve(make_middleware, flaresolverr, spider, tmp_path):
+    flaresolverr.respond = lambda payload: {'status': 'error', 'message': 'challenge not solved'}
+
+    with pytest.raises(scrapy.exceptions.IgnoreRequest):
+        run(make_middleware().process_request(clearance_request(), spider))
+
+    assert not os.path.exists(str(tmp_path / spider.name / 'clearance.json.lock'))
+
+
+def test_spider_closed_destroys_session(make_middleware, flaresolverr, spider):
+    from twisted.internet import reactor
+
+    middleware = make_middleware(cache=False)
+    run(middleware.process_request(scrapy.Request('https://example.com/', meta={'use_flaresolverr': True}), spider))
+    # reactor未运行，deferToThread 使用的线程池需要手动启动
+    pool = reactor.getThreadPool()
+    pool.start()
+    try:
+        run(middleware.spider_closed(spider).asFuture(asyncio.get_event_loop()))
+    finally:
+        pool.stop()
+
+    assert flaresolverr.names()[-1] == 'sessions.destroy'
+    assert flaresolverr.commands[-1]['session'] == middleware.session_id
+
+
+def test_spider_closed_without_session(make_middleware, flaresolverr, spider):
+    assert make_middleware().spider_closed(spider) is None
+    assert flaresolverr.commands == []